@@ -0,0 +1,116 @@
+# Casillas posibles de 6 jugadores con cada dado: 36 consultas a
+# posiciones_posibles_a_mover contra alcanzables_por_jugador, que busca el
+# tablero una sola vez. Con --base se mide lo mismo en otro commit (por ejemplo
+# el inicial, que busca cada consulta en las matrices de los csv) en un
+# worktree aparte. Correr desde la raiz del repositorio:
+#   python -m benchmarks.alcanzables --base $(git rev-list --max-parents=0 HEAD)
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import timeit
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+JUGADORES = 6
+
+CONSULTAS = 1000
+
+# las casillas del tablero clasico
+CASILLAS = range(1, 85)
+
+
+def medir_arbol():
+    # corre en un proceso aparte con el arbol a medir en PYTHONPATH y como
+    # directorio actual (el commit inicial lee los csv desde ahi)
+    from services import board_functions
+
+    def con_bucle(posiciones):
+        return [
+            [
+                board_functions.posiciones_posibles_a_mover(posicion, dado)
+                for dado in range(1, 7)
+            ]
+            for posicion in posiciones
+        ]
+
+    variantes = {"bucle": con_bucle}
+    if hasattr(board_functions, "alcanzables_por_jugador"):
+        variantes["una busqueda"] = board_functions.alcanzables_por_jugador
+    azar = random.Random(0)
+    consultas = [azar.sample(CASILLAS, JUGADORES) for _ in range(CONSULTAS)]
+    resultados = {}
+    for nombre, calcular in variantes.items():
+        # la primera pasada arma las tablas y da la respuesta para comparar.
+        # Desde una trampa el commit inicial repite casillas, se comparan sin
+        # repetidos
+        respuestas = [
+            [[sorted(set(casillas)) for casillas in dados] for dados in alcanzables]
+            for alcanzables in map(calcular, consultas)
+        ]
+        segundos = min(
+            timeit.repeat(
+                lambda: [calcular(posiciones) for posiciones in consultas],
+                number=1,
+                repeat=5,
+            )
+        )
+        resultados[nombre] = {
+            "us": segundos / CONSULTAS * 1e6,
+            "respuestas": hashlib.sha1(json.dumps(respuestas).encode()).hexdigest(),
+        }
+    return resultados
+
+
+def medir_en(arbol):
+    salida = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--medir"],
+        cwd=arbol,
+        env=dict(os.environ, PYTHONPATH=arbol),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(salida.stdout.splitlines()[-1])
+
+
+def main(base=None):
+    arboles = {"actual": RAIZ}
+    worktree = None
+    if base is not None:
+        worktree = tempfile.mkdtemp()
+        subprocess.run(
+            ["git", "-C", RAIZ, "worktree", "add", "--detach", worktree, base],
+            check=True,
+            capture_output=True,
+        )
+        arboles = {base[:10]: worktree, **arboles}
+    try:
+        respuestas = set()
+        for nombre, arbol in arboles.items():
+            for variante, medida in medir_en(arbol).items():
+                respuestas.add(medida["respuestas"])
+                print(
+                    f"{nombre:>10}, {variante:>12}: {medida['us']:7.2f} us por "
+                    f"{JUGADORES} jugadores x 6 dados"
+                )
+        # todas las variantes tienen que dar las mismas casillas
+        assert len(respuestas) == 1
+    finally:
+        if worktree is not None:
+            subprocess.run(
+                ["git", "-C", RAIZ, "worktree", "remove", "--force", worktree],
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--medir"]:
+        print(json.dumps(medir_arbol()))
+    elif sys.argv[1:2] == ["--base"]:
+        main(sys.argv[2])
+    else:
+        main()
@@ -0,0 +1,62 @@
+# Tiempo de importar el tablero en un proceso nuevo: como era antes (siete csv
+# con np.genfromtxt) y con el artefacto compilado que se carga con el primer
+# uso. Los procesos corren en otro directorio para mostrar que ya no depende
+# del directorio actual. Correr desde la raiz del repositorio:
+#   python -m benchmarks.arranque
+import compileall
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(RAIZ, "tests", "fixtures")
+
+MEDIR = """
+import time
+import numpy as np
+inicio = time.perf_counter()
+{codigo}
+print(time.perf_counter() - inicio)
+"""
+
+VARIANTES = {
+    "siete csv (antes)": f"""
+for archivo in ["tablero.csv"] + [f"{{n}}mov.csv" for n in range(1, 7)]:
+    np.genfromtxt({FIXTURES!r} + "/" + archivo, delimiter=",")
+""",
+    "import board.board": "import board.board",
+    "import + primer uso": """
+from services.board_functions import casillas_posibles
+casillas_posibles(1, 6)
+""",
+}
+
+
+def medir(codigo, veces=10):
+    entorno = dict(os.environ, PYTHONPATH=RAIZ)
+    tiempos = []
+    for _ in range(veces):
+        salida = subprocess.run(
+            [sys.executable, "-c", MEDIR.format(codigo=codigo)],
+            cwd=tempfile.gettempdir(),
+            env=entorno,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        tiempos.append(float(salida.stdout))
+    return statistics.median(tiempos)
+
+
+def main():
+    # con PYTHONDONTWRITEBYTECODE un .pyc viejo haria medir la compilacion
+    for paquete in ("board", "services"):
+        compileall.compile_dir(os.path.join(RAIZ, paquete), quiet=1)
+    for nombre, codigo in VARIANTES.items():
+        print(f"{nombre:>20}: {medir(codigo) * 1e3:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
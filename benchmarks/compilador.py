@@ -0,0 +1,34 @@
+# Tiempo de compilar el tablero con el metodo anterior (lista de aristas,
+# recorrido de los 85x85 pares y potencias de np.matrix) y con el compilador
+# de board/scripts.py. Correr desde la raiz del repositorio:
+#   python -m benchmarks.compilador
+import timeit
+
+import numpy as np
+
+from board.board import CASILLAS, CLASICO
+from board.scripts import compilar_definicion, generar_aristas_movimiento
+
+
+def compilar_con_matrices():
+    tablero = np.array(CLASICO["tablero"])
+    aristas = list(generar_aristas_movimiento(tablero, CASILLAS, CLASICO["pasadizos"]))
+    matriz = np.matrix(np.zeros((85, 85)))
+    for i in range(85):
+        for j in range(85):
+            if (i, j) in aristas or (j, i) in aristas:
+                matriz[i, j] = 1
+    return {n: matriz**n for n in range(1, 7)}
+
+
+def main():
+    for nombre, compilar in (
+        ("lista y np.matrix ** n", compilar_con_matrices),
+        ("set de aristas y BFS", lambda: compilar_definicion(CLASICO)),
+    ):
+        segundos = min(timeit.repeat(compilar, number=1, repeat=5))
+        print(f"{nombre:>22}: {segundos * 1e3:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# Compara un commit por jugada contra el escritor agrupado de datos.py.
+# Correr desde la raiz del repositorio: python -m benchmarks.escritura
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# la base de datos de la prueba va a un directorio temporal. pony toma las
+# rutas relativas desde models.py, cambiar de directorio no alcanza
+os.environ["RUTA_DB"] = os.path.join(tempfile.mkdtemp(), "escritura.sqlite")
+
+import pony.orm as pony  # noqa: E402
+
+from datos import ejecutar_db, escribir_db  # noqa: E402
+from models import db  # noqa: E402
+
+pony.set_sql_debug(False)
+
+JUGADAS = 2000
+
+
+def crear_jugadores(cantidad):
+    jugadores = [db.Jugador(apodo=f"bench {i}") for i in range(cantidad)]
+    pony.flush()
+    return [j.id_jugador for j in jugadores]
+
+
+def mover(id_jugador, posicion):
+    db.Jugador[id_jugador].posicion = posicion
+
+
+async def medir(ejecutar, ids):
+    commits = 0
+    original = db.provider.commit
+
+    def contar_commit(*args, **kwargs):
+        nonlocal commits
+        commits += 1
+        return original(*args, **kwargs)
+
+    db.provider.commit = contar_commit
+    inicio = time.perf_counter()
+    try:
+        await asyncio.gather(
+            *(ejecutar(mover, ids[i % len(ids)], i % 84 + 1) for i in range(JUGADAS))
+        )
+    finally:
+        db.provider.commit = original
+    return time.perf_counter() - inicio, commits
+
+
+async def main():
+    ids = await ejecutar_db(crear_jugadores, 50)
+    for nombre, ejecutar in (
+        ("un commit por jugada", ejecutar_db),
+        ("escritor agrupado", escribir_db),
+    ):
+        segundos, commits = await medir(ejecutar, ids)
+        print(
+            f"{nombre:>22}: {JUGADAS / segundos:8.0f} jugadas/s, "
+            f"{commits:5d} commits"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
+    sys.exit(0)
@@ -0,0 +1,126 @@
+# Latencia de iniciar 1000 partidas de 6 jugadores: con los pasos de antes
+# (un db_session por paso) contra estado_inicial y una sola escritura. Correr
+# desde la raiz del repositorio:
+#   python -m benchmarks.inicio
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+# la base de datos de la prueba va a un directorio temporal. pony toma las
+# rutas relativas desde models.py, cambiar de directorio no alcanza
+os.environ["RUTA_DB"] = os.path.join(tempfile.mkdtemp(), "inicio.sqlite")
+
+import pony.orm as pony  # noqa: E402
+
+from board.board import BIT_CARTA, CARTAS, COLORES, PUERTAS  # noqa: E402
+from board.board import mascara_cartas  # noqa: E402
+from models import db  # noqa: E402
+from services.start_game import estado_inicial, iniciar_partida_service  # noqa: E402
+
+pony.set_sql_debug(False)
+
+PARTIDAS = 1000
+
+JUGADORES = 6
+
+
+@pony.db_session()
+def asignar_orden_aleatorio(partida):
+    jugadores = partida.jugadores
+    random.shuffle(list(jugadores))
+    for i, jugador in enumerate(jugadores, start=1):
+        jugador.orden_turno = i
+        if i == 1:
+            jugador.estado_turno = "D"
+
+
+@pony.db_session()
+def asignar_posiciones_iniciales(partida):
+    jugadores = partida.jugadores
+    random.shuffle(list(jugadores))
+    for jugador in jugadores:
+        jugador.posicion = random.choice(PUERTAS)
+
+
+@pony.db_session()
+def asignar_colores(partida):
+    jugadores = partida.jugadores
+    random.shuffle(list(jugadores))
+    for i, jugador in enumerate(jugadores):
+        jugador.color = COLORES[i]
+
+
+@pony.db_session()
+def generar_sobre(partida):
+    sobre = 0
+    for tipo in ("R", "V", "M"):
+        nombre, _ = random.choice([c for c in CARTAS if c[1] == tipo])
+        sobre |= BIT_CARTA[nombre]
+    partida.mascara_sobre = sobre
+
+
+@pony.db_session()
+def distribuir_cartas(partida):
+    cartas = [
+        nombre for nombre, _ in CARTAS if not partida.mascara_sobre & BIT_CARTA[nombre]
+    ]
+    random.shuffle(cartas)
+    grupos_cartas = np.array_split(cartas, partida.cantidad_jugadores())
+    for jugador in partida.jugadores:
+        jugador.mano = mascara_cartas(grupos_cartas[jugador.orden_turno - 1])
+
+
+@pony.db_session()
+def con_pasos(partida):
+    partida.iniciada = True
+    asignar_orden_aleatorio(partida)
+    asignar_posiciones_iniciales(partida)
+    asignar_colores(partida)
+    generar_sobre(partida)
+    distribuir_cartas(partida)
+
+
+def crear_partidas():
+    with pony.db_session:
+        ids = []
+        for _ in range(PARTIDAS):
+            jugadores = [db.Jugador(apodo="bench") for _ in range(JUGADORES)]
+            pony.flush()
+            partida = db.Partida(nombre="bench", creador=jugadores[0])
+            for jugador in jugadores:
+                jugador.asociar_a_partida(partida)
+            pony.flush()
+            ids.append(partida.id_partida)
+    return ids
+
+
+def iniciar(iniciar_partida, ids):
+    # cada inicio es su propia transaccion, como en el lobby
+    inicio = time.perf_counter()
+    for id_partida in ids:
+        with pony.db_session:
+            iniciar_partida(db.Partida[id_partida])
+    return time.perf_counter() - inicio
+
+
+def main():
+    azar = random.Random(0)
+    inicio = time.perf_counter()
+    for _ in range(PARTIDAS):
+        estado_inicial(JUGADORES, PUERTAS, azar)
+    segundos = time.perf_counter() - inicio
+    print(f"{'estado_inicial':>24}: {segundos / PARTIDAS * 1e6:8.1f} us por partida")
+    variantes = {
+        "pasos con db_session": con_pasos,
+        "iniciar_partida_service": iniciar_partida_service,
+    }
+    for nombre, iniciar_partida in variantes.items():
+        segundos = iniciar(iniciar_partida, crear_partidas())
+        print(f"{nombre:>24}: {segundos / PARTIDAS * 1e6:8.1f} us por partida")
+
+
+if __name__ == "__main__":
+    main()
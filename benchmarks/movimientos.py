@@ -0,0 +1,73 @@
+# Latencia de calcular las casillas posibles y validar un movimiento, con las
+# matrices de caminos originales, con la tabla de distancias y con la tabla
+# de movimientos precalculada. Correr desde la raiz del repositorio:
+#   python -m benchmarks.movimientos
+import os
+import timeit
+
+import numpy as np
+
+from board.board import DISTANCIAS, TRAMPAS
+from services.board_functions import casillas_posibles, es_movimiento_valido
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures")
+
+MOVIMIENTOS = {
+    n: np.genfromtxt(os.path.join(FIXTURES, f"{n}mov.csv"), delimiter=",")
+    for n in range(1, 7)
+}
+
+CASOS = [(posicion, dado) for posicion in range(1, 85) for dado in range(1, 7)]
+
+
+def con_matrices(posicion_inicial, numero_dado):
+    posiciones_posibles = []
+    matriz_movimientos = MOVIMIENTOS[numero_dado]
+    if posicion_inicial in TRAMPAS:
+        for posicion in TRAMPAS:
+            for i in np.where(matriz_movimientos[:, posicion] > 0)[0]:
+                posiciones_posibles.append(int(i))
+    else:
+        for i in np.where(matriz_movimientos[:, posicion_inicial] > 0)[0]:
+            posiciones_posibles.append(int(i))
+    return sorted(posiciones_posibles)
+
+
+def con_distancias(posicion_inicial, numero_dado):
+    origenes = TRAMPAS if posicion_inicial in TRAMPAS else [posicion_inicial]
+    alcanzables = (DISTANCIAS[origenes] <= numero_dado).any(axis=0)
+    return np.flatnonzero(alcanzables).tolist()
+
+
+def turno(calcular, validar):
+    # tirar_dado calcula las casillas y mover_jugador valida la elegida
+    for posicion, dado in CASOS:
+        casillas = calcular(posicion, dado)
+        validar(posicion, dado, casillas[-1])
+
+
+def main():
+    variantes = {
+        "matrices 1mov..6mov": (
+            con_matrices,
+            lambda p, d, n: n in con_matrices(p, d),
+        ),
+        "tabla de distancias": (
+            con_distancias,
+            lambda p, d, n: n in con_distancias(p, d),
+        ),
+        "tabla de movimientos": (casillas_posibles, es_movimiento_valido),
+    }
+    for nombre, (calcular, validar) in variantes.items():
+        repeticiones = 20
+        segundos = min(
+            timeit.repeat(
+                lambda: turno(calcular, validar), number=repeticiones, repeat=5
+            )
+        )
+        por_turno = segundos / (repeticiones * len(CASOS)) * 1e6
+        print(f"{nombre:>21}: {por_turno:7.2f} us por tirada + movimiento")
+
+
+if __name__ == "__main__":
+    main()
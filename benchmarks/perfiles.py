@@ -0,0 +1,89 @@
+# Juega partidas simuladas por el camino de la base de datos con cada perfil
+# de almacenamiento. Cada perfil corre en su propio proceso porque models se
+# conecta al importarse. Correr desde la raiz del repositorio:
+#   python -m benchmarks.perfiles
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PARTIDAS = 8
+TURNOS = 150
+
+
+def medir_perfil():
+    from datos import escribir_db, leer_db
+    from models import db, get_partida
+    from services.acciones import procesar_entrada
+
+    def crear_partida(numero):
+        jugadores = [db.Jugador(apodo=f"bench {numero} {i}") for i in range(6)]
+        db.flush()
+        partida = db.Partida(nombre=f"bench {numero}", creador=jugadores[0])
+        for jugador in jugadores:
+            jugador.asociar_a_partida(partida)
+        db.flush()
+        return partida.id_partida, jugadores[0].id_jugador
+
+    def jugador_en_turno(id_partida):
+        partida = get_partida(id_partida)
+        for jugador in partida.jugadores:
+            if jugador.orden_turno == partida.jugador_en_turno:
+                return jugador.id_jugador
+
+    def accion(action, data=None):
+        return {"action": action, "data": data or {}}
+
+    async def jugar(numero):
+        id_partida, id_creador = await escribir_db(crear_partida, numero)
+        await escribir_db(procesar_entrada, id_creador, accion("iniciar_partida"))
+        for _ in range(TURNOS):
+            id_jugador = await leer_db(jugador_en_turno, id_partida)
+            respuesta, _ = await escribir_db(
+                procesar_entrada, id_jugador, accion("tirar_dado")
+            )
+            casillas = respuesta["personal_message"]["data"]["casillas_a_mover"]
+            await escribir_db(
+                procesar_entrada,
+                id_jugador,
+                accion("mover_jugador", {"nueva_posicion": casillas[0]}),
+            )
+            await escribir_db(procesar_entrada, id_jugador, accion("terminar_turno"))
+
+    async def todas():
+        await asyncio.gather(*(jugar(numero) for numero in range(PARTIDAS)))
+
+    inicio = time.perf_counter()
+    asyncio.run(todas())
+    return time.perf_counter() - inicio
+
+
+def main():
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    directorio = tempfile.mkdtemp()
+    from datos import PERFILES_DB
+
+    for perfil in PERFILES_DB:
+        entorno = dict(os.environ, PERFIL_DB=perfil)
+        if perfil != "memoria":
+            entorno["RUTA_DB"] = os.path.join(directorio, f"{perfil}.sqlite")
+        salida = subprocess.run(
+            [sys.executable, "-m", "benchmarks.perfiles", perfil],
+            cwd=raiz,
+            env=entorno,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        segundos = float(salida.stdout.split()[-1])
+        acciones = PARTIDAS * TURNOS * 4
+        print(f"{perfil:>11}: {segundos:6.2f} s, {acciones / segundos:7.0f} acciones/s")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        print(medir_perfil())
+    else:
+        main()
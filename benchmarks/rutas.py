@@ -0,0 +1,48 @@
+# Costo de agregar las rutas a la respuesta de tirar_dado: armar la respuesta
+# y codificarla con y sin rutas. Correr desde la raiz del repositorio:
+#   python -m benchmarks.rutas
+import timeit
+
+from board.board import cargar_tablero
+from my_json import dumps
+from services.board_functions import casillas_posibles, rutas_posibles
+
+CASOS = [(posicion, dado) for posicion in range(1, 85) for dado in range(1, 7)]
+
+
+def sin_rutas():
+    for posicion, dado in CASOS:
+        dumps(
+            {"numero_dado": dado, "casillas_a_mover": casillas_posibles(posicion, dado)}
+        )
+
+
+def con_rutas():
+    for posicion, dado in CASOS:
+        dumps(
+            {
+                "numero_dado": dado,
+                "casillas_a_mover": casillas_posibles(posicion, dado),
+                "rutas": rutas_posibles(posicion, dado),
+            }
+        )
+
+
+def main():
+    tablero = cargar_tablero()
+    tablero.movimientos()
+    # la primera vez que se piden las rutas de una casilla y un dado se arman
+    # con la tabla de siguientes
+    inicio = timeit.default_timer()
+    for posicion, dado in CASOS:
+        tablero.rutas(posicion, dado)
+    primera = (timeit.default_timer() - inicio) / len(CASOS)
+    print(f"{'rutas la primera vez':>22}: {primera * 1e6:7.2f} us por tirada")
+    for nombre, medir in (("sin rutas", sin_rutas), ("con rutas", con_rutas)):
+        segundos = min(timeit.repeat(medir, number=20, repeat=5))
+        por_tirada = segundos / (20 * len(CASOS)) * 1e6
+        print(f"{nombre:>22}: {por_tirada:7.2f} us por tirada")
+
+
+if __name__ == "__main__":
+    main()
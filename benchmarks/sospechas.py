@@ -0,0 +1,128 @@
+# Latencia de services.in_game.anunciar_sospecha en partidas de 6 jugadores,
+# sobre las partidas en memoria que atienden los websockets y sobre las
+# entidades de la base de datos. Con --base se mide lo mismo en otro commit
+# (por ejemplo el anterior a las manos como mascaras) en un worktree aparte.
+# Correr desde la raiz del repositorio:
+#   python -m benchmarks.sospechas --base bda5492~1
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PARTIDAS = 20
+
+REPETICIONES = 50
+
+
+def medir_arbol():
+    # corre en un proceso aparte con el arbol a medir en PYTHONPATH, solo usa
+    # lo que existe desde antes de los cambios medidos
+    import random
+
+    import pony.orm as pony
+
+    from board import board
+    from models import db
+    from services.in_game import anunciar_sospecha
+    from services.memoria import cargar_partida
+    from services.start_game import iniciar_partida_service
+
+    pony.set_sql_debug(False)
+    monstruos = [n for n, tipo in board.CARTAS if tipo == "M"]
+    victimas = [n for n, tipo in board.CARTAS if tipo == "V"]
+    azar = random.Random(0)
+    recinto = min(board.RECINTOS)
+
+    with pony.db_session:
+        ids = []
+        for _ in range(PARTIDAS):
+            jugadores = [db.Jugador(apodo=f"bench {i}") for i in range(6)]
+            pony.flush()
+            partida = db.Partida(nombre="bench", creador=jugadores[0])
+            for jugador in jugadores:
+                jugador.asociar_a_partida(partida)
+            iniciar_partida_service(partida)
+            pony.flush()
+            ids.append(partida.id_partida)
+    sospechas = [(azar.choice(monstruos), azar.choice(victimas)) for _ in ids]
+
+    def sospechar(casos):
+        # deja al jugador listo para sospechar y vuelve atras lo que cambia
+        for (jugador, partida), (monstruo, victima) in zip(casos, sospechas):
+            partida.jugador_en_turno = jugador.orden_turno
+            jugador.posicion = recinto
+            jugador.estado_turno = "SA"
+            anunciar_sospecha(jugador, monstruo, victima)
+            for otro in partida.jugadores:
+                otro.estado_turno = "N"
+            partida.jugador_que_sospecha = None
+
+    def medir(casos):
+        sospechar(casos)
+        segundos = min(
+            timeit.repeat(lambda: sospechar(casos), number=REPETICIONES, repeat=5)
+        )
+        return segundos / (REPETICIONES * PARTIDAS) * 1e6
+
+    resultados = {}
+    with pony.db_session:
+        partidas = [db.Partida[i] for i in ids]
+        casos = [(p.jugadores.select().first(), p) for p in partidas]
+        resultados["base de datos"] = medir(casos)
+        en_memoria = [cargar_partida(i) for i in ids]
+        pony.rollback()
+    resultados["en memoria"] = medir([(p.jugadores[0], p) for p in en_memoria])
+    return resultados
+
+
+def medir_en(arbol):
+    salida = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--medir"],
+        cwd=tempfile.gettempdir(),
+        env=dict(
+            os.environ,
+            PYTHONPATH=arbol,
+            # pony toma las rutas relativas desde models.py, no desde el cwd
+            RUTA_DB=os.path.join(tempfile.mkdtemp(), "sospechas.sqlite"),
+        ),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(salida.stdout.splitlines()[-1])
+
+
+def main(base=None):
+    arboles = {"actual": RAIZ}
+    worktree = None
+    if base is not None:
+        worktree = tempfile.mkdtemp()
+        subprocess.run(
+            ["git", "-C", RAIZ, "worktree", "add", "--detach", worktree, base],
+            check=True,
+            capture_output=True,
+        )
+        arboles = {base: worktree, **arboles}
+    try:
+        for nombre, arbol in arboles.items():
+            for donde, por_sospecha in medir_en(arbol).items():
+                print(f"{nombre:>10}, {donde:>13}: {por_sospecha:7.2f} us por sospecha")
+    finally:
+        if worktree is not None:
+            subprocess.run(
+                ["git", "-C", RAIZ, "worktree", "remove", "--force", worktree],
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--medir"]:
+        print(json.dumps(medir_arbol()))
+    elif sys.argv[1:2] == ["--base"]:
+        main(sys.argv[2])
+    else:
+        main()
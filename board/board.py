@@ -1,5 +1,13 @@
+import json
+import os
+import threading
+from functools import lru_cache
+
 import numpy as np
 
+# los hilos de la base de datos cargan tableros a la vez, uno solo compila
+compilando = threading.Lock()
+
 TIPOS_CASILLAS = {
     "C": "Casilla común",
     "R": "Recinto",
@@ -10,57 +18,8 @@ TIPOS_CASILLAS = {
     "T": "Trampa",
 }
 
-TRAMPAS = [22, 29, 56, 63]
-
 COLORES = ["red", "green", "blue", "yellow", "deepskyblue", "orange"]
 
-MATRIZ_TABLERO = np.genfromtxt("board/tablero.csv", delimiter=",")
-
-MOVIMIENTOS = {
-    1: np.genfromtxt("board/1mov.csv", delimiter=","),
-    2: np.genfromtxt("board/2mov.csv", delimiter=","),
-    3: np.genfromtxt("board/3mov.csv", delimiter=","),
-    4: np.genfromtxt("board/4mov.csv", delimiter=","),
-    5: np.genfromtxt("board/5mov.csv", delimiter=","),
-    6: np.genfromtxt("board/6mov.csv", delimiter=","),
-}
-
-CASILLAS = {}
-
-for i in range(1, 85):
-    CASILLAS[i] = "C"
-
-for i in [1, 3, 5, 36, 39, 70, 72, 74]:
-    CASILLAS[i] = "R"
-
-CASILLAS[12] = "M"
-CASILLAS[11] = "E"
-CASILLAS[19] = "S"
-CASILLAS[30] = "S"
-CASILLAS[54] = "A"
-CASILLAS[65] = "A"
-CASILLAS[71] = "M"
-CASILLAS[73] = "E"
-
-CASILLAS[22] = "T"
-CASILLAS[29] = "T"
-CASILLAS[56] = "T"
-CASILLAS[63] = "T"
-
-
-RECINTOS = {
-    1: "Cochera",
-    3: "Alcoba",
-    5: "Biblioteca",
-    36: "Vestibulo",
-    39: "Panteon",
-    70: "Bodega",
-    72: "Salon",
-    74: "Laboratorio",
-}
-
-PUERTAS = [2, 4, 16, 35, 50, 69, 83, 84]
-
 CARTAS = [
     ("Alcoba", "R"),
     ("Biblioteca", "R"),
@@ -84,3 +43,324 @@ CARTAS = [
     ("Hombre lobo", "M"),
     ("Momia", "M"),
 ]
+
+# cada carta es un bit, asi una mano o el sobre entran en un entero
+BIT_CARTA = {nombre: 1 << i for i, (nombre, _) in enumerate(CARTAS)}
+
+MASCARA_TIPO = {
+    tipo: sum(BIT_CARTA[nombre] for nombre, t in CARTAS if t == tipo)
+    for tipo in {tipo for _, tipo in CARTAS}
+}
+
+
+def mascara_cartas(nombres):
+    # los nombres que no son cartas no tienen bit
+    mascara = 0
+    for nombre in nombres:
+        mascara |= BIT_CARTA.get(nombre, 0)
+    return mascara
+
+
+def nombres_cartas(mascara):
+    # en el orden de CARTAS, recorriendo solo los bits prendidos
+    nombres = []
+    while mascara:
+        bit = mascara & -mascara
+        nombres.append(CARTAS[bit.bit_length() - 1][0])
+        mascara ^= bit
+    return nombres
+
+
+SIN_CAMINO = 255
+
+# formato de las tablas compiladas, cambiarla si cambia el compilador
+VERSION_TABLERO = 2
+
+DIRECTORIO_BOARD = os.path.dirname(os.path.abspath(__file__))
+
+# un json por tablero, el nombre del archivo es el nombre del tablero
+DIRECTORIO_DEFINICIONES = os.path.join(DIRECTORIO_BOARD, "definiciones")
+
+# tablas compiladas de cada definicion, con el hash de la definicion en el nombre
+DIRECTORIO_COMPILADOS = os.environ.get(
+    "TABLEROS_COMPILADOS", os.path.join(DIRECTORIO_BOARD, "compilados")
+)
+
+TABLERO_POR_DEFECTO = "clasico"
+
+# tableros con las tablas en memoria, los que no se usan se vuelven a leer
+# del disco cuando hagan falta
+TABLEROS_EN_MEMORIA = 4
+
+CARAS_DADO = range(1, 7)
+
+
+def tableros_disponibles():
+    return sorted(
+        archivo[: -len(".json")]
+        for archivo in os.listdir(DIRECTORIO_DEFINICIONES)
+        if archivo.endswith(".json")
+    )
+
+
+def validar_definicion(definicion):
+    cantidad = definicion["cantidad_casillas"]
+    numeradas = [
+        *(c for fila in definicion["tablero"] for c in fila),
+        *(c for casillas in definicion["tipos"].values() for c in casillas),
+        *(int(c) for c in definicion["recintos"]),
+        *definicion["puertas"],
+        *(c for pasadizo in definicion["pasadizos"] for c in pasadizo),
+    ]
+    if not 0 < cantidad <= SIN_CAMINO or any(not 0 <= c < cantidad for c in numeradas):
+        raise ValueError("Hay casillas fuera del tablero")
+    if len({len(fila) for fila in definicion["tablero"]}) != 1:
+        raise ValueError("Las filas del tablero tienen distinto largo")
+    # cada recinto tiene su carta
+    if sorted(definicion["recintos"].values()) != sorted(
+        nombre for nombre, tipo in CARTAS if tipo == "R"
+    ):
+        raise ValueError("Los recintos no coinciden con las cartas de recinto")
+
+
+def leer_definicion(nombre):
+    if nombre not in tableros_disponibles():
+        raise ValueError(f"No existe el tablero {nombre}")
+    ruta = os.path.join(DIRECTORIO_DEFINICIONES, f"{nombre}.json")
+    with open(ruta, encoding="utf-8") as archivo:
+        definicion = json.load(archivo)
+    validar_definicion(definicion)
+    return definicion
+
+
+def casillas_de(definicion):
+    casillas = {i: "C" for i in range(1, definicion["cantidad_casillas"])}
+    for tipo, numeros in definicion["tipos"].items():
+        for numero in numeros:
+            casillas[numero] = tipo
+    return casillas
+
+
+def hash_definicion(definicion):
+    # hashlib tarda en importarse, solo hace falta al cargar un tablero
+    import hashlib
+
+    texto = json.dumps(definicion, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{VERSION_TABLERO}:{texto}".encode()).hexdigest()
+
+
+def hash_tablas(tablas):
+    import hashlib
+
+    contenido = hashlib.sha256()
+    for nombre in sorted(tablas):
+        tabla = np.ascontiguousarray(tablas[nombre])
+        contenido.update(f"{nombre}:{tabla.dtype}:{tabla.shape}:".encode())
+        contenido.update(tabla.tobytes())
+    return contenido.hexdigest()
+
+
+def cargar_tablas(ruta):
+    with np.load(ruta) as artefacto:
+        tablas = {n: artefacto[n] for n in artefacto.files if n != "hash"}
+        hash_guardado = str(artefacto["hash"])
+    if int(tablas["version"]) != VERSION_TABLERO:
+        raise ValueError(f"{ruta} tiene la version {int(tablas['version'])}")
+    if hash_tablas(tablas) != hash_guardado:
+        raise ValueError(f"{ruta} esta corrupto, volver a generarlo")
+    return tablas
+
+
+def guardar_tablas(ruta, tablas):
+    # se escribe a un temporal y se renombra, otro proceso nunca lee un
+    # archivo a medio escribir
+    import tempfile
+
+    directorio = os.path.dirname(ruta)
+    os.makedirs(directorio, exist_ok=True)
+    # un nombre unico por escritura, sirve entre procesos y entre hilos
+    descriptor, temporal = tempfile.mkstemp(
+        dir=directorio, prefix=os.path.basename(ruta), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(descriptor, "wb") as archivo:
+            np.savez(archivo, hash=np.array(hash_tablas(tablas)), **tablas)
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.unlink(temporal)
+        raise
+
+
+def calcular_movimientos(distancias, trampas):
+    # (casilla, dado) -> (casillas ordenadas para mandar, conjunto para validar)
+    movimientos = {}
+    desde_trampa = {}
+    for dado in CARAS_DADO:
+        # desde una trampa se puede salir por cualquiera de las trampas
+        alcanzables = np.flatnonzero((distancias[trampas] <= dado).any(axis=0))
+        casillas = tuple(alcanzables.tolist())
+        desde_trampa[dado] = (casillas, frozenset(casillas))
+    for posicion in range(1, len(distancias)):
+        for dado in CARAS_DADO:
+            if posicion in trampas:
+                movimientos[posicion, dado] = desde_trampa[dado]
+                continue
+            casillas = tuple(np.flatnonzero(distancias[posicion] <= dado).tolist())
+            movimientos[posicion, dado] = (casillas, frozenset(casillas))
+    return movimientos
+
+
+class Tablero:
+    __slots__ = (
+        "nombre",
+        "hash",
+        "casillas",
+        "trampas",
+        "recintos",
+        "puertas",
+        "tablero",
+        "distancias",
+        "siguientes",
+        "_movimientos",
+        "_alcanzables",
+        "_rutas",
+        "_publico",
+    )
+
+    def __init__(self, nombre, hash_tablero, definicion, tablas):
+        self.nombre = nombre
+        self.hash = hash_tablero
+        self.casillas = casillas_de(definicion)
+        self.trampas = [c for c, tipo in self.casillas.items() if tipo == "T"]
+        self.recintos = {int(c): n for c, n in definicion["recintos"].items()}
+        self.puertas = list(definicion["puertas"])
+        # numero de casilla en cada celda de la grilla
+        self.tablero = tablas["tablero"]
+        # minima cantidad de pasos entre cada par de casillas. Por los lazos de
+        # cada casilla consigo misma, se llega con n pasos si es <= n
+        self.distancias = tablas["distancias"]
+        # casilla siguiente en un camino minimo entre cada par de casillas
+        self.siguientes = tablas["siguientes"]
+        self._movimientos = None
+        self._alcanzables = None
+        self._rutas = {}
+        self._publico = None
+
+    def movimientos(self):
+        if self._movimientos is None:
+            self._movimientos = calcular_movimientos(self.distancias, self.trampas)
+        return self._movimientos
+
+    def alcanzables(self):
+        # alcanzables[dado - 1, origen, destino]: con ese dado se puede ir de
+        # origen a destino, la tabla de movimientos como un solo arreglo
+        if self._alcanzables is None:
+            alcanza = self.distancias[None, :, :] <= np.array(CARAS_DADO)[:, None, None]
+            # desde una trampa se puede salir por cualquiera de las trampas
+            trampas = self.trampas
+            alcanza[:, trampas, :] = alcanza[:, trampas, :].any(axis=1, keepdims=True)
+            self._alcanzables = alcanza
+        return self._alcanzables
+
+    def ruta(self, origen, destino):
+        # casillas de un camino minimo de origen a destino, las dos incluidas
+        camino = [origen]
+        casilla = origen
+        if origen in self.trampas:
+            # desde una trampa se sale por la trampa mas cercana al destino
+            casilla = min(self.trampas, key=lambda t: (self.distancias[t, destino], t))
+            if casilla != origen:
+                camino.append(casilla)
+        while casilla != destino:
+            casilla = int(self.siguientes[casilla, destino])
+            camino.append(casilla)
+        return tuple(camino)
+
+    def publico(self):
+        # lo que necesita el cliente para mostrar y validar movimientos sin
+        # preguntarle al servidor. Las tablas van en base64, una fila de
+        # cantidad_casillas bytes por casilla: distancias[i][j] es el byte
+        # i * cantidad_casillas + j
+        if self._publico is None:
+            import base64
+
+            self._publico = {
+                "nombre": self.nombre,
+                "hash": self.hash,
+                "version": VERSION_TABLERO,
+                "cantidad_casillas": len(self.distancias),
+                "sin_camino": SIN_CAMINO,
+                "tablero": self.tablero.tolist(),
+                "casillas": self.casillas,
+                "trampas": self.trampas,
+                "recintos": self.recintos,
+                "puertas": self.puertas,
+                "distancias": base64.b64encode(self.distancias.tobytes()).decode(),
+                "siguientes": base64.b64encode(self.siguientes.tobytes()).decode(),
+            }
+        return self._publico
+
+    def rutas(self, posicion, dado):
+        # destino -> ruta para cada casilla a la que se puede mover
+        if (posicion, dado) not in self._rutas:
+            casillas, _ = self.movimientos().get((posicion, dado), ((), None))
+            self._rutas[posicion, dado] = {
+                destino: self.ruta(posicion, destino) for destino in casillas
+            }
+        return self._rutas[posicion, dado]
+
+
+@lru_cache(maxsize=TABLEROS_EN_MEMORIA)
+def cargar_tablero(nombre=TABLERO_POR_DEFECTO):
+    # la primera vez que se usa una definicion se compila y se guarda, despues
+    # se lee lo compilado mientras la definicion no cambie
+    definicion = leer_definicion(nombre)
+    hash_tablero = hash_definicion(definicion)
+    ruta = os.path.join(DIRECTORIO_COMPILADOS, f"{nombre}-{hash_tablero[:16]}.npz")
+    try:
+        tablas = cargar_tablas(ruta)
+    except (OSError, ValueError):
+        tablas = compilar_y_guardar(definicion, ruta)
+    return Tablero(nombre, hash_tablero, definicion, tablas)
+
+
+def compilar_y_guardar(definicion, ruta):
+    from board.scripts import compilar_definicion
+
+    with compilando:
+        # otro hilo pudo haberlo compilado mientras se esperaba
+        try:
+            return cargar_tablas(ruta)
+        except (OSError, ValueError):
+            pass
+        tablas = compilar_definicion(definicion)
+        try:
+            guardar_tablas(ruta, tablas)
+        except OSError:
+            import logging
+
+            # sin permiso de escritura se usa lo compilado, sin guardarlo
+            logging.getLogger(__name__).exception(
+                "No se pudo guardar el tablero compilado en %s", ruta
+            )
+        return tablas
+
+
+# el tablero clasico, para el codigo que no depende de la partida. Se lee la
+# primera vez que se usa y no al importar
+TABLAS_PEREZOSAS = {
+    "MATRIZ_TABLERO": "tablero",
+    "DISTANCIAS": "distancias",
+    "CASILLAS": "casillas",
+    "TRAMPAS": "trampas",
+    "RECINTOS": "recintos",
+    "PUERTAS": "puertas",
+}
+
+
+def __getattr__(nombre):
+    if nombre in TABLAS_PEREZOSAS:
+        return getattr(cargar_tablero(), TABLAS_PEREZOSAS[nombre])
+    if nombre == "CLASICO":
+        return leer_definicion(TABLERO_POR_DEFECTO)
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
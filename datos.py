@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import pony.orm as pony
+
+# perfiles de almacenamiento, se elige uno con la variable de entorno PERFIL_DB
+PERFILES_DB = {
+    # archivo con la configuracion por defecto de SQLite
+    "desarrollo": {"ruta": "database.sqlite", "pragmas": {}},
+    # WAL: los lectores no bloquean al escritor y con synchronous NORMAL el
+    # commit no hace fsync, solo los checkpoints
+    "produccion": {
+        "ruta": "database.sqlite",
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "mmap_size": 256 * 1024 * 1024,
+            "cache_size": -64 * 1024,
+            "temp_store": "MEMORY",
+            "busy_timeout": 5000,
+        },
+    },
+    # todo en memoria compartida entre los hilos, se pierde al reiniciar. En la
+    # cache compartida los lectores bloquean tablas enteras, read_uncommitted
+    # evita que choquen con el escritor
+    "memoria": {"ruta": ":sharedmemory:", "pragmas": {"read_uncommitted": "true"}},
+}
+
+PERFIL_DB = os.environ.get("PERFIL_DB", "desarrollo")
+if PERFIL_DB not in PERFILES_DB:
+    raise ValueError(f"PERFIL_DB desconocido: {PERFIL_DB}")
+
+RUTA_DB = os.environ.get("RUTA_DB", PERFILES_DB[PERFIL_DB]["ruta"])
+
+# fraccion de las sentencias SQL que se muestran, 0 apaga el debug
+SQL_DEBUG = float(os.environ.get("SQL_DEBUG", "0"))
+
+# hilos dedicados al trabajo con la base de datos, el event loop nunca
+# espera al disco
+HILOS_DB = 4
+
+# veces que se reintenta una transaccion que choco con otra
+REINTENTOS_DB = 3
+
+# segundos que el escritor junta escrituras antes de hacer un unico commit
+INTERVALO_COMMIT = 0.005
+
+# hilos de las rutas GET, sus conexiones son de solo lectura
+HILOS_LECTURA = 4
+
+
+class Muestreo(logging.Filter):
+    def __init__(self, fraccion):
+        super().__init__()
+        self.fraccion = fraccion
+
+    def filter(self, record):
+        return random.random() < self.fraccion
+
+
+def configurar_sql_debug(fraccion=SQL_DEBUG):
+    # pony guarda el debug por hilo, se llama al crear cada hilo de la base
+    pony.set_sql_debug(fraccion > 0)
+
+
+def aplicar_pragmas(conexion, pragmas, solo_lectura=False):
+    for pragma, valor in pragmas.items():
+        conexion.execute(f"PRAGMA {pragma} = {valor}")
+    if solo_lectura:
+        conexion.execute("PRAGMA query_only = ON")
+
+
+def es_hilo_lector():
+    return threading.current_thread().name.startswith("lector")
+
+
+if SQL_DEBUG > 0:
+    registro_sql = logging.getLogger("pony.orm.sql")
+    manejador_sql = logging.StreamHandler()
+    manejador_sql.addFilter(Muestreo(SQL_DEBUG))
+    registro_sql.addHandler(manejador_sql)
+    registro_sql.setLevel(logging.INFO)
+    registro_sql.propagate = False
+configurar_sql_debug()
+
+ejecutor_db = ThreadPoolExecutor(
+    max_workers=HILOS_DB, thread_name_prefix="db", initializer=configurar_sql_debug
+)
+
+# SQLite admite un solo escritor, todas las escrituras pasan por este hilo
+ejecutor_escritura = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="escritor", initializer=configurar_sql_debug
+)
+
+ejecutor_lectura = ThreadPoolExecutor(
+    max_workers=HILOS_LECTURA,
+    thread_name_prefix="lector",
+    initializer=configurar_sql_debug,
+)
+
+
+def es_conflicto(error):
+    return isinstance(error, pony.TransactionError) or (
+        isinstance(error, pony.OperationalError) and "locked" in str(error)
+    )
+
+
+def _en_sesion(funcion, args):
+    # strict descarta el identity map al salir: cada llamada vuelve a leer las
+    # entidades por id y la memoria no crece con la vida de la conexion
+    transaccion = pony.db_session(
+        retry=REINTENTOS_DB, retry_exceptions=es_conflicto, strict=True
+    )
+    return transaccion(funcion)(*args)
+
+
+async def ejecutar_db(funcion, *args):
+    # corre funcion(*args) en una transaccion corta en el pool de la base de
+    # datos, tiene que devolver datos planos y no entidades
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(ejecutor_db, _en_sesion, funcion, args)
+
+
+def _leer(funcion, args):
+    with pony.db_session(strict=True):
+        return funcion(*args)
+
+
+async def leer_db(funcion, *args):
+    # para las rutas GET: no compite con los hilos que atienden los websockets
+    # y con WAL lee mientras el escritor hace commit
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(ejecutor_lectura, _leer, funcion, args)
+
+
+# el hilo escritor marca aca que esta corriendo un lote
+lote_local = threading.local()
+
+
+class CommitEnLote(RuntimeError):
+    pass
+
+
+def proteger_lotes(db):
+    # un commit en medio de un lote guardaria las escrituras de las demas y si
+    # despues algo falla se repetirian al correr cada una por separado. Se
+    # rechaza, el lote se deshace y cada escritura corre en su transaccion
+    commit = db.provider.commit
+
+    def commit_fuera_de_lote(connection, cache=None):
+        if getattr(lote_local, "abierto", False):
+            raise CommitEnLote("Commit dentro de un lote de escrituras")
+        return commit(connection, cache)
+
+    db.provider.commit = commit_fuera_de_lote
+
+
+def _escribir_lote(trabajos):
+    # todo el lote en una transaccion y un solo fsync, si alguna escritura falla
+    # se deshace el lote y cada una se repite en su propia transaccion para que
+    # el error le llegue solo a quien lo causo
+    try:
+        with pony.db_session(strict=True):
+            lote_local.abierto = True
+            try:
+                resultados = [(True, funcion(*args)) for funcion, args in trabajos]
+            finally:
+                lote_local.abierto = False
+            return resultados
+    except Exception:
+        pass
+    resultados = []
+    for funcion, args in trabajos:
+        try:
+            resultados.append((True, _en_sesion(funcion, args)))
+        except Exception as error:
+            resultados.append((False, error))
+    return resultados
+
+
+class EscritorAgrupado:
+    def __init__(self, intervalo=INTERVALO_COMMIT):
+        self.intervalo = intervalo
+        self.cola = []
+        self.tarea = None
+
+    def escribir(self, funcion, *args):
+        # devuelve un futuro que se resuelve cuando la escritura ya esta en disco
+        futuro = asyncio.get_event_loop().create_future()
+        self.cola.append((funcion, args, futuro))
+        if self.tarea is None:
+            self.tarea = asyncio.ensure_future(self._escribir())
+        return futuro
+
+    async def _escribir(self):
+        loop = asyncio.get_event_loop()
+        try:
+            while self.cola:
+                await asyncio.sleep(self.intervalo)
+                lote = self.cola
+                self.cola = []
+                trabajos = [(funcion, args) for funcion, args, _ in lote]
+                try:
+                    resultados = await loop.run_in_executor(
+                        ejecutor_escritura, _escribir_lote, trabajos
+                    )
+                except Exception as error:
+                    resultados = [(False, error)] * len(lote)
+                for (_, _, futuro), (ok, valor) in zip(lote, resultados):
+                    if futuro.done():
+                        continue
+                    if ok:
+                        futuro.set_result(valor)
+                    else:
+                        futuro.set_exception(valor)
+        finally:
+            self.tarea = None
+
+
+# un escritor por event loop, uvicorn corre uno solo
+escritores = weakref.WeakKeyDictionary()
+
+
+async def escribir_db(funcion, *args):
+    # como ejecutar_db pero la transaccion se comparte con las demas escrituras
+    # de los ultimos INTERVALO_COMMIT segundos
+    loop = asyncio.get_event_loop()
+    if loop not in escritores:
+        escritores[loop] = EscritorAgrupado()
+    return await escritores[loop].escribir(funcion, *args)
@@ -1,33 +1,40 @@
-from fastapi import FastAPI, status, HTTPException, WebSocket, WebSocketDisconnect
-import pony.orm as pony
+import logging
+
+from fastapi import (
+    FastAPI,
+    status,
+    HTTPException,
+    Request,
+    Response,
+    Query,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 
-from models import db, crear_jugador, crear_partida, get_partida, get_jugador
+from board.board import TABLERO_POR_DEFECTO, cargar_tablero
+from datos import ejecutar_db, escribir_db, leer_db
+from models import db, crear_jugador, crear_partida, get_partida
+from my_json import RespuestaJSON
 from my_sockets import ConnectionManager
-from services.start_game import (
-    iniciar_partida_service,
-    mostrar_cartas,
-    bruja_salem,
-)
-from services.lobby import (
-    jugador_conectado_lobby,
-    jugador_desconectado_lobby,
-    escribir_chat,
-    iniciar_partida_lobby,
+from services.acciones import (
+    entrada_valida,
+    procesar_entrada,
+    procesar_entrada_en_memoria,
+    conectar_jugador,
+    conectar_jugador_en_memoria,
+    desconectar_jugador,
+    desconectar_jugador_en_memoria,
 )
-from services.in_game import (
-    tirar_dado,
-    pasar_turno,
-    mover_jugador,
-    anunciar_sospecha,
-    responder_sospecha,
-    acusar,
-    estado_jugadores,
-)
-
+from services.estado import RegistroEstados, pedir_estado
+from services.eventos import TAMANIO_PAGINA, pagina_eventos
+from services.in_game import alcanzables_partida
+from services.memoria import MotorPartidas, Persistidor
+from services.repeticion import CONECTAR
 
-app = FastAPI()
+app = FastAPI(default_response_class=RespuestaJSON)
 
 
 # Permisos para fetch de Front
@@ -37,8 +44,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# la url con el hash siempre devuelve lo mismo, se puede guardar para siempre
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+
 
 class UnirseIn(BaseModel):
     id_partida: str
@@ -48,6 +59,7 @@ class UnirseIn(BaseModel):
 class PartidaIn(BaseModel):
     nombre_partida: str
     apodo: str
+    tablero: str = TABLERO_POR_DEFECTO
 
 
 class PartidaOut(BaseModel):
@@ -63,30 +75,21 @@ async def home():
     return {"message": "Project home Grupo Peluche"}
 
 
-@app.get("/partidas")
-async def listar_partidas():
-    with pony.db_session:
-        partidas = db.Partida.select(
-            lambda p: (not p.iniciada) and len(p.jugadores) < 6
-        )
-        return [
-            {
-                "id_partida": p.id_partida,
-                "nombre_partida": p.nombre,
-                "cantidad_jugadores": p.cantidad_jugadores(),
-            }
-            for p in partidas
-        ]
-
+def consultar_partidas():
+    partidas = db.Partida.select(lambda p: (not p.iniciada) and len(p.jugadores) < 6)
+    return [
+        {
+            "id_partida": p.id_partida,
+            "nombre_partida": p.nombre,
+            "cantidad_jugadores": p.cantidad_jugadores(),
+        }
+        for p in partidas
+    ]
 
-@app.post("/partidas/", response_model=PartidaOut, status_code=status.HTTP_201_CREATED)
-async def respuesta_creacion(nueva_partida: PartidaIn) -> int:
-    nueva_partida_dicionario = nueva_partida.dict()
-    jugador = crear_jugador(nueva_partida_dicionario["apodo"])
-    partida = crear_partida(
-        nueva_partida_dicionario["nombre_partida"], jugador.id_jugador
-    )
 
+def crear_partida_nueva(nombre_partida, apodo, tablero=TABLERO_POR_DEFECTO):
+    jugador = crear_jugador(apodo)
+    partida = crear_partida(nombre_partida, jugador.id_jugador, tablero)
     return PartidaOut(
         id_partida=partida.id_partida,
         nombre_partida=partida.nombre,
@@ -96,40 +99,33 @@ async def respuesta_creacion(nueva_partida: PartidaIn) -> int:
     )
 
 
-@app.get("/partidas/{id_partida}")
-async def detalle_partida(id_partida: int):
-    with pony.db_session:
-        partida = get_partida(id_partida)
-        jugadores_json = [
-            {
-                "id_jugador": j.id_jugador,
-                "apodo": j.apodo,
-                "orden": j.orden_turno,
-                "en_turno": j.orden_turno == partida.jugador_en_turno,
-            }
-            for j in partida.jugadores.order_by(db.Jugador.orden_turno)
-        ]
-        return {
-            "id_partida": partida.id_partida,
-            "nombre": partida.nombre,
-            "iniciada": partida.iniciada,
-            "jugadores": jugadores_json,
+def consultar_partida(id_partida):
+    partida = get_partida(id_partida)
+    jugadores_json = [
+        {
+            "id_jugador": j.id_jugador,
+            "apodo": j.apodo,
+            "orden": j.orden_turno,
+            "en_turno": j.orden_turno == partida.jugador_en_turno,
         }
+        for j in partida.jugadores.order_by(db.Jugador.orden_turno)
+    ]
+    return {
+        "id_partida": partida.id_partida,
+        "nombre": partida.nombre,
+        "iniciada": partida.iniciada,
+        "tablero": partida.tablero,
+        "jugadores": jugadores_json,
+    }
 
 
-@app.put("/partidas/", response_model=PartidaOut)
-async def unirse_a_partida(nuevo_usuario: UnirseIn):
-    with pony.db_session:
-        nuevo_usuario_diccionario = nuevo_usuario.dict()
-        partida = get_partida(nuevo_usuario_diccionario["id_partida"])
-        if len(partida.jugadores) < 6:
-            jugador = crear_jugador(nuevo_usuario_diccionario["apodo"])
-            jugador.asociar_a_partida(partida)
-        else:
-            raise HTTPException(
-                status_code=500, detail="No puedes unirte a esta partida"
-            )
-
+def unir_jugador(id_partida, apodo):
+    partida = get_partida(id_partida)
+    if len(partida.jugadores) < 6:
+        jugador = crear_jugador(apodo)
+        jugador.asociar_a_partida(partida)
+    else:
+        raise HTTPException(status_code=500, detail="No puedes unirte a esta partida")
     return PartidaOut(
         id_partida=partida.id_partida,
         nombre_partida=partida.nombre,
@@ -139,126 +135,280 @@ async def unirse_a_partida(nuevo_usuario: UnirseIn):
     )
 
 
+def buscar_tablero(nombre):
+    try:
+        return cargar_tablero(nombre)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="No existe el tablero solicitado")
+
+
+def responder_tablero(request, tablero, cache):
+    etag = f'"{tablero.hash}"'
+    cabeceras = {"ETag": etag, "Cache-Control": cache}
+    pedidas = [
+        e.strip().replace("W/", "", 1)
+        for e in request.headers.get("if-none-match", "").split(",")
+    ]
+    if etag in pedidas or "*" in pedidas:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cabeceras)
+    return RespuestaJSON(tablero.publico(), headers=cabeceras)
+
+
+@app.get("/tableros/{nombre}")
+def tablero_actual(nombre: str, request: Request):
+    # el cliente revalida con If-None-Match y recibe 304 si no cambio
+    return responder_tablero(request, buscar_tablero(nombre), "no-cache")
+
+
+@app.get("/tableros/{nombre}/{hash_tablero}")
+def tablero_compilado(nombre: str, hash_tablero: str, request: Request):
+    tablero = buscar_tablero(nombre)
+    if hash_tablero != tablero.hash:
+        raise HTTPException(status_code=404, detail="No existe esa version del tablero")
+    return responder_tablero(request, tablero, CACHE_INMUTABLE)
+
+
+@app.get("/partidas")
+async def listar_partidas():
+    return await leer_db(consultar_partidas)
+
+
+@app.post("/partidas/", response_model=PartidaOut, status_code=status.HTTP_201_CREATED)
+async def respuesta_creacion(nueva_partida: PartidaIn) -> int:
+    nueva_partida_dicionario = nueva_partida.dict()
+    return await escribir_db(
+        crear_partida_nueva,
+        nueva_partida_dicionario["nombre_partida"],
+        nueva_partida_dicionario["apodo"],
+        nueva_partida_dicionario["tablero"],
+    )
+
+
+@app.get("/partidas/{id_partida}")
+async def detalle_partida(id_partida: int):
+    return await leer_db(consultar_partida, id_partida)
+
+
+def consultar_alcanzables(id_partida):
+    return alcanzables_partida(get_partida(id_partida))
+
+
+@app.get("/partidas/{id_partida}/alcanzables")
+async def alcanzables_de_partida(id_partida: int):
+    # si la partida se esta jugando, las posiciones al dia estan en memoria
+    partida = motor.partidas.get(id_partida)
+    if partida is not None:
+        return alcanzables_partida(partida)
+    return await leer_db(consultar_alcanzables, id_partida)
+
+
+@app.get("/partidas/{id_partida}/eventos")
+async def eventos_de_partida(
+    id_partida: int, desde: int = 0, limite: int = Query(None, ge=1)
+):
+    # la bitacora como ndjson, una linea [numero, id_jugador, accion,
+    # to_broadcast, system] por evento, sin lo que se mostro en privado. Se lee
+    # por paginas para no tener toda la partida en memoria; el ultimo numero
+    # sirve de cursor para seguir
+    await motor.persistidor.sincronizar()
+    cantidad = TAMANIO_PAGINA if limite is None else min(limite, TAMANIO_PAGINA)
+    # la primera pagina antes de responder, asi una partida que no existe da error
+    primera = await leer_db(pagina_eventos, id_partida, desde, cantidad)
+
+    async def lineas():
+        pagina, pedidos, restantes = primera, cantidad, limite
+        while pagina:
+            yield "".join(linea for _, linea in pagina)
+            if len(pagina) < pedidos:
+                return
+            if restantes is not None:
+                restantes -= len(pagina)
+                pedidos = min(restantes, TAMANIO_PAGINA)
+                if not pedidos:
+                    return
+            cursor = pagina[-1][0]
+            pagina = await leer_db(pagina_eventos, id_partida, cursor, pedidos)
+
+    return StreamingResponse(lineas(), media_type="application/x-ndjson")
+
+
+@app.put("/partidas/", response_model=PartidaOut)
+async def unirse_a_partida(nuevo_usuario: UnirseIn):
+    nuevo_usuario_diccionario = nuevo_usuario.dict()
+    return await escribir_db(
+        unir_jugador,
+        nuevo_usuario_diccionario["id_partida"],
+        nuevo_usuario_diccionario["apodo"],
+    )
+
+
 # Toda la parte de WEBSockets
 
+logger = logging.getLogger(__name__)
+
 manager = ConnectionManager()
+estados = RegistroEstados()
+motor = MotorPartidas(Persistidor())
+
+
+@app.on_event("shutdown")
+async def guardar_partidas():
+    await motor.persistidor.sincronizar()
+
+
+async def difundir_estado(id_partida, lista):
+    version, cambios = estados.actualizar(id_partida, lista)
+    if cambios is None:
+        await manager.broadcast(
+            "estado_jugadores", estados.snapshot(id_partida), id_partida
+        )
+    elif cambios:
+        await manager.broadcast(
+            "estado_jugadores_cambios",
+            {"version": version, "cambios": cambios},
+            id_partida,
+        )
 
 
 @app.websocket("/ws/{id_jugador}")
 async def websocket_endpoint(websocket: WebSocket, id_jugador: int):
-    with pony.db_session:
-        jugador = get_jugador(id_jugador)
-        partida = jugador.partida
-        await manager.connect(jugador.id_jugador, partida.id_partida, websocket)
-        if partida.iniciada == True:
-            respuesta_inicial = estado_jugadores(partida)
-            await manager.send_personal_message(
-                respuesta_inicial["personal_message"]["action"],
-                respuesta_inicial["personal_message"]["data"],
-                websocket,
-            )
-            respuesta_mostrar_cartas = mostrar_cartas(jugador)
-            await manager.send_personal_message(
-                respuesta_mostrar_cartas["personal_message"]["action"],
-                respuesta_mostrar_cartas["personal_message"]["data"],
-                websocket,
-            )
-            respuesta_bruja_salem = bruja_salem(jugador, partida)
-            await manager.send_personal_message(
-                respuesta_bruja_salem["personal_message"]["action"],
-                respuesta_bruja_salem["personal_message"]["data"],
-                websocket,
-            )
-            await manager.broadcast_system(
-                respuesta_bruja_salem["system"]["action"],
-                respuesta_bruja_salem["system"]["data"],
-                partida.id_partida,
-            )
-
-        else:
-            conexion = jugador_conectado_lobby(jugador, partida)
-            await manager.broadcast(
-                conexion["to_broadcast"]["action"],
-                conexion["to_broadcast"]["data"],
-                partida.id_partida,
-            )
-        try:
-            while True:
+    # en el lobby cada mensaje se guarda con el escritor agrupado de datos, las
+    # partidas iniciadas se juegan en memoria y se guardan en segundo plano
+    conexion = await ejecutar_db(conectar_jugador, id_jugador)
+    id_partida = conexion["id_partida"]
+    await manager.connect(id_jugador, id_partida, websocket)
+    try:
+        await saludar(id_jugador, id_partida, conexion, websocket)
+        while True:
+            try:
                 entrada = await websocket.receive_json()
-                respuesta = {
-                    "personal_message": {
-                        "action": "error_imp",
-                        "data": "No existe esa accion",
-                    },
-                    "to_broadcast": {"action": "", "data": ""},
-                    "message_to": {"action": "", "data": "", "id_jugador": ""},
-                }
-                if entrada["action"] == "iniciar_partida":
-                    respuesta = iniciar_partida_lobby(jugador, partida)
-                if entrada["action"] == "escribe_chat":
-                    respuesta = escribir_chat(jugador, entrada["data"]["message"])
-                if entrada["action"] == "tirar_dado":
-                    respuesta = tirar_dado(jugador, partida)
-                if entrada["action"] == "mover_jugador":
-                    respuesta = mover_jugador(
-                        jugador, entrada["data"]["nueva_posicion"]
-                    )
-                if entrada["action"] == "terminar_turno":
-                    respuesta = pasar_turno(jugador, partida)
-                if entrada["action"] == "sospechan":
-                    respuesta = anunciar_sospecha(
-                        jugador,
-                        entrada["data"]["carta_monstruo"],
-                        entrada["data"]["carta_victima"],
-                    )
-                if entrada["action"] == "respuesta_sospecha":
-                    respuesta = responder_sospecha(jugador, entrada["data"])
-                if entrada["action"] == "acusar":
-                    respuesta = acusar(
-                        jugador,
-                        partida,
-                        entrada["data"]["carta_monstruo"],
-                        entrada["data"]["carta_victima"],
-                        entrada["data"]["carta_recinto"],
-                    )
-                if entrada["action"] == "mostrar_cartas":
-                    respuesta = mostrar_cartas(jugador)
+            except ValueError:
+                entrada = None
+            if not entrada_valida(entrada):
                 await manager.send_personal_message(
-                    respuesta["personal_message"]["action"],
-                    respuesta["personal_message"]["data"],
-                    websocket,
-                )
-                await manager.broadcast(
-                    respuesta["to_broadcast"]["action"],
-                    respuesta["to_broadcast"]["data"],
-                    partida.id_partida,
-                )
-                await manager.send_message_to(
-                    respuesta["message_to"]["action"],
-                    respuesta["message_to"]["data"],
-                    respuesta["message_to"]["id_jugador"],
+                    "error_imp", {"message": "Mensaje invalido"}, websocket
                 )
-                respuesta_inicial = estado_jugadores(partida)
-                await manager.broadcast(
-                    respuesta_inicial["personal_message"]["action"],
-                    respuesta_inicial["personal_message"]["data"],
-                    partida.id_partida,
-                )
-                await manager.broadcast_system(
-                    respuesta["system"]["action"],
-                    respuesta["system"]["data"],
-                    partida.id_partida,
+                continue
+            try:
+                await atender_entrada(id_jugador, id_partida, entrada, websocket)
+            except WebSocketDisconnect:
+                raise
+            except Exception:
+                # un error en una jugada no corta la conexion
+                logger.exception("Fallo la accion %s de %s", entrada, id_jugador)
+                await manager.send_personal_message(
+                    "error_imp", {"message": "No se pudo hacer la accion"}, websocket
                 )
-        except WebSocketDisconnect:
-            manager.disconnect(websocket)
-            respuesta = jugador_desconectado_lobby(jugador, partida, manager)
-            await manager.broadcast(
-                respuesta["to_broadcast"]["action"],
-                respuesta["to_broadcast"]["data"],
-                partida.id_partida,
-            )
-            await manager.broadcast_system(
-                respuesta["system"]["action"],
-                respuesta["system"]["data"],
-                partida.id_partida,
-            )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await desconectar(id_jugador, id_partida, websocket)
+
+
+async def saludar(id_jugador, id_partida, conexion, websocket):
+    if not conexion["iniciada"]:
+        await manager.broadcast(
+            conexion["lobby"]["to_broadcast"]["action"],
+            conexion["lobby"]["to_broadcast"]["data"],
+            id_partida,
+        )
+        return
+    partida = await motor.obtener(id_partida)
+    # lo que paso desde la ultima instantanea, antes de sumar esta conexion
+    historial = partida.bitacora.historial()
+    conexion.update(conectar_jugador_en_memoria(partida, id_jugador))
+    partida.bitacora.registrar(
+        partida, id_jugador, {"action": CONECTAR}, conexion["bruja_salem"]
+    )
+    motor.jugada(partida)
+    await manager.send_personal_message("historial", historial, websocket)
+    version, cambios = estados.actualizar(id_partida, conexion["lista"])
+    await manager.send_personal_message(
+        "estado_jugadores", estados.snapshot(id_partida), websocket
+    )
+    if cambios:
+        await manager.broadcast(
+            "estado_jugadores_cambios",
+            {"version": version, "cambios": cambios},
+            id_partida,
+        )
+    respuesta_mostrar_cartas = conexion["mostrar_cartas"]
+    await manager.send_personal_message(
+        respuesta_mostrar_cartas["personal_message"]["action"],
+        respuesta_mostrar_cartas["personal_message"]["data"],
+        websocket,
+    )
+    respuesta_bruja_salem = conexion["bruja_salem"]
+    await manager.send_personal_message(
+        respuesta_bruja_salem["personal_message"]["action"],
+        respuesta_bruja_salem["personal_message"]["data"],
+        websocket,
+    )
+    await manager.broadcast_system(
+        respuesta_bruja_salem["system"]["action"],
+        respuesta_bruja_salem["system"]["data"],
+        id_partida,
+    )
+
+
+async def atender_entrada(id_jugador, id_partida, entrada, websocket):
+    partida = await motor.obtener(id_partida)
+    if partida is None:
+        respuesta, lista = await escribir_db(procesar_entrada, id_jugador, entrada)
+        if respuesta["to_broadcast"]["action"] == "iniciada":
+            motor.iniciada(id_partida)
+    else:
+        respuesta, lista = procesar_entrada_en_memoria(partida, id_jugador, entrada)
+        partida.bitacora.registrar(partida, id_jugador, entrada, respuesta)
+        motor.jugada(partida)
+    if entrada["action"] == "estado_jugadores":
+        # sin una version valida se manda el estado completo
+        data = entrada.get("data")
+        version = data.get("version") if isinstance(data, dict) else None
+        respuesta = pedir_estado(estados, id_partida, lista, version)
+    await manager.send_personal_message(
+        respuesta["personal_message"]["action"],
+        respuesta["personal_message"]["data"],
+        websocket,
+    )
+    await manager.broadcast(
+        respuesta["to_broadcast"]["action"],
+        respuesta["to_broadcast"]["data"],
+        id_partida,
+    )
+    await manager.send_message_to(
+        respuesta["message_to"]["action"],
+        respuesta["message_to"]["data"],
+        respuesta["message_to"]["id_jugador"],
+    )
+    if lista is not None and entrada["action"] != "estado_jugadores":
+        await difundir_estado(id_partida, lista)
+    await manager.broadcast_system(
+        respuesta["system"]["action"],
+        respuesta["system"]["data"],
+        id_partida,
+    )
+
+
+async def desconectar(id_jugador, id_partida, websocket):
+    manager.disconnect(websocket)
+    # el indice de conexiones solo se lee en el event loop
+    restantes = manager.count_id_jugador_websockets(id_jugador)
+    partida = await motor.obtener(id_partida)
+    if partida is None:
+        respuesta = await escribir_db(desconectar_jugador, id_jugador, restantes)
+    else:
+        respuesta = desconectar_jugador_en_memoria(partida, id_jugador, restantes)
+    if not manager.websockets_de_partida(id_partida):
+        estados.olvidar(id_partida)
+        motor.descargar(id_partida)
+    await manager.broadcast(
+        respuesta["to_broadcast"]["action"],
+        respuesta["to_broadcast"]["data"],
+        id_partida,
+    )
+    await manager.broadcast_system(
+        respuesta["system"]["action"],
+        respuesta["system"]["data"],
+        id_partida,
+    )
@@ -1,7 +1,24 @@
+import random
+
 import pony.orm as pony
 from fastapi import HTTPException
 
-from board.board import RECINTOS, TRAMPAS
+from board.board import (
+    CARTAS,
+    MASCARA_TIPO,
+    TABLERO_POR_DEFECTO,
+    cargar_tablero,
+    nombres_cartas,
+    tableros_disponibles,
+)
+from datos import (
+    PERFILES_DB,
+    PERFIL_DB,
+    RUTA_DB,
+    aplicar_pragmas,
+    es_hilo_lector,
+    proteger_lotes,
+)
 
 ESTADOS_TURNO_JUGADOR = {
     "N": "No tiene turno",
@@ -15,6 +32,11 @@ ESTADOS_TURNO_JUGADOR = {
 
 db = pony.Database()
 
+
+def nueva_semilla():
+    return random.getrandbits(62)
+
+
 # implementación de clases
 class Partida(db.Entity):
     id_partida = pony.PrimaryKey(int, auto=True)
@@ -24,68 +46,56 @@ class Partida(db.Entity):
     jugadores = pony.Set("Jugador", reverse="partida")
     jugador_en_turno = pony.Optional(int, default=1)
     jugador_que_sospecha = pony.Optional("Jugador", reverse="sospecha")
-    cartas = pony.Set("Carta", reverse="partida")
-    sobre = pony.Set("Carta", reverse="sobre")
+    # cartas del sobre, un bit por carta del catalogo
+    mascara_sobre = pony.Required(int, default=0)
     se_jugo_bruja = pony.Required(bool, default=False)
+    tablero = pony.Required(str, default=TABLERO_POR_DEFECTO)
+    # todo el azar de la partida sale de la semilla, usos_azar cuenta cuantos
+    # generadores se sacaron de ella
+    semilla = pony.Required(int, size=64, default=nueva_semilla)
+    usos_azar = pony.Required(int, default=0)
+    eventos = pony.Set("Evento", reverse="partida")
+    instantaneas = pony.Set("Instantanea", reverse="partida")
 
     @pony.db_session()
     def cantidad_jugadores(self):
         return len(self.jugadores)
 
+    def carta_en_sobre(self, tipo):
+        return nombres_cartas(self.mascara_sobre & MASCARA_TIPO[tipo])[0]
+
     @pony.db_session()
     def monstruo_en_sobre(self):
-        for carta in self.sobre:
-            if carta.tipo == "M":
-                return carta
+        return self.carta_en_sobre("M")
 
     @pony.db_session()
     def victima_en_sobre(self):
-        for carta in self.sobre:
-            if carta.tipo == "V":
-                return carta
+        return self.carta_en_sobre("V")
 
     @pony.db_session()
     def recinto_en_sobre(self):
-        for carta in self.sobre:
-            if carta.tipo == "R":
-                return carta
+        return self.carta_en_sobre("R")
+
+    @pony.db_session()
+    def duenios_cartas(self):
+        return duenios_de_cartas(self.jugadores)
 
     @pony.db_session()
     def siguiente_jugador(self, pasar_turno=False):
-        t = True
-        i = 0
-        if all([j.en_trampa for j in self.jugadores]):
-            if pasar_turno:
-                for j in self.jugadores:
-                    j.en_trampa = False
-            while t:
-                siguiente = (self.jugador_en_turno + i) % len(self.jugadores) + 1
-                jugador_siguiente = next(
-                    filter(lambda j: j.orden_turno == siguiente, self.jugadores)
-                )
-                t = jugador_siguiente.acuso
-                i += 1
-            return jugador_siguiente
-        while t:
-            siguiente = (self.jugador_en_turno + i) % len(self.jugadores) + 1
-            jugador_siguiente = next(
-                filter(lambda j: j.orden_turno == siguiente, self.jugadores)
-            )
-            t = jugador_siguiente.acuso or jugador_siguiente.en_trampa
-            if pasar_turno:
-                jugador_siguiente.en_trampa = False
-            i += 1
-        return jugador_siguiente
+        # una sola carga de los jugadores, el resto es sobre la ronda
+        ronda = sorted(self.jugadores, key=orden_de_turno)
+        return siguiente_de_ronda(ronda, self.jugador_en_turno, pasar_turno)
 
     @pony.db_session()
     def pasar_turno(self):
-        self.jugador_en_turno = self.siguiente_jugador(pasar_turno=True).orden_turno
+        siguiente = self.siguiente_jugador(pasar_turno=True)
+        # si todos acusaron no hay a quien pasarle el turno, queda donde estaba
+        if siguiente is not None:
+            self.jugador_en_turno = siguiente.orden_turno
 
     @pony.db_session()
     def esta_terminada(self):
-        return any([j.ganador for j in self.jugadores]) or all(
-            [j.acuso for j in self.jugadores]
-        )
+        return jugadores_terminaron(self.jugadores)
 
 
 class Jugador(db.Entity):
@@ -96,13 +106,14 @@ class Jugador(db.Entity):
     partida = pony.Optional("Partida", reverse="jugadores")
     posicion = pony.Optional(int, default=2)
     ultima_tirada = pony.Optional(int)
-    cartas = pony.Set("Carta", reverse="jugador")
     sospecha = pony.Optional("Partida", reverse="jugador_que_sospecha")
     color = pony.Optional(str)
     estado_turno = pony.Optional(str, default="N")
     acuso = pony.Required(bool, default=False)
     ganador = pony.Required(bool, default=False)
     en_trampa = pony.Required(bool, default=False)
+    # cartas en la mano, un bit por carta del catalogo
+    mano = pony.Required(int, default=0)
 
     @pony.db_session()
     def asociar_a_partida(self, partida):
@@ -115,38 +126,170 @@ class Jugador(db.Entity):
     @pony.db_session()
     def cambiar_posicion(self, nueva_pos):
         self.posicion = nueva_pos
-        if nueva_pos in TRAMPAS:
+        if nueva_pos in tablero_del_jugador(self).trampas:
             self.en_trampa = True
 
     @pony.db_session()
     def estado_turno_front(self):
-        if self.partida.esta_terminada():
-            return "T"
-        elif self.estado_turno == "SA" and self.posicion in RECINTOS.keys():
-            return self.estado_turno
-        elif self.estado_turno == "SA" and self.posicion not in RECINTOS.keys():
-            return "A"
-        else:
-            return self.estado_turno
+        return estado_turno_visible(self, self.partida.esta_terminada())
 
 
+# catalogo fijo de CARTAS, la carta con id_carta i es el bit i - 1 de las
+# mascaras de manos y sobres
 class Carta(db.Entity):
-    id_carta = pony.PrimaryKey(int, auto=True)
-    partida = pony.Optional("Partida", reverse="cartas")
-    nombre = pony.Required(str)
+    id_carta = pony.PrimaryKey(int)
+    nombre = pony.Required(str, unique=True)
     tipo = pony.Required(str)
-    jugador = pony.Optional("Jugador", reverse="cartas")
-    sobre = pony.Optional("Partida", reverse="sobre")
 
 
-# línea que sirve para debug
-pony.set_sql_debug(True)
+# bitacora de la partida, solo se agregan filas. datos es el json compacto
+# [id_jugador, entrada, to_broadcast, system] de cada accion
+class Evento(db.Entity):
+    partida = pony.Required("Partida", reverse="eventos")
+    numero = pony.Required(int)
+    datos = pony.Required(str)
+    pony.PrimaryKey(partida, numero)
+
+
+# estado de la partida despues del evento numero, para no leer toda la
+# bitacora al reconectarse
+class Instantanea(db.Entity):
+    partida = pony.Required("Partida", reverse="instantaneas")
+    numero = pony.Required(int)
+    estado = pony.Required(str)
+    pony.PrimaryKey(partida, numero)
 
-# creación de tablas para los modelos
-db.bind("sqlite", "database.sqlite", create_db=True)
+
+@db.on_connect(provider="sqlite")
+def configurar_conexion(db, conexion):
+    aplicar_pragmas(conexion, PERFILES_DB[PERFIL_DB]["pragmas"], es_hilo_lector())
+
+
+# creación de tablas para los modelos, el perfil se elige con PERFIL_DB
+db.bind("sqlite", RUTA_DB, create_db=True)
+proteger_lotes(db)
 db.generate_mapping(create_tables=True)
 
+
+@pony.db_session()
+def sembrar_cartas():
+    # una sola vez por base de datos
+    if Carta.select().exists():
+        return
+    for i, (nombre, tipo) in enumerate(CARTAS):
+        Carta(id_carta=i + 1, nombre=nombre, tipo=tipo)
+
+
+sembrar_cartas()
+
+
 # implementación de funciones
+def azar_de_partida(partida):
+    # un generador nuevo por uso a partir de la semilla y el contador, la
+    # secuencia sigue igual aunque la partida se recargue de la base de datos
+    azar = random.Random(f"{partida.semilla}:{partida.usos_azar}")
+    partida.usos_azar += 1
+    return azar
+
+
+def jugadores_terminaron(jugadores):
+    return any(j.ganador for j in jugadores) or all(j.acuso for j in jugadores)
+
+
+def tablero_del_jugador(jugador):
+    partida = jugador.partida
+    return cargar_tablero(partida.tablero if partida else TABLERO_POR_DEFECTO)
+
+
+def estado_turno_visible(jugador, partida_terminada):
+    recintos = tablero_del_jugador(jugador).recintos
+    if partida_terminada:
+        return "T"
+    elif jugador.estado_turno == "SA" and jugador.posicion in recintos.keys():
+        return jugador.estado_turno
+    elif jugador.estado_turno == "SA" and jugador.posicion not in recintos.keys():
+        return "A"
+    else:
+        return jugador.estado_turno
+
+
+def orden_de_turno(jugador):
+    # los jugadores sin orden (partida sin iniciar) van primero, como en SQL
+    return (jugador.orden_turno is not None, jugador.orden_turno or 0)
+
+
+def duenios_de_cartas(jugadores):
+    # nombre de carta -> jugador que la tiene
+    return {
+        nombre: jugador
+        for jugador in jugadores
+        for nombre in nombres_cartas(jugador.mano)
+    }
+
+
+def mascara(valores):
+    # bit i prendido si el i-esimo valor es verdadero
+    bits = 0
+    for i, valor in enumerate(valores):
+        if valor:
+            bits |= 1 << i
+    return bits
+
+
+def primero_libre(libres, inicio, cantidad):
+    # cuantos lugares despues de inicio, dando la vuelta, esta el primer bit
+    # prendido de libres. None si no hay ninguno
+    if not libres:
+        return None
+    todos = (1 << cantidad) - 1
+    rotada = ((libres >> inicio) | (libres << (cantidad - inicio))) & todos
+    return (rotada & -rotada).bit_length() - 1
+
+
+def siguiente_en_ronda(cantidad, en_turno, acusaron, en_trampa, pasar_turno=False):
+    # el bit i de las mascaras es el jugador con orden_turno i + 1. Devuelve el
+    # indice del siguiente jugador (None si ninguno puede jugar) y como quedan
+    # las trampas. Al pasar el turno salen de la trampa los que se saltean y
+    # el elegido; si estan todos en trampa, salen todos
+    todos = (1 << cantidad) - 1
+    inicio = en_turno % cantidad
+    if en_trampa == todos:
+        if pasar_turno:
+            en_trampa = 0
+        salto = primero_libre(todos & ~acusaron, inicio, cantidad)
+    else:
+        salto = primero_libre(todos & ~(acusaron | en_trampa), inicio, cantidad)
+        if pasar_turno and salto is None:
+            # se dio toda la vuelta sacando a todos de la trampa
+            en_trampa = 0
+            salto = primero_libre(todos & ~acusaron, inicio, cantidad)
+        elif pasar_turno:
+            recorridos = (1 << (salto + 1)) - 1
+            recorridos = (
+                (recorridos << inicio) | (recorridos >> (cantidad - inicio))
+            ) & todos
+            en_trampa &= ~recorridos
+    if salto is None:
+        return None, en_trampa
+    return (inicio + salto) % cantidad, en_trampa
+
+
+def siguiente_de_ronda(ronda, jugador_en_turno, pasar_turno=False):
+    # ronda: los jugadores ordenados por orden_turno, de 1 a len(ronda)
+    indice, en_trampa = siguiente_en_ronda(
+        len(ronda),
+        jugador_en_turno,
+        mascara(j.acuso for j in ronda),
+        mascara(j.en_trampa for j in ronda),
+        pasar_turno,
+    )
+    if pasar_turno:
+        for i, jugador in enumerate(ronda):
+            if jugador.en_trampa and not en_trampa >> i & 1:
+                jugador.en_trampa = False
+    return ronda[indice] if indice is not None else None
+
+
 @pony.db_session()
 def get_partida(id_partida):
     try:
@@ -174,14 +317,16 @@ def get_carta(id_carta):
 @pony.db_session()
 def crear_jugador(apodo):
     jugador = Jugador(apodo=apodo)
-    pony.commit()
+    pony.flush()
     return jugador
 
 
 @pony.db_session()
-def crear_partida(nombre, id_jugador):
+def crear_partida(nombre, id_jugador, tablero=TABLERO_POR_DEFECTO):
+    if tablero not in tableros_disponibles():
+        raise HTTPException(status_code=500, detail="No existe el tablero solicitado")
     jugador = get_jugador(id_jugador)
-    partida = Partida(nombre=nombre, creador=jugador.id_jugador)
-    pony.commit()
+    partida = Partida(nombre=nombre, creador=jugador.id_jugador, tablero=tablero)
+    pony.flush()
     jugador.asociar_a_partida(partida)
     return partida
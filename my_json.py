@@ -0,0 +1,41 @@
+import json
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_json(contenido):
+    return json.dumps(contenido, ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps_orjson(contenido):
+    return orjson.dumps(contenido, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+
+# codificador usado por los sockets y por las respuestas HTTP
+dumps = dumps_orjson if orjson is not None else dumps_json
+
+
+def usar_codificador(codificador):
+    global dumps
+    dumps = codificador
+
+
+def codificar(contenido):
+    return dumps(contenido)
+
+
+class Mensaje:
+    # mensaje ya serializado, se codifica una vez y se manda a todos los sockets
+    __slots__ = ("texto",)
+
+    def __init__(self, action, data):
+        self.texto = codificar({"action": action, "data": data})
+
+
+class RespuestaJSON(JSONResponse):
+    def render(self, content):
+        return codificar(content).encode("utf-8")
@@ -1,42 +1,107 @@
+import asyncio
 from fastapi import WebSocket
-from typing import List
+from typing import Dict, Tuple
+
+from my_json import Mensaje
+
+# segundos que se espera a un cliente antes de darlo por caido
+TIEMPO_MAXIMO_ENVIO = 5
 
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[(int, int, WebSocket)] = []
+    def __init__(self, tiempo_maximo_envio=TIEMPO_MAXIMO_ENVIO):
+        self.tiempo_maximo_envio = tiempo_maximo_envio
+        self.cierres_pendientes = set()
+        # websocket -> (id_jugador, id_partida)
+        self.conexiones: Dict[WebSocket, Tuple[int, int]] = {}
+        # indices para no recorrer todas las conexiones del servidor
+        self.conexiones_partida: Dict[int, Dict[WebSocket, int]] = {}
+        self.conexiones_jugador: Dict[int, Dict[WebSocket, int]] = {}
 
     async def connect(self, id_jugador: int, id_partida: int, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append((id_jugador, id_partida, websocket))
+        self.agregar(id_jugador, id_partida, websocket)
+
+    def agregar(self, id_jugador: int, id_partida: int, websocket: WebSocket):
+        self.conexiones[websocket] = (id_jugador, id_partida)
+        self.conexiones_partida.setdefault(id_partida, {})[websocket] = id_jugador
+        self.conexiones_jugador.setdefault(id_jugador, {})[websocket] = id_partida
 
     def disconnect(self, websocket: WebSocket):
-        for connection in self.active_connections:
-            if connection[2] == websocket:
-                self.active_connections.remove(connection)
+        conexion = self.conexiones.pop(websocket, None)
+        if conexion is None:
+            return
+        id_jugador, id_partida = conexion
+        websockets_partida = self.conexiones_partida[id_partida]
+        del websockets_partida[websocket]
+        if not websockets_partida:
+            del self.conexiones_partida[id_partida]
+        websockets_jugador = self.conexiones_jugador[id_jugador]
+        del websockets_jugador[websocket]
+        if not websockets_jugador:
+            del self.conexiones_jugador[id_jugador]
 
     def count_id_jugador_websockets(self, id_jugador):
-        ws_id_jugador = [ws for ws in self.active_connections if ws[0] == id_jugador]
-        return len(ws_id_jugador)
+        return len(self.conexiones_jugador.get(id_jugador, ()))
+
+    def websockets_de_partida(self, id_partida):
+        return list(self.conexiones_partida.get(id_partida, ()))
+
+    def websockets_de_jugador(self, id_jugador):
+        return list(self.conexiones_jugador.get(id_jugador, ()))
+
+    async def _mandar(self, websocket, mensaje):
+        # si un socket se desconecta durante el envio ya no se le manda nada
+        if websocket in self.conexiones:
+            await websocket.send_text(mensaje.texto)
+
+    async def _enviar_a(self, websocket, mensaje):
+        try:
+            await asyncio.wait_for(
+                self._mandar(websocket, mensaje), self.tiempo_maximo_envio
+            )
+        except Exception:
+            self.expulsar(websocket)
+
+    async def _enviar(self, websockets, mensaje):
+        # un cliente lento o caido no demora al resto de la partida
+        await asyncio.gather(
+            *(self._enviar_a(websocket, mensaje) for websocket in websockets)
+        )
+
+    def expulsar(self, websocket: WebSocket):
+        self.disconnect(websocket)
+        cierre = asyncio.ensure_future(self._cerrar(websocket))
+        self.cierres_pendientes.add(cierre)
+        cierre.add_done_callback(self.cierres_pendientes.discard)
+
+    async def _cerrar(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(), self.tiempo_maximo_envio)
+        except Exception:
+            pass
 
     async def send_message_to(self, action, data, id_jugador):
         if data != "":
-            for connection in self.active_connections:
-                if connection[0] == id_jugador:
-                    await connection[2].send_json({"action": action, "data": data})
+            await self._enviar(
+                self.websockets_de_jugador(id_jugador),
+                Mensaje(action, data),
+            )
 
     async def send_personal_message(self, action, data, websocket: WebSocket):
         if data != "":
-            await websocket.send_json({"action": action, "data": data})
+            await self._enviar_a(websocket, Mensaje(action, data))
 
     async def broadcast(self, action, data, id_partida):
         if data != "":
-            for connection in self.active_connections:
-                if connection[1] == id_partida:
-                    await connection[2].send_json({"action": action, "data": data})
+            await self._enviar(
+                self.websockets_de_partida(id_partida),
+                Mensaje(action, data),
+            )
 
     async def broadcast_system(self, action, data, id_partida):
         if data != "":
-            for connection in self.active_connections:
-                if connection[1] == id_partida:
-                    await connection[2].send_json({"action": action, "data": data})
+            await self._enviar(
+                self.websockets_de_partida(id_partida),
+                Mensaje(action, data),
+            )
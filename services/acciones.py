@@ -0,0 +1,149 @@
+from models import get_jugador
+from .start_game import mostrar_cartas, bruja_salem
+from .lobby import (
+    jugador_conectado_lobby,
+    jugador_desconectado_lobby,
+    escribir_chat,
+    iniciar_partida_lobby,
+)
+from .in_game import (
+    tirar_dado,
+    pasar_turno,
+    mover_jugador,
+    anunciar_sospecha,
+    responder_sospecha,
+    acusar,
+    lista_estado_jugadores,
+)
+from .estado import modifica_estado
+from .pistas import pista
+
+
+# lo que cada accion lee de data: un dict con esas claves y tipos, str si data
+# es el valor mismo. Un dict vacio es data opcional. Las demas no leen data
+FORMA_ENTRADA = {
+    "escribe_chat": {"message": str},
+    "tirar_dado": {},
+    "mover_jugador": {"nueva_posicion": int},
+    "sospechan": {"carta_monstruo": str, "carta_victima": str},
+    "respuesta_sospecha": str,
+    "acusar": {"carta_monstruo": str, "carta_victima": str, "carta_recinto": str},
+    "pista": {"turnos": object},
+}
+
+
+def entrada_valida(entrada):
+    # se revisa antes de tocar la partida, asi un mensaje mal armado no deja
+    # una jugada aplicada a medias
+    if not isinstance(entrada, dict) or not isinstance(entrada.get("action"), str):
+        return False
+    forma = FORMA_ENTRADA.get(entrada["action"])
+    data = entrada.get("data")
+    if forma is None:
+        return True
+    if forma is str:
+        return isinstance(data, str)
+    if data is None:
+        return not forma
+    return isinstance(data, dict) and all(
+        clave in data and isinstance(data[clave], tipo)
+        for clave, tipo in forma.items()
+    )
+
+
+def despachar_accion(jugador, partida, entrada):
+    respuesta = {
+        "personal_message": {
+            "action": "error_imp",
+            "data": "No existe esa accion",
+        },
+        "to_broadcast": {"action": "", "data": ""},
+        "message_to": {"action": "", "data": "", "id_jugador": ""},
+        "system": {"action": "", "data": ""},
+    }
+    if entrada["action"] == "iniciar_partida":
+        respuesta = iniciar_partida_lobby(jugador, partida)
+    if entrada["action"] == "escribe_chat":
+        respuesta = escribir_chat(jugador, entrada["data"]["message"])
+    if entrada["action"] == "tirar_dado":
+        con_rutas = bool(entrada.get("data")) and entrada["data"].get("rutas", False)
+        respuesta = tirar_dado(jugador, partida, con_rutas)
+    if entrada["action"] == "mover_jugador":
+        respuesta = mover_jugador(jugador, entrada["data"]["nueva_posicion"])
+    if entrada["action"] == "terminar_turno":
+        respuesta = pasar_turno(jugador, partida)
+    if entrada["action"] == "sospechan":
+        respuesta = anunciar_sospecha(
+            jugador,
+            entrada["data"]["carta_monstruo"],
+            entrada["data"]["carta_victima"],
+        )
+    if entrada["action"] == "respuesta_sospecha":
+        respuesta = responder_sospecha(jugador, entrada["data"])
+    if entrada["action"] == "acusar":
+        respuesta = acusar(
+            jugador,
+            partida,
+            entrada["data"]["carta_monstruo"],
+            entrada["data"]["carta_victima"],
+            entrada["data"]["carta_recinto"],
+        )
+    if entrada["action"] == "mostrar_cartas":
+        respuesta = mostrar_cartas(jugador)
+    if entrada["action"] == "pista":
+        respuesta = pista(jugador, entrada["data"]["turnos"])
+    if entrada["action"] == "estado_jugadores":
+        # la responde main con el registro de estados
+        respuesta["personal_message"] = {"action": "", "data": ""}
+    return respuesta
+
+
+def procesar_entrada(id_jugador, entrada):
+    jugador = get_jugador(id_jugador)
+    return procesar(jugador, jugador.partida, entrada)
+
+
+def procesar_entrada_en_memoria(partida, id_jugador, entrada):
+    return procesar(partida.jugador(id_jugador), partida, entrada)
+
+
+def procesar(jugador, partida, entrada):
+    respuesta = despachar_accion(jugador, partida, entrada)
+    lista = None
+    if entrada["action"] == "estado_jugadores" or modifica_estado(
+        entrada["action"], respuesta
+    ):
+        lista = lista_estado_jugadores(partida)
+    return respuesta, lista
+
+
+def conectar_jugador(id_jugador):
+    jugador = get_jugador(id_jugador)
+    partida = jugador.partida
+    if partida.iniciada == True:
+        return {"id_partida": partida.id_partida, "iniciada": True}
+    return {
+        "id_partida": partida.id_partida,
+        "iniciada": False,
+        "lobby": jugador_conectado_lobby(jugador, partida),
+    }
+
+
+def conectar_jugador_en_memoria(partida, id_jugador):
+    jugador = partida.jugador(id_jugador)
+    return {
+        "lista": lista_estado_jugadores(partida),
+        "mostrar_cartas": mostrar_cartas(jugador),
+        "bruja_salem": bruja_salem(jugador, partida),
+    }
+
+
+def desconectar_jugador(id_jugador, conexiones_restantes):
+    jugador = get_jugador(id_jugador)
+    return jugador_desconectado_lobby(jugador, jugador.partida, conexiones_restantes)
+
+
+def desconectar_jugador_en_memoria(partida, id_jugador, conexiones_restantes):
+    return jugador_desconectado_lobby(
+        partida.jugador(id_jugador), partida, conexiones_restantes
+    )
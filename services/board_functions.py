@@ -1,16 +1,47 @@
-import pony.orm as pony
-
-from board.board import *
-
-
-def posiciones_posibles_a_mover(posicion_inicial, numero_dado):
-    posiciones_posibles = []
-    matriz_movimientos = MOVIMIENTOS[numero_dado]
-    if posicion_inicial in TRAMPAS:
-        for posicion in TRAMPAS:
-            for i in np.where(matriz_movimientos[:, posicion] > 0)[0]:
-                posiciones_posibles.append(int(i))
-    else:
-        for i in np.where(matriz_movimientos[:, posicion_inicial] > 0)[0]:
-            posiciones_posibles.append(int(i))
-    return sorted(posiciones_posibles)
+from board.board import CARAS_DADO, TABLERO_POR_DEFECTO, cargar_tablero
+
+SIN_MOVIMIENTOS = ((), frozenset())
+
+
+def movimientos_posibles(tablero=TABLERO_POR_DEFECTO):
+    # se arman con el primer uso de cada tablero, no al importar
+    return cargar_tablero(tablero).movimientos()
+
+
+def casillas_posibles(posicion_inicial, numero_dado, tablero=TABLERO_POR_DEFECTO):
+    casillas, _ = movimientos_posibles(tablero).get(
+        (posicion_inicial, numero_dado), SIN_MOVIMIENTOS
+    )
+    return casillas
+
+
+def es_movimiento_valido(
+    posicion_inicial, numero_dado, nueva_posicion, tablero=TABLERO_POR_DEFECTO
+):
+    _, conjunto = movimientos_posibles(tablero).get(
+        (posicion_inicial, numero_dado), SIN_MOVIMIENTOS
+    )
+    return nueva_posicion in conjunto
+
+
+def posiciones_posibles_a_mover(
+    posicion_inicial, numero_dado, tablero=TABLERO_POR_DEFECTO
+):
+    return list(casillas_posibles(posicion_inicial, numero_dado, tablero))
+
+
+def rutas_posibles(posicion_inicial, numero_dado, tablero=TABLERO_POR_DEFECTO):
+    return cargar_tablero(tablero).rutas(posicion_inicial, numero_dado)
+
+
+def alcanzables_por_jugador(posiciones, tablero=TABLERO_POR_DEFECTO):
+    # para cada posicion, las casillas posibles con cada dado (de 1 a 6), con
+    # una sola busqueda del tablero para todos los jugadores
+    movimientos = cargar_tablero(tablero).movimientos()
+    return [
+        [
+            list(movimientos.get((posicion, dado), SIN_MOVIMIENTOS)[0])
+            for dado in CARAS_DADO
+        ]
+        for posicion in posiciones
+    ]
@@ -0,0 +1,90 @@
+from typing import Dict, List, Tuple
+
+# acciones que pueden cambiar la lista de estado_jugadores
+ACCIONES_QUE_MODIFICAN = {
+    "iniciar_partida",
+    "tirar_dado",
+    "mover_jugador",
+    "terminar_turno",
+    "sospechan",
+    "respuesta_sospecha",
+    "acusar",
+}
+
+# respuestas personales de acciones rechazadas, no modifican nada
+ACCIONES_RECHAZADAS = {"error_imp", "casilla_invalida"}
+
+
+def modifica_estado(accion, respuesta):
+    return (
+        accion in ACCIONES_QUE_MODIFICAN
+        and respuesta["personal_message"]["action"] not in ACCIONES_RECHAZADAS
+    )
+
+
+def diferencias(anterior, actual):
+    cambios = []
+    for id_jugador, fila in actual.items():
+        fila_anterior = anterior[id_jugador]
+        cambio = {
+            campo: valor
+            for campo, valor in fila.items()
+            if fila_anterior[campo] != valor
+        }
+        if cambio:
+            cambio["id_jugador"] = id_jugador
+            cambios.append(cambio)
+    return cambios
+
+
+class RegistroEstados:
+    def __init__(self):
+        # id_partida -> (version, lista de estado_jugadores, filas por id_jugador)
+        self.estados: Dict[int, Tuple[int, List[dict], Dict[int, dict]]] = {}
+
+    def version(self, id_partida):
+        if id_partida not in self.estados:
+            return 0
+        return self.estados[id_partida][0]
+
+    # guarda la nueva lista de la partida y devuelve (version, cambios),
+    # cambios es None si hay que mandar la lista completa y [] si no cambio nada
+    def actualizar(self, id_partida, lista):
+        filas = {fila["id_jugador"]: fila for fila in lista}
+        if id_partida not in self.estados:
+            self.estados[id_partida] = (1, lista, filas)
+            return 1, None
+        version, _, filas_anteriores = self.estados[id_partida]
+        if filas.keys() != filas_anteriores.keys():
+            cambios = None
+        else:
+            cambios = diferencias(filas_anteriores, filas)
+            if not cambios:
+                return version, cambios
+        version += 1
+        self.estados[id_partida] = (version, lista, filas)
+        return version, cambios
+
+    def snapshot(self, id_partida):
+        version, lista, _ = self.estados[id_partida]
+        return {"lista_jugadores": lista, "version": version}
+
+    def olvidar(self, id_partida):
+        self.estados.pop(id_partida, None)
+
+
+def pedir_estado(registro, id_partida, lista, version_cliente=None):
+    respuesta_personal = {"action": "", "data": ""}
+    if id_partida not in registro.estados:
+        registro.actualizar(id_partida, lista)
+    if version_cliente != registro.version(id_partida):
+        respuesta_personal = {
+            "action": "estado_jugadores",
+            "data": registro.snapshot(id_partida),
+        }
+    return {
+        "personal_message": respuesta_personal,
+        "to_broadcast": {"action": "", "data": ""},
+        "message_to": {"action": "", "data": "", "id_jugador": -1},
+        "system": {"action": "", "data": ""},
+    }
@@ -0,0 +1,131 @@
+import json
+
+import pony.orm as pony
+
+from models import db, get_partida
+from my_json import codificar
+from .in_game import lista_estado_jugadores
+
+# cada cuantos eventos se guarda una instantanea del estado
+INTERVALO_INSTANTANEA = 50
+
+# eventos por consulta al mandar la bitacora
+TAMANIO_PAGINA = 200
+
+# acciones que solo leen, no van a la bitacora
+ACCIONES_SIN_EVENTO = {"estado_jugadores", "mostrar_cartas", "pista"}
+
+
+def publico(mensaje):
+    # lo que vieron todos los jugadores, None si no hubo mensaje
+    return mensaje if mensaje["action"] else None
+
+
+def evento_publico(numero, evento):
+    # lo que puede ver cualquiera: [numero, id_jugador, accion, to_broadcast,
+    # system]. La entrada completa queda en el servidor para repetir y auditar
+    # la partida, puede tener lo que se mostro en privado (respuesta_sospecha)
+    id_jugador, entrada, broadcast, sistema = evento
+    return [numero, id_jugador, entrada["action"], broadcast, sistema]
+
+
+def instantanea_publica(instantanea):
+    # el volcado es para el servidor
+    if instantanea is None:
+        return None
+    return {
+        "numero": instantanea["numero"],
+        "lista_jugadores": instantanea["lista_jugadores"],
+    }
+
+
+class Bitacora:
+    # eventos de una partida en memoria: la ultima instantanea, la version
+    # publica de los eventos que vinieron despues (lo que necesita quien se
+    # reconecta) y lo que falta guardar
+    __slots__ = ("numero", "instantanea", "cola", "sin_guardar")
+
+    def __init__(self, numero=0, instantanea=None, cola=None):
+        self.numero = numero
+        self.instantanea = instantanea
+        self.cola = cola if cola is not None else []
+        self.sin_guardar = []
+
+    def registrar(self, partida, id_jugador, entrada, respuesta):
+        if entrada["action"] in ACCIONES_SIN_EVENTO:
+            return
+        self.numero += 1
+        evento = [
+            id_jugador,
+            entrada,
+            publico(respuesta["to_broadcast"]),
+            publico(respuesta["system"]),
+        ]
+        self.cola.append(evento_publico(self.numero, evento))
+        self.sin_guardar.append(("evento", self.numero, codificar(evento)))
+        if self.numero % INTERVALO_INSTANTANEA == 0:
+            self.instantanea = {
+                "numero": self.numero,
+                "lista_jugadores": lista_estado_jugadores(partida),
+                "volcado": partida.volcar(),
+            }
+            self.cola = []
+            self.sin_guardar.append(
+                ("instantanea", self.numero, codificar(self.instantanea))
+            )
+
+    def historial(self):
+        # una copia: lo que se registre despues no cambia un historial ya pedido
+        return {
+            "instantanea": instantanea_publica(self.instantanea),
+            "eventos": list(self.cola),
+        }
+
+    def tomar(self):
+        # lo que falta guardar, para el Persistidor
+        sin_guardar = self.sin_guardar
+        self.sin_guardar = []
+        return sin_guardar
+
+
+def cargar_bitacora(partida):
+    # la ultima instantanea y la cola de eventos posteriores
+    instantanea = (
+        partida.instantaneas.select().order_by(pony.desc(db.Instantanea.numero)).first()
+    )
+    desde = instantanea.numero if instantanea is not None else 0
+    cola = [
+        evento_publico(e.numero, json.loads(e.datos))
+        for e in partida.eventos.select(lambda e: e.numero > desde).order_by(
+            db.Evento.numero
+        )
+    ]
+    return Bitacora(
+        cola[-1][0] if cola else desde,
+        json.loads(instantanea.estado) if instantanea else None,
+        cola,
+    )
+
+
+def guardar_registros(registros):
+    # registros: (id_partida, tipo, numero, json) juntados por el Persistidor
+    for id_partida, tipo, numero, datos in registros:
+        if tipo == "evento":
+            db.Evento(partida=id_partida, numero=numero, datos=datos)
+        else:
+            db.Instantanea(partida=id_partida, numero=numero, estado=datos)
+
+
+def pagina_eventos(id_partida, desde, cantidad):
+    # pares (numero, linea ndjson) con la version publica de los eventos
+    # despues del cursor desde
+    partida = get_partida(id_partida)
+    eventos = pony.select(
+        (e.numero, e.datos)
+        for e in db.Evento
+        if e.partida == partida and e.numero > desde
+    )
+    return [
+        (numero, codificar(evento_publico(numero, json.loads(datos))) + "\n")
+        for numero, datos in eventos.order_by(1).limit(cantidad)
+    ]
@@ -1,13 +1,21 @@
-import pony.orm as pony
-import random
+from board.board import BIT_CARTA, mascara_cartas
+from .board_functions import (
+    alcanzables_por_jugador,
+    casillas_posibles,
+    es_movimiento_valido,
+    rutas_posibles,
+)
+from models import (
+    azar_de_partida,
+    jugadores_terminaron,
+    estado_turno_visible,
+    orden_de_turno,
+    tablero_del_jugador,
+)
 
-from .board_functions import posiciones_posibles_a_mover
-from board.board import RECINTOS, TRAMPAS
-from models import db
 
-
-def numero_dado():
-    return random.randint(1, 6)
+def numero_dado(partida):
+    return azar_de_partida(partida).randint(1, 6)
 
 
 def pasar_turno(jugador, partida):
@@ -15,6 +23,19 @@ def pasar_turno(jugador, partida):
         jugador_siguiente = partida.siguiente_jugador()
         partida.pasar_turno()
         jugador.estado_turno = "N"
+        if jugador_siguiente is None:
+            # todos acusaron, la partida termino
+            return {
+                "personal_message": {"action": "", "data": ""},
+                "to_broadcast": {"action": "", "data": ""},
+                "message_to": {"action": "", "data": "", "id_jugador": -1},
+                "system": {
+                    "action": "mensaje_sistema",
+                    "data": {
+                        "message": "Todos los jugadores acusaron. La partida termino."
+                    },
+                },
+            }
         jugador_siguiente.estado_turno = "D"
         action1 = ""
         action2 = ""
@@ -40,6 +61,7 @@ def pasar_turno(jugador, partida):
         personal_message = {"action": action1, "data": data1}
         to_broadcast = {"action": "", "data": ""}
         message_to = {"action": "", "data": "", "id_jugador": -1}
+        system = {"action": "", "data": ""}
     return {
         "personal_message": personal_message,
         "to_broadcast": to_broadcast,
@@ -55,18 +77,21 @@ def jugador_esta_en_turno(jugador, partida):
         return False
 
 
-def tirar_dado(jugador, partida):
+def tirar_dado(jugador, partida, con_rutas=False):
     if jugador_esta_en_turno(jugador, partida) and jugador.estado_turno == "D":
         action1 = "tire_dado"
         action2 = ""
         action3 = ""
         action4 = "mensaje_sistema"
-        dado = numero_dado()
+        dado = numero_dado(partida)
         jugador.ultima_tirada = dado
-        casillas_a_mover = posiciones_posibles_a_mover(jugador.posicion, dado)
+        casillas_a_mover = casillas_posibles(jugador.posicion, dado, partida.tablero)
         jugador.estado_turno = "M"
 
         data1 = {"numero_dado": dado, "casillas_a_mover": casillas_a_mover}
+        if con_rutas:
+            # camino a cada casilla para animar la ficha
+            data1["rutas"] = rutas_posibles(jugador.posicion, dado, partida.tablero)
 
         data2 = ""
         data3 = ""
@@ -105,12 +130,11 @@ def tirar_dado(jugador, partida):
 
 def mover_jugador(jugador, nueva_posicion):
     partida = jugador.partida
-    posibles_casillas = posiciones_posibles_a_mover(
-        jugador.posicion, jugador.ultima_tirada
-    )
     if (
         jugador.orden_turno == partida.jugador_en_turno
-        and nueva_posicion in posibles_casillas
+        and es_movimiento_valido(
+            jugador.posicion, jugador.ultima_tirada, nueva_posicion, partida.tablero
+        )
         and jugador.estado_turno == "M"
     ):
         jugador.cambiar_posicion(nueva_posicion)
@@ -123,7 +147,7 @@ def mover_jugador(jugador, nueva_posicion):
         data2 = ""
         data3 = ""
         data4 = ""
-        if nueva_posicion in TRAMPAS:
+        if nueva_posicion in tablero_del_jugador(jugador).trampas:
             action4 = "mensaje_sistema"
             data4 = {
                 "message": f"El jugador {jugador.apodo} cayo en una trampa, pierde un turno."
@@ -168,23 +192,27 @@ def mover_jugador(jugador, nueva_posicion):
 
 def anunciar_sospecha(jugador, carta_monstruo, carta_victima):
     partida = jugador.partida
+    recintos = tablero_del_jugador(jugador).recintos
     if (
         jugador.orden_turno == partida.jugador_en_turno
-        and jugador.posicion in RECINTOS.keys()
+        and jugador.posicion in recintos.keys()
         and jugador.estado_turno == "SA"
     ):
-        recinto = RECINTOS[jugador.posicion]
-        jugador_que_muestra = jugador
-        contador = jugador.orden_turno % partida.cantidad_jugadores()
-        jugadores_ordenados = sorted(partida.jugadores, key=lambda x: x.orden_turno)
-        while contador != jugador.orden_turno - 1:
-            cartas = []
-            for c in jugadores_ordenados[contador].cartas:
-                cartas.append(c.nombre)
-            if recinto in cartas or carta_monstruo in cartas or carta_victima in cartas:
-                jugador_que_muestra = jugadores_ordenados[contador]
-                break
-            contador = (contador + 1) % partida.cantidad_jugadores()
+        recinto = recintos[jugador.posicion]
+        # muestra el primero que tenga alguna de las cartas, en orden de turno
+        # despues del que sospecha
+        cantidad = partida.cantidad_jugadores()
+        duenios = partida.duenios_cartas()
+        candidatos = [
+            duenios[carta]
+            for carta in (recinto, carta_monstruo, carta_victima)
+            if carta in duenios and duenios[carta] != jugador
+        ]
+        jugador_que_muestra = min(
+            candidatos,
+            key=lambda j: (j.orden_turno - jugador.orden_turno) % cantidad,
+            default=jugador,
+        )
         if jugador == jugador_que_muestra:
             jugador.estado_turno = "F"
             action1 = ""
@@ -249,7 +277,7 @@ def anunciar_sospecha(jugador, carta_monstruo, carta_victima):
         to_broadcast = {"action": "", "data": ""}
         message_to = {"action": "", "data": "", "id_jugador": -1}
         system = {"action": "", "data": ""}
-    elif jugador.posicion not in RECINTOS.keys():
+    elif jugador.posicion not in recintos.keys():
         action1 = "error_imp"
         action2 = ""
         action3 = ""
@@ -283,12 +311,9 @@ def responder_sospecha(jugador, carta):
         data2 = ""
         data3 = ""
         data4 = ""
-        cartas = []
         jugador.estado_turno = "N"
         partida.jugador_que_sospecha.estado_turno = "F"
-        for c in jugador.cartas:
-            cartas.append(c.nombre)
-        if carta in cartas:
+        if jugador.mano & BIT_CARTA.get(carta, 0):
             action1 = "muestra_carta"
             data1 = {}
             action2 = ""
@@ -321,7 +346,6 @@ def responder_sospecha(jugador, carta):
     }
 
 
-@pony.db_session()
 def acusar(jugador, partida, carta_monstruo, carta_victima, carta_recinto):
     if (
         jugador.orden_turno == partida.jugador_en_turno
@@ -351,9 +375,9 @@ def acusar(jugador, partida, carta_monstruo, carta_victima, carta_recinto):
             respuesta_pasar_turno = pasar_turno(jugador, partida)
             respuesta_personal["data"] = {
                 "message": "perdiste",
-                "monstruo_en_sobre": partida.monstruo_en_sobre().nombre,
-                "victima_en_sobre": partida.victima_en_sobre().nombre,
-                "recinto_en_sobre": partida.recinto_en_sobre().nombre,
+                "monstruo_en_sobre": partida.monstruo_en_sobre(),
+                "victima_en_sobre": partida.victima_en_sobre(),
+                "recinto_en_sobre": partida.recinto_en_sobre(),
             }
             respuesta_broadcast["data"] = {
                 "perdedor": jugador.apodo,
@@ -398,17 +422,13 @@ def acusar(jugador, partida, carta_monstruo, carta_victima, carta_recinto):
     }
 
 
-@pony.db_session()
 def comprobar_cartas_sobre(partida, cartas_acusadas):
     if len(cartas_acusadas) != 3:
         return False
-    for c in partida.sobre:
-        if c.nombre not in cartas_acusadas:
-            return False
-    return True
+    # todas las cartas del sobre tienen que estar entre las acusadas
+    return not partida.mascara_sobre & ~mascara_cartas(cartas_acusadas)
 
 
-@pony.db_session()
 def estado_jugadores(partida):
     lista = lista_estado_jugadores(partida)
     respuesta_personal = {
@@ -418,10 +438,12 @@ def estado_jugadores(partida):
     return {"personal_message": respuesta_personal}
 
 
-@pony.db_session()
 def lista_estado_jugadores(partida):
+    # una sola carga de los jugadores y el fin de partida se calcula una vez
+    jugadores = sorted(partida.jugadores, key=orden_de_turno)
+    terminada = jugadores_terminaron(jugadores)
     lista = []
-    for jugador in partida.jugadores.order_by(db.Jugador.orden_turno):
+    for jugador in jugadores:
         lista.append(
             {
                 "id_jugador": jugador.id_jugador,
@@ -429,8 +451,29 @@ def lista_estado_jugadores(partida):
                 "color": jugador.color,
                 "posicion": jugador.posicion,
                 "orden": jugador.orden_turno,
-                "estado_turno": jugador.estado_turno_front(),
+                "estado_turno": estado_turno_visible(jugador, terminada),
                 "en_turno": jugador.orden_turno == partida.jugador_en_turno,
             }
         )
     return lista
+
+
+def alcanzables_partida(partida):
+    # para espectadores: las casillas a las que puede ir cada jugador con cada
+    # dado, todas de una vez
+    jugadores = [j for j in sorted(partida.jugadores, key=orden_de_turno) if j.posicion]
+    alcanzables = alcanzables_por_jugador(
+        [j.posicion for j in jugadores], partida.tablero
+    )
+    return {
+        "tablero": partida.tablero,
+        "jugadores": [
+            {
+                "id_jugador": jugador.id_jugador,
+                "apodo": jugador.apodo,
+                "posicion": jugador.posicion,
+                "alcanzables": dict(enumerate(por_dado, start=1)),
+            }
+            for jugador, por_dado in zip(jugadores, alcanzables)
+        ],
+    }
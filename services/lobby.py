@@ -32,12 +32,12 @@ def jugador_conectado_lobby(jugador, partida):
     }
 
 
-@pony.db_session()
-def jugador_desconectado_lobby(jugador, partida, manager):
+def jugador_desconectado_lobby(jugador, partida, conexiones_restantes):
+    # conexiones_restantes: websockets que le quedan al jugador, se cuentan en
+    # el event loop porque esto corre en el hilo de la base de datos
     id_jugador = jugador.id_jugador
     if partida.iniciada == False:
         jugador.eliminar_de_partida(partida)
-        pony.commit()
     jugadores = []
     for j in partida.jugadores:
         jugadores.append(j.apodo)
@@ -45,7 +45,7 @@ def jugador_desconectado_lobby(jugador, partida, manager):
     action2 = "jugador_desconectado_lobby"
     action3 = ""
     action4 = ""
-    if manager.count_id_jugador_websockets(id_jugador) == 0:
+    if conexiones_restantes == 0:
         action4 = "mensaje_sistema"
     data1 = ""
     data2 = {
@@ -56,7 +56,7 @@ def jugador_desconectado_lobby(jugador, partida, manager):
     }
     data3 = ""
     data4 = ""
-    if manager.count_id_jugador_websockets(id_jugador) == 0:
+    if conexiones_restantes == 0:
         data4 = {"message": f"El jugador {jugador.apodo} se desconecto de la partida"}
     personal_message = {"action": action1, "data": data1}
     to_broadcast = {"action": action2, "data": data2}
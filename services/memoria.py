@@ -0,0 +1,314 @@
+import asyncio
+import logging
+from typing import Dict, Set
+
+from board.board import MASCARA_TIPO, nombres_cartas
+from datos import ejecutar_db, escribir_db
+from models import (
+    db,
+    duenios_de_cartas,
+    jugadores_terminaron,
+    estado_turno_visible,
+    orden_de_turno,
+    siguiente_de_ronda,
+    tablero_del_jugador,
+)
+from .eventos import cargar_bitacora, guardar_registros
+
+logger = logging.getLogger(__name__)
+
+# segundos que se juntan cambios antes de escribirlos en la base de datos
+INTERVALO_ESCRITURA = 0.05
+
+
+# Las partidas iniciadas se juegan en memoria. Estas clases tienen la misma
+# interfaz que las entidades de models que usan las reglas de services, asi
+# las mismas funciones corren sobre la base de datos o sobre la memoria.
+class JugadorEnMemoria:
+    __slots__ = (
+        "id_jugador",
+        "apodo",
+        "orden_turno",
+        "posicion",
+        "ultima_tirada",
+        "color",
+        "estado_turno",
+        "acuso",
+        "ganador",
+        "en_trampa",
+        "mano",
+        "partida",
+    )
+
+    def cambiar_posicion(self, nueva_pos):
+        self.posicion = nueva_pos
+        if nueva_pos in tablero_del_jugador(self).trampas:
+            self.en_trampa = True
+
+    def estado_turno_front(self):
+        return estado_turno_visible(self, self.partida.esta_terminada())
+
+
+class PartidaEnMemoria:
+    __slots__ = (
+        "id_partida",
+        "nombre",
+        "iniciada",
+        "jugadores",
+        "por_id",
+        "jugador_en_turno",
+        "jugador_que_sospecha",
+        "mascara_sobre",
+        "duenios",
+        "se_jugo_bruja",
+        "tablero",
+        "semilla",
+        "usos_azar",
+        "bitacora",
+    )
+
+    def jugador(self, id_jugador):
+        return self.por_id[id_jugador]
+
+    def cantidad_jugadores(self):
+        return len(self.jugadores)
+
+    def carta_en_sobre(self, tipo):
+        return nombres_cartas(self.mascara_sobre & MASCARA_TIPO[tipo])[0]
+
+    def monstruo_en_sobre(self):
+        return self.carta_en_sobre("M")
+
+    def victima_en_sobre(self):
+        return self.carta_en_sobre("V")
+
+    def recinto_en_sobre(self):
+        return self.carta_en_sobre("R")
+
+    def duenios_cartas(self):
+        # las cartas no cambian de mano durante la partida
+        return self.duenios
+
+    def siguiente_jugador(self, pasar_turno=False):
+        return siguiente_de_ronda(self.jugadores, self.jugador_en_turno, pasar_turno)
+
+    def pasar_turno(self):
+        siguiente = self.siguiente_jugador(pasar_turno=True)
+        # si todos acusaron no hay a quien pasarle el turno, queda donde estaba
+        if siguiente is not None:
+            self.jugador_en_turno = siguiente.orden_turno
+
+    def esta_terminada(self):
+        return jugadores_terminaron(self.jugadores)
+
+    def volcar(self):
+        # copia plana de lo que cambia durante el juego, para escribirla
+        # desde el hilo de la base de datos
+        sospechador = self.jugador_que_sospecha
+        return (
+            self.id_partida,
+            self.jugador_en_turno,
+            sospechador.id_jugador if sospechador is not None else None,
+            self.se_jugo_bruja,
+            self.usos_azar,
+            tuple(
+                (
+                    j.id_jugador,
+                    j.posicion,
+                    j.ultima_tirada,
+                    j.estado_turno,
+                    j.acuso,
+                    j.ganador,
+                    j.en_trampa,
+                )
+                for j in self.jugadores
+            ),
+        )
+
+
+def cargar_partida(id_partida):
+    partida = db.Partida[id_partida]
+    if not partida.iniciada:
+        return None
+    en_memoria = PartidaEnMemoria()
+    en_memoria.id_partida = partida.id_partida
+    en_memoria.nombre = partida.nombre
+    en_memoria.iniciada = True
+    en_memoria.jugador_en_turno = partida.jugador_en_turno
+    en_memoria.se_jugo_bruja = partida.se_jugo_bruja
+    en_memoria.tablero = partida.tablero
+    en_memoria.semilla = partida.semilla
+    en_memoria.usos_azar = partida.usos_azar
+    en_memoria.mascara_sobre = partida.mascara_sobre
+    en_memoria.jugadores = []
+    en_memoria.por_id = {}
+    for j in sorted(partida.jugadores, key=orden_de_turno):
+        jugador = JugadorEnMemoria()
+        jugador.id_jugador = j.id_jugador
+        jugador.apodo = j.apodo
+        jugador.orden_turno = j.orden_turno
+        jugador.posicion = j.posicion
+        jugador.ultima_tirada = j.ultima_tirada
+        jugador.color = j.color
+        jugador.estado_turno = j.estado_turno
+        jugador.acuso = j.acuso
+        jugador.ganador = j.ganador
+        jugador.en_trampa = j.en_trampa
+        jugador.mano = j.mano
+        jugador.partida = en_memoria
+        en_memoria.jugadores.append(jugador)
+        en_memoria.por_id[jugador.id_jugador] = jugador
+    en_memoria.duenios = duenios_de_cartas(en_memoria.jugadores)
+    sospechador = partida.jugador_que_sospecha
+    en_memoria.jugador_que_sospecha = (
+        en_memoria.por_id[sospechador.id_jugador] if sospechador is not None else None
+    )
+    en_memoria.bitacora = cargar_bitacora(partida)
+    return en_memoria
+
+
+def guardar_volcados(volcados, registros=()):
+    for volcado in volcados:
+        (
+            id_partida,
+            en_turno,
+            id_sospechador,
+            se_jugo_bruja,
+            usos_azar,
+            jugadores,
+        ) = volcado
+        db.Partida[id_partida].set(
+            jugador_en_turno=en_turno,
+            jugador_que_sospecha=id_sospechador,
+            se_jugo_bruja=se_jugo_bruja,
+            usos_azar=usos_azar,
+        )
+        for id_jugador, posicion, tirada, estado, acuso, ganador, trampa in jugadores:
+            db.Jugador[id_jugador].set(
+                posicion=posicion,
+                ultima_tirada=tirada,
+                estado_turno=estado,
+                acuso=acuso,
+                ganador=ganador,
+                en_trampa=trampa,
+            )
+    guardar_registros(registros)
+
+
+class Persistidor:
+    # escribe en SQLite los cambios de las partidas en memoria sin que la
+    # jugada tenga que esperar al disco
+    def __init__(self, intervalo=INTERVALO_ESCRITURA):
+        self.intervalo = intervalo
+        self.pendientes: Dict[int, tuple] = {}
+        # eventos e instantaneas de la bitacora, en el orden en que pasaron
+        self.registros = []
+        self.escritura = None
+        # cada marca tiene un numero, todo lo marcado hasta escritas esta en
+        # la base de datos. Los que sincronizan esperan un numero
+        self.marcadas = 0
+        self.escritas = 0
+        self.esperando = []
+
+    def marcar(self, partida):
+        self.marcadas += 1
+        self.pendientes[partida.id_partida] = partida.volcar()
+        self.registros.extend(
+            (partida.id_partida, *registro) for registro in partida.bitacora.tomar()
+        )
+        if self.escritura is None:
+            self.escritura = asyncio.ensure_future(self._escribir())
+
+    async def _escribir(self):
+        try:
+            while self.pendientes or self.registros:
+                await asyncio.sleep(self.intervalo)
+                await self._escribir_pendientes()
+        finally:
+            self.escritura = None
+
+    async def _escribir_pendientes(self):
+        # los lotes se escriben de a uno: lo marcado hasta hasta esta guardado o
+        # en este lote, que si falla vuelve a pendientes
+        hasta = self.marcadas
+        lote = self.pendientes
+        registros = self.registros
+        self.pendientes = {}
+        self.registros = []
+        try:
+            await escribir_db(guardar_volcados, list(lote.values()), registros)
+        except Exception:
+            logger.exception("No se pudieron guardar las partidas %s", list(lote))
+            # se reintenta con la proxima escritura salvo que haya algo mas nuevo
+            for id_partida, volcado in lote.items():
+                self.pendientes.setdefault(id_partida, volcado)
+            self.registros[:0] = registros
+            return
+        self.escritas = max(self.escritas, hasta)
+        siguen = []
+        for numero, futuro in self.esperando:
+            if numero > self.escritas:
+                siguen.append((numero, futuro))
+            elif not futuro.done():
+                futuro.set_result(None)
+        self.esperando = siguen
+
+    async def sincronizar(self):
+        # espera a que lo marcado hasta ahora este en la base de datos. Lo que
+        # se marque despues no cuenta, asi no espera a las partidas que siguen
+        # jugando
+        if self.escritas >= self.marcadas:
+            return
+        futuro = asyncio.get_event_loop().create_future()
+        self.esperando.append((self.marcadas, futuro))
+        if self.escritura is None:
+            self.escritura = asyncio.ensure_future(self._escribir())
+        await futuro
+
+
+class MotorPartidas:
+    def __init__(self, persistidor):
+        self.persistidor = persistidor
+        self.partidas: Dict[int, PartidaEnMemoria] = {}
+        self.cargas: Dict[int, asyncio.Future] = {}
+        # partidas que se leyeron en el lobby, no se vuelven a buscar en la base
+        # de datos hasta que se inician
+        self.en_lobby: Set[int] = set()
+
+    async def obtener(self, id_partida):
+        # devuelve la partida en memoria, cargandola de la base de datos si ya
+        # esta iniciada, o None si todavia esta en el lobby
+        if id_partida in self.partidas:
+            return self.partidas[id_partida]
+        if id_partida in self.en_lobby:
+            return None
+        if id_partida not in self.cargas:
+            self.cargas[id_partida] = asyncio.ensure_future(self._cargar(id_partida))
+        return await asyncio.shield(self.cargas[id_partida])
+
+    async def _cargar(self, id_partida):
+        carga = asyncio.current_task()
+        try:
+            await self.persistidor.sincronizar()
+            partida = await ejecutar_db(cargar_partida, id_partida)
+            if partida is not None:
+                self.partidas[id_partida] = partida
+            elif self.cargas.get(id_partida) is carga:
+                # si se inicio mientras se leia, lo leido ya no vale
+                self.en_lobby.add(id_partida)
+            return partida
+        finally:
+            if self.cargas.get(id_partida) is carga:
+                del self.cargas[id_partida]
+
+    def iniciada(self, id_partida):
+        # la partida salio del lobby, la proxima vez se carga en memoria
+        self.en_lobby.discard(id_partida)
+        self.cargas.pop(id_partida, None)
+
+    def jugada(self, partida):
+        self.persistidor.marcar(partida)
+
+    def descargar(self, id_partida):
+        self.partidas.pop(id_partida, None)
+        self.en_lobby.discard(id_partida)
@@ -0,0 +1,83 @@
+from functools import lru_cache
+
+import numpy as np
+
+from board.board import TABLEROS_EN_MEMORIA, cargar_tablero
+from models import tablero_del_jugador
+
+# maxima cantidad de turnos por los que se puede pedir una pista
+MAX_TURNOS_PISTA = 10
+
+
+def calcular_probabilidades(tablero, turnos=MAX_TURNOS_PISTA):
+    # probabilidades[k, casilla, i]: probabilidad de llegar al i-esimo recinto
+    # (en orden de casilla) en a lo sumo k turnos empezando en casilla, eligiendo
+    # siempre el mejor movimiento para ese recinto. Cada turno es un paso de
+    # Markov: se promedia sobre las seis caras del dado el mejor destino
+    # alcanzable. Caer en una trampa hace perder el turno siguiente
+    alcanza = tablero.alcanzables()
+    cantidad = len(tablero.distancias)
+    recintos = sorted(tablero.recintos)
+    en_recinto = np.zeros((cantidad, len(recintos)))
+    en_recinto[recintos, np.arange(len(recintos))] = 1
+    es_trampa = np.zeros((cantidad, 1), dtype=bool)
+    es_trampa[tablero.trampas] = True
+
+    probabilidades = [en_recinto]
+    # con un turno menos, para quien cae en una trampa
+    anterior = en_recinto
+    for _ in range(turnos):
+        actual = probabilidades[-1]
+        al_llegar = np.where(es_trampa, anterior, actual)
+        # mejor destino para cada cara, origen y recinto de una sola vez
+        mejor = (alcanza[:, :, :, None] * al_llegar[None, None, :, :]).max(axis=2)
+        probabilidades.append(np.maximum(en_recinto, mejor.mean(axis=0)))
+        anterior = actual
+    return np.stack(probabilidades)
+
+
+@lru_cache(maxsize=TABLEROS_EN_MEMORIA)
+def probabilidades_de(nombre, hash_tablero):
+    # el hash hace que una definicion nueva no use lo calculado para la vieja
+    return calcular_probabilidades(cargar_tablero(nombre))
+
+
+def probabilidades_recintos(tablero, posicion, turnos):
+    probabilidades = probabilidades_de(tablero.nombre, tablero.hash)
+    return {
+        tablero.recintos[casilla]: round(float(p), 4)
+        for casilla, p in zip(
+            sorted(tablero.recintos), probabilidades[turnos, posicion]
+        )
+    }
+
+
+def pista(jugador, turnos):
+    respuesta_broadcast = {"action": "", "data": ""}
+    respuesta_to = {"action": "", "data": "", "id_jugador": -1}
+    respuesta_sistema = {"action": "", "data": ""}
+    if type(turnos) != int or not 1 <= turnos <= MAX_TURNOS_PISTA:
+        respuesta = {
+            "action": "error_imp",
+            "data": {"message": f"La pista es para 1 a {MAX_TURNOS_PISTA} turnos"},
+        }
+    elif jugador.posicion is None:
+        respuesta = {
+            "action": "error_imp",
+            "data": {"message": "Todavia no estas en el tablero"},
+        }
+    else:
+        tablero = tablero_del_jugador(jugador)
+        respuesta = {
+            "action": "pista",
+            "data": {
+                "turnos": turnos,
+                "recintos": probabilidades_recintos(tablero, jugador.posicion, turnos),
+            },
+        }
+    return {
+        "personal_message": respuesta,
+        "to_broadcast": respuesta_broadcast,
+        "message_to": respuesta_to,
+        "system": respuesta_sistema,
+    }
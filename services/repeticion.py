@@ -0,0 +1,102 @@
+import json
+import sys
+import time
+
+from board.board import TABLERO_POR_DEFECTO, cargar_tablero
+from models import azar_de_partida, duenios_de_cartas, get_partida
+from .eventos import Bitacora
+from .acciones import conectar_jugador_en_memoria, procesar_entrada_en_memoria
+from .memoria import JugadorEnMemoria, PartidaEnMemoria
+from .start_game import estado_inicial
+
+# accion de la repeticion que no llega por el websocket: el jugador se conecta
+# a la partida iniciada y, si le toco la bruja, usa el azar de la partida
+CONECTAR = "conectar"
+
+
+def partida_inicial(id_partida, semilla, jugadores, tablero=TABLERO_POR_DEFECTO):
+    # la misma partida que deja iniciar_partida_service, sin base de datos.
+    # jugadores: pares (id_jugador, apodo)
+    partida = PartidaEnMemoria()
+    partida.id_partida = id_partida
+    partida.nombre = ""
+    partida.iniciada = True
+    partida.jugador_en_turno = 1
+    partida.jugador_que_sospecha = None
+    partida.se_jugo_bruja = False
+    partida.tablero = tablero
+    partida.semilla = semilla
+    partida.usos_azar = 0
+    jugadores = sorted(jugadores)
+    estado = estado_inicial(
+        len(jugadores), cargar_tablero(tablero).puertas, azar_de_partida(partida)
+    )
+    partida.mascara_sobre = estado["sobre"]
+    partida.jugadores = []
+    partida.por_id = {}
+    for (id_jugador, apodo), inicial in zip(jugadores, estado["jugadores"]):
+        jugador = JugadorEnMemoria()
+        jugador.id_jugador = id_jugador
+        jugador.apodo = apodo
+        jugador.ultima_tirada = None
+        jugador.acuso = False
+        jugador.ganador = False
+        jugador.en_trampa = False
+        for campo, valor in inicial.items():
+            setattr(jugador, campo, valor)
+        jugador.partida = partida
+        partida.jugadores.append(jugador)
+        partida.por_id[id_jugador] = jugador
+    partida.jugadores.sort(key=lambda j: j.orden_turno)
+    partida.duenios = duenios_de_cartas(partida.jugadores)
+    partida.bitacora = Bitacora()
+    return partida
+
+
+def reproducir(partida, acciones):
+    # vuelve a correr las acciones (id_jugador, entrada) con las mismas reglas
+    # que el websocket y devuelve las respuestas
+    respuestas = []
+    for id_jugador, entrada in acciones:
+        if entrada["action"] == CONECTAR:
+            respuestas.append(conectar_jugador_en_memoria(partida, id_jugador))
+        else:
+            respuestas.append(procesar_entrada_en_memoria(partida, id_jugador, entrada))
+    return respuestas
+
+
+def grabacion_de_partida(id_partida):
+    # la grabacion que lee main, armada con la bitacora guardada. Sirve para
+    # auditar: reproducirla tiene que dar las mismas respuestas publicas
+    partida = get_partida(id_partida)
+    eventos = partida.eventos.select().order_by(lambda e: e.numero)
+    return {
+        "id_partida": partida.id_partida,
+        "semilla": partida.semilla,
+        "tablero": partida.tablero,
+        "jugadores": [[j.id_jugador, j.apodo] for j in partida.jugadores],
+        "acciones": [json.loads(e.datos)[:2] for e in eventos],
+    }
+
+
+def main(ruta):
+    # python -m services.repeticion partida.json, con un json de la forma
+    # {"id_partida", "semilla", "tablero", "jugadores": [[id, apodo]],
+    #  "acciones": [[id_jugador, entrada]]}
+    with open(ruta, encoding="utf-8") as archivo:
+        grabacion = json.load(archivo)
+    partida = partida_inicial(
+        grabacion["id_partida"],
+        grabacion["semilla"],
+        [tuple(j) for j in grabacion["jugadores"]],
+        grabacion.get("tablero", TABLERO_POR_DEFECTO),
+    )
+    inicio = time.perf_counter()
+    reproducir(partida, grabacion["acciones"])
+    segundos = time.perf_counter() - inicio
+    print(f"{len(grabacion['acciones'])} acciones en {segundos * 1e3:.1f} ms")
+    print(json.dumps(partida.volcar(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
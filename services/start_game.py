@@ -1,100 +1,77 @@
 import pony.orm as pony
-from models import db
-import random
-import numpy as np
 
-from board.board import CARTAS, PUERTAS, COLORES
-
-
-@pony.db_session()
-def iniciar_partida_service(partida):
-    partida.iniciada = True
-    asignar_orden_aleatorio(partida)
-    asignar_posiciones_iniciales(partida)
-    asignar_colores(partida)
-    crear_cartas(partida)
-    generar_sobre(partida)
-    distribuir_cartas(partida)
-
-
-@pony.db_session()
-def asignar_orden_aleatorio(partida):
-    jugadores = partida.jugadores
-    random.shuffle(list(jugadores))
-    i = 1
-    for jugador in jugadores:
-        jugador.orden_turno = i
-        if i == 1:
-            jugador.estado_turno = "D"
-        i += 1
-    return jugadores
-
-
-@pony.db_session()
-def asignar_posiciones_iniciales(partida):
-    jugadores = partida.jugadores
-    random.shuffle(list(jugadores))
-    for jugador in jugadores:
-        jugador.posicion = random.choice(PUERTAS)
-    return jugadores
-
-
-@pony.db_session()
-def asignar_colores(partida):
-    jugadores = partida.jugadores
-    random.shuffle(list(jugadores))
-    i = 0
-    for jugador in jugadores:
-        jugador.color = COLORES[i]
-        i += 1
-    return jugadores
-
-
-def tirar_dado():
-    return random.randint(1, 6)
-
-
-@pony.db_session()
-def crear_cartas(partida):
-    for carta in CARTAS:
-        carta_objeto = db.Carta(partida=partida, nombre=carta[0], tipo=carta[1])
-        partida.cartas.add(carta_objeto)
-
-
-@pony.db_session()
-def generar_sobre(partida):
-    recintos = list(partida.cartas.select(lambda c: c.tipo == "R"))
-    recinto = random.choice(recintos)
-    partida.sobre.add(recinto)
-    victimas = list(partida.cartas.select(lambda c: c.tipo == "V"))
-    victima = random.choice(victimas)
-    partida.sobre.add(victima)
-    monstruos = list(partida.cartas.select(lambda c: c.tipo == "M"))
-    monstruo = random.choice(monstruos)
-    partida.sobre.add(monstruo)
+from models import azar_de_partida
+
+from board.board import (
+    BIT_CARTA,
+    CARTAS,
+    COLORES,
+    cargar_tablero,
+    mascara_cartas,
+    nombres_cartas,
+)
+
+# tipos de las cartas que van al sobre, una de cada uno
+TIPOS_SOBRE = ("R", "V", "M")
+
+
+def estado_inicial(cantidad_jugadores, puertas, azar):
+    # todo el arranque de una partida sin tocar la base de datos: orden, color,
+    # puerta y mano de cada jugador (en el orden en que se pasan) y el sobre.
+    # azar es el generador de la partida (azar_de_partida) o un random.Random
+    ordenes = list(range(1, cantidad_jugadores + 1))
+    azar.shuffle(ordenes)
+    colores = azar.sample(COLORES, cantidad_jugadores)
+    posiciones = [azar.choice(puertas) for _ in range(cantidad_jugadores)]
+    sobre = 0
+    for tipo in TIPOS_SOBRE:
+        nombre, _ = azar.choice([c for c in CARTAS if c[1] == tipo])
+        sobre |= BIT_CARTA[nombre]
+    resto = [nombre for nombre, _ in CARTAS if not sobre & BIT_CARTA[nombre]]
+    azar.shuffle(resto)
+    # se reparte de a una carta, empezando por el primero en jugar
+    manos = [
+        mascara_cartas(resto[i::cantidad_jugadores]) for i in range(cantidad_jugadores)
+    ]
+    return {
+        "sobre": sobre,
+        "jugadores": [
+            {
+                "orden_turno": orden,
+                "estado_turno": "D" if orden == 1 else "N",
+                "color": color,
+                "posicion": posicion,
+                "mano": manos[orden - 1],
+            }
+            for orden, color, posicion in zip(ordenes, colores, posiciones)
+        ],
+    }
 
 
 @pony.db_session()
-def distribuir_cartas(partida):
-    cartas = list(partida.cartas.select(lambda c: c not in partida.sobre))
-    random.shuffle(cartas)
-    cant_jugadores = partida.cantidad_jugadores()
-    grupos_cartas = np.array_split(cartas, cant_jugadores)
-    for jugador in partida.jugadores.order_by(db.Jugador.orden_turno):
-        for carta in grupos_cartas[jugador.orden_turno - 1]:
-            jugador.cartas.add(carta)
+def iniciar_partida_service(partida, semilla=None):
+    # con la misma semilla y los mismos jugadores la partida arranca igual
+    if semilla is not None:
+        partida.set(semilla=semilla, usos_azar=0)
+    jugadores = sorted(partida.jugadores, key=lambda j: j.id_jugador)
+    estado = estado_inicial(
+        len(jugadores),
+        cargar_tablero(partida.tablero).puertas,
+        azar_de_partida(partida),
+    )
+    # una sola escritura: pony junta todo en el flush de la transaccion
+    partida.set(iniciada=True, jugador_en_turno=1, mascara_sobre=estado["sobre"])
+    for jugador, inicial in zip(jugadores, estado["jugadores"]):
+        jugador.set(**inicial)
 
 
-@pony.db_session()
 def mostrar_cartas(jugador):
     respuesta = {"action": "", "data": ""}
     respuesta_broadcast = {"action": "", "data": ""}
     respuesta_to = {"action": "", "data": "", "id_jugador": -1}
     respuesta["action"] = "mostrar_cartas"
-    data = {"cartas": []}
+    data = {"cartas": nombres_cartas(jugador.mano)}
     respuesta_sistema = {"action": "", "data": ""}
-    for carta in jugador.cartas:
-        data["cartas"].append(carta.nombre)
     respuesta["data"] = data
     return {
         "personal_message": respuesta,
@@ -104,12 +81,8 @@ def mostrar_cartas(jugador):
     }
 
 
-@pony.db_session()
 def bruja_salem(jugador, partida):
-    tiene_bruja = False
-    for carta in jugador.cartas:
-        if carta.nombre == "Bruja de Salem":
-            tiene_bruja = True
+    tiene_bruja = jugador.mano & BIT_CARTA["Bruja de Salem"]
 
     respuesta = {"action": "", "data": ""}
     respuesta_broadcast = {"action": "", "data": ""}
@@ -117,11 +90,13 @@ def bruja_salem(jugador, partida):
     respuesta_sistema = {"action": "", "data": ""}
     if tiene_bruja and not partida.se_jugo_bruja:
         partida.se_jugo_bruja = True
-        carta_random_sobre = partida.sobre.random(1)[0]
+        carta_random_sobre = azar_de_partida(partida).choice(
+            nombres_cartas(partida.mascara_sobre)
+        )
         respuesta = {
             "action": "error_imp",
             "data": {
-                "message": f"Te toco la Bruja de Salem. La carta del sobre que se te mostro es {carta_random_sobre.nombre}"
+                "message": f"Te toco la Bruja de Salem. La carta del sobre que se te mostro es {carta_random_sobre}"
             },
         }
         respuesta_sistema = {
@@ -17,13 +17,9 @@ def test_acusar():
     j3.partida = p1
     iniciar_partida_service(p1)
     pony.commit()
-    for carta in p1.sobre:
-        if carta.tipo == "M":
-            carta_monstruo = carta.nombre
-        elif carta.tipo == "V":
-            carta_victima = carta.nombre
-        elif carta.tipo == "R":
-            carta_recinto = carta.nombre
+    carta_monstruo = p1.monstruo_en_sobre()
+    carta_victima = p1.victima_en_sobre()
+    carta_recinto = p1.recinto_en_sobre()
 
     for recinto in ["Alcoba", "Biblioteca"]:
         if carta_recinto != recinto:
@@ -1,9 +1,26 @@
+import json
+import os
+
+import numpy as np
 import pony.orm as pony
+import pytest
+from fastapi import HTTPException
+
+from models import db, crear_partida
+from services.board_functions import (
+    alcanzables_por_jugador,
+    casillas_posibles,
+    es_movimiento_valido,
+    movimientos_posibles,
+    posiciones_posibles_a_mover,
+    rutas_posibles,
+)
+from services.start_game import iniciar_partida_service
+from board import board
+from board.scripts import compilar_definicion, compilar_tablero
+from board.board import PUERTAS, COLORES, DISTANCIAS, TRAMPAS
 
-from models import db
-from services.board_functions import posiciones_posibles_a_mover
-from services.start_game import asignar_posiciones_iniciales, asignar_colores
-from board.board import PUERTAS, COLORES
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
 
 
 def test_posiciones_posibles_a_mover():
@@ -65,7 +82,7 @@ def test_posiciones_iniciales():
     j1.partida = p1
     j2.partida = p1
     j3.partida = p1
-    asignar_posiciones_iniciales(p1)
+    iniciar_partida_service(p1)
     pony.commit()
 
     for jugador in p1.jugadores:
@@ -82,7 +99,7 @@ def test_posiciones_iniciales():
     j1.partida = p1
     j2.partida = p1
     j3.partida = p1
-    asignar_colores(p1)
+    iniciar_partida_service(p1)
     pony.commit()
 
     assert j1.color != j2.color
@@ -133,3 +150,253 @@ def test_pasaje_de_turno_trampa():
     assert siguiente_jugador == j3
     p1.pasar_turno()
     assert p1.jugador_en_turno == j3.orden_turno
+
+
+def posiciones_con_matrices(movimientos, posicion_inicial, numero_dado):
+    # como se calculaba antes, sobre las matrices de caminos de 1mov.csv a 6mov.csv
+    origenes = TRAMPAS if posicion_inicial in TRAMPAS else [posicion_inicial]
+    posiciones = set()
+    for origen in origenes:
+        columna = movimientos[numero_dado][:, origen]
+        posiciones.update(int(i) for i in np.where(columna > 0)[0])
+    return sorted(posiciones)
+
+
+def test_distancias_equivalen_a_las_matrices_de_movimientos():
+    movimientos = {
+        n: np.genfromtxt(os.path.join(FIXTURES, f"{n}mov.csv"), delimiter=",")
+        for n in range(1, 7)
+    }
+    assert DISTANCIAS.dtype == np.uint8
+    for posicion in range(1, 85):
+        for numero_dado in range(1, 7):
+            assert posiciones_posibles_a_mover(
+                posicion, numero_dado
+            ) == posiciones_con_matrices(movimientos, posicion, numero_dado)
+
+
+def test_tabla_de_movimientos():
+    for (posicion, numero_dado), (casillas, conjunto) in movimientos_posibles().items():
+        assert casillas == tuple(sorted(conjunto))
+        assert casillas is casillas_posibles(posicion, numero_dado)
+    # todas las trampas comparten la misma union de movimientos
+    for numero_dado in range(1, 7):
+        assert len({id(movimientos_posibles()[t, numero_dado]) for t in TRAMPAS}) == 1
+
+
+def test_es_movimiento_valido():
+    assert es_movimiento_valido(83, 1, 81)
+    assert not es_movimiento_valido(83, 1, 82)
+    assert es_movimiento_valido(22, 1, 64)
+    assert not es_movimiento_valido(83, None, 83)
+    assert not es_movimiento_valido(None, 3, 83)
+    assert casillas_posibles(83, 7) == ()
+
+
+def test_tablero_clasico_compilado():
+    tablero = np.genfromtxt(os.path.join(FIXTURES, "tablero.csv"), delimiter=",")
+    assert (board.MATRIZ_TABLERO == tablero).all()
+    clasico = board.cargar_tablero()
+    assert clasico.trampas == TRAMPAS
+    assert clasico.puertas == PUERTAS
+    # lo compilado que esta en el repositorio coincide con la definicion
+    tablas = compilar_definicion(board.leer_definicion("clasico"))
+    assert (tablas["tablero"] == clasico.tablero).all()
+    assert (tablas["distancias"] == clasico.distancias).all()
+    assert (tablas["siguientes"] == clasico.siguientes).all()
+
+
+def test_tablas_compiladas_corruptas(tmp_path):
+    tablas = compilar_definicion(board.leer_definicion("clasico"))
+    ruta = str(tmp_path / "tablero.npz")
+    board.guardar_tablas(ruta, tablas)
+    assert board.cargar_tablas(ruta)["distancias"].dtype == np.uint8
+    distancias = tablas["distancias"].copy()
+    distancias[1, 2] = 0
+    np.savez(
+        ruta,
+        hash=np.array(board.hash_tablas(tablas)),
+        **dict(tablas, distancias=distancias),
+    )
+    with pytest.raises(ValueError):
+        board.cargar_tablas(ruta)
+
+
+def test_compilador_tablero_chico():
+    # 1 - 2 - 3 en una fila, con un pasadizo de 1 a 4
+    tablas = compilar_tablero(
+        tablero=[[1, 2, 3]],
+        casillas={1: "C", 2: "C", 3: "C", 4: "R"},
+        pasadizos=[(1, 4)],
+        cantidad_casillas=5,
+    )
+    distancias = tablas["distancias"]
+    assert distancias[1].tolist() == [board.SIN_CAMINO, 0, 1, 2, 1]
+    assert distancias[4, 3] == 3
+    assert (distancias == distancias.T).all()
+
+
+TABLERO_CHICO = {
+    "nombre": "Chico",
+    "cantidad_casillas": 13,
+    "tablero": [[9, 10, 11, 12]],
+    "tipos": {"R": [1, 2, 3, 4, 5, 6, 7, 8], "T": [12]},
+    "recintos": {
+        "1": "Cochera",
+        "2": "Alcoba",
+        "3": "Biblioteca",
+        "4": "Vestibulo",
+        "5": "Panteon",
+        "6": "Bodega",
+        "7": "Salon",
+        "8": "Laboratorio",
+    },
+    "puertas": [9, 10],
+    "pasadizos": [[1, 9], [2, 9], [3, 10], [4, 10], [5, 11], [6, 11], [7, 12], [8, 12]],
+}
+
+
+@pytest.fixture
+def tableros(tmp_path, monkeypatch):
+    definiciones = tmp_path / "definiciones"
+    definiciones.mkdir()
+    clasico = os.path.join(board.DIRECTORIO_DEFINICIONES, "clasico.json")
+    (definiciones / "clasico.json").write_bytes(open(clasico, "rb").read())
+    (definiciones / "chico.json").write_text(json.dumps(TABLERO_CHICO))
+    monkeypatch.setattr(board, "DIRECTORIO_DEFINICIONES", str(definiciones))
+    monkeypatch.setattr(board, "DIRECTORIO_COMPILADOS", str(tmp_path / "compilados"))
+    board.cargar_tablero.cache_clear()
+    yield tmp_path
+    board.cargar_tablero.cache_clear()
+
+
+def test_tablero_desde_definicion(tableros, monkeypatch):
+    chico = board.cargar_tablero("chico")
+    assert board.tableros_disponibles() == ["chico", "clasico"]
+    assert chico.trampas == [12]
+    assert chico.recintos[8] == "Laboratorio"
+    assert chico.distancias[1, 12] == 4
+    assert casillas_posibles(9, 1, "chico") == (1, 2, 9, 10)
+    compilados = os.listdir(tableros / "compilados")
+    assert compilados == [f"chico-{chico.hash[:16]}.npz"]
+
+    # la segunda vez se lee de lo compilado en el disco
+    def no_compilar(definicion):
+        raise AssertionError("no tendria que compilar")
+
+    monkeypatch.setattr("board.scripts.compilar_definicion", no_compilar)
+    board.cargar_tablero.cache_clear()
+    assert (board.cargar_tablero("chico").distancias == chico.distancias).all()
+
+
+def test_tablero_cambia_la_definicion(tableros):
+    anterior = board.cargar_tablero("chico")
+    definicion = dict(TABLERO_CHICO, pasadizos=TABLERO_CHICO["pasadizos"] + [[1, 12]])
+    (tableros / "definiciones" / "chico.json").write_text(json.dumps(definicion))
+    board.cargar_tablero.cache_clear()
+    nuevo = board.cargar_tablero("chico")
+    assert nuevo.hash != anterior.hash
+    assert nuevo.distancias[1, 12] == 1
+    assert len(os.listdir(tableros / "compilados")) == 2
+
+
+def test_definiciones_invalidas(tableros):
+    definicion = dict(TABLERO_CHICO, puertas=[9, 99])
+    (tableros / "definiciones" / "rota.json").write_text(json.dumps(definicion))
+    with pytest.raises(ValueError):
+        board.cargar_tablero("rota")
+    with pytest.raises(ValueError):
+        board.cargar_tablero("../board/definiciones/clasico")
+    assert board.cargar_tablero.cache_info().maxsize == board.TABLEROS_EN_MEMORIA
+
+
+def test_partida_con_otro_tablero(tableros):
+    with pony.db_session:
+        jugador = db.Jugador(apodo="tematico")
+        pony.flush()
+        with pytest.raises(HTTPException):
+            crear_partida("Partida sin tablero", jugador.id_jugador, "no existe")
+        partida = crear_partida("Partida chica", jugador.id_jugador, "chico")
+        iniciar_partida_service(partida)
+        assert partida.tablero == "chico"
+        assert jugador.posicion in (9, 10)
+        jugador.cambiar_posicion(12)
+        assert jugador.en_trampa
+        jugador.estado_turno = "SA"
+        jugador.posicion = 8
+        assert jugador.estado_turno_front() == "SA"
+
+
+def test_rutas_por_caminos_minimos():
+    clasico = board.cargar_tablero()
+    for posicion in range(1, 85):
+        for numero_dado in range(1, 7):
+            rutas = rutas_posibles(posicion, numero_dado)
+            assert sorted(rutas) == list(casillas_posibles(posicion, numero_dado))
+            for destino, ruta in rutas.items():
+                assert ruta[0] == posicion and ruta[-1] == destino
+                pasos = list(zip(ruta, ruta[1:]))
+                if posicion in TRAMPAS and len(ruta) > 1 and ruta[1] in TRAMPAS:
+                    # salir por otra trampa no cuesta pasos
+                    pasos = pasos[1:]
+                assert all(clasico.distancias[a, b] == 1 for a, b in pasos)
+                assert len(pasos) <= numero_dado
+                if posicion not in TRAMPAS:
+                    assert len(pasos) == clasico.distancias[posicion, destino]
+
+
+def test_alcanzables_por_jugador():
+    posiciones = list(range(1, 85))
+    alcanzables = alcanzables_por_jugador(posiciones)
+    assert len(alcanzables) == len(posiciones)
+    for posicion, por_dado in zip(posiciones, alcanzables):
+        assert por_dado == [
+            posiciones_posibles_a_mover(posicion, dado) for dado in range(1, 7)
+        ]
+    assert alcanzables_por_jugador([]) == []
+
+
+def test_varios_hilos_compilan_el_mismo_tablero(tableros):
+    from concurrent.futures import ThreadPoolExecutor
+
+    # sin el cache de cargar_tablero, como cuando varios hilos piden a la vez
+    # un tablero que todavia no esta en el cache
+    cargar = board.cargar_tablero.__wrapped__
+    with ThreadPoolExecutor(max_workers=8) as hilos:
+        cargados = list(hilos.map(lambda _: cargar("chico"), range(8)))
+    assert all((t.distancias == cargados[0].distancias).all() for t in cargados)
+    assert os.listdir(tableros / "compilados") == [f"chico-{cargados[0].hash[:16]}.npz"]
+
+
+def test_tablero_sin_poder_guardar(tableros, monkeypatch):
+    def sin_permiso(ruta, tablas):
+        raise PermissionError(13, "Permission denied", ruta)
+
+    monkeypatch.setattr(board, "guardar_tablas", sin_permiso)
+    chico = board.cargar_tablero("chico")
+    assert chico.distancias[1, 12] == 4
+    assert not os.path.exists(tableros / "compilados")
+
+
+def test_importar_el_tablero_no_lee_archivos():
+    import subprocess
+    import sys
+
+    # el arranque tiene que seguir siendo rapido: ni la definicion ni las
+    # tablas del clasico se leen hasta el primer uso
+    codigo = """
+import sys
+abiertos = []
+sys.addaudithook(lambda evento, args: evento == "open" and abiertos.append(str(args[0])))
+import board.board
+print([a for a in abiertos if a.endswith((".json", ".npz"))])
+"""
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    salida = subprocess.run(
+        [sys.executable, "-c", codigo],
+        cwd=raiz,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert salida.stdout.strip() == "[]"
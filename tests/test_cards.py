@@ -1,8 +1,23 @@
+import random
+
 import pony.orm as pony
 
+from board.board import (
+    CARTAS,
+    COLORES,
+    MASCARA_TIPO,
+    PUERTAS,
+    mascara_cartas,
+    nombres_cartas,
+)
 from models import db
 from services.in_game import comprobar_cartas_sobre
-from services.start_game import iniciar_partida_service, mostrar_cartas
+from services.start_game import (
+    TIPOS_SOBRE,
+    estado_inicial,
+    iniciar_partida_service,
+    mostrar_cartas,
+)
 
 
 @pony.db_session
@@ -18,14 +33,16 @@ def test_distribuir_cartas():
     iniciar_partida_service(p1)
     pony.commit()
 
-    assert len(p1.cartas) == 21
-    assert len(p1.sobre) == 3
-    assert len(j1.cartas) + len(j2.cartas) + len(j3.cartas) + len(p1.sobre) == len(
-        p1.cartas
-    )
-    assert abs(len(j1.cartas) - len(j2.cartas)) < 2
-    assert abs(len(j1.cartas) - len(j3.cartas)) < 2
-    assert abs(len(j2.cartas) - len(j3.cartas)) < 2
+    assert db.Carta.select().count() == len(CARTAS)
+    cartas = [bin(m).count("1") for m in (j1.mano, j2.mano, j3.mano)]
+    for tipo in ("R", "V", "M"):
+        assert bin(p1.mascara_sobre & MASCARA_TIPO[tipo]).count("1") == 1
+    assert not p1.mascara_sobre & MASCARA_TIPO["E"]
+    # ninguna carta en dos lugares y estan todas
+    assert j1.mano & j2.mano == j1.mano & j3.mano == j2.mano & j3.mano == 0
+    assert (j1.mano | j2.mano | j3.mano) & p1.mascara_sobre == 0
+    assert j1.mano | j2.mano | j3.mano | p1.mascara_sobre == 2 ** len(CARTAS) - 1
+    assert max(cartas) - min(cartas) < 2
 
 
 @pony.db_session
@@ -41,15 +58,15 @@ def test_mostrar_cartas():
     iniciar_partida_service(p1)
     pony.commit()
 
-    assert mostrar_cartas(j1)["personal_message"]["data"]["cartas"] == [
-        c.nombre for c in j1.cartas
-    ]
-    assert mostrar_cartas(j2)["personal_message"]["data"]["cartas"] == [
-        c.nombre for c in j2.cartas
-    ]
-    assert mostrar_cartas(j3)["personal_message"]["data"]["cartas"] == [
-        c.nombre for c in j3.cartas
-    ]
+    assert mostrar_cartas(j1)["personal_message"]["data"]["cartas"] == nombres_cartas(
+        j1.mano
+    )
+    assert mostrar_cartas(j2)["personal_message"]["data"]["cartas"] == nombres_cartas(
+        j2.mano
+    )
+    assert mostrar_cartas(j3)["personal_message"]["data"]["cartas"] == nombres_cartas(
+        j3.mano
+    )
 
 
 @pony.db_session
@@ -65,7 +82,95 @@ def test_comprobar_cartas_sobre():
     iniciar_partida_service(p1)
     pony.commit()
 
-    cartas_acusadas = [c.nombre for c in p1.sobre]
+    cartas_acusadas = nombres_cartas(p1.mascara_sobre)
 
     assert comprobar_cartas_sobre(p1, cartas_acusadas)
     assert not comprobar_cartas_sobre(p1, cartas_acusadas[:1])
+
+
+def test_mascaras_de_cartas():
+    nombres = [nombre for nombre, _ in CARTAS]
+    assert nombres_cartas(mascara_cartas(nombres)) == nombres
+    assert nombres_cartas(mascara_cartas(["Momia", "Alcoba", "no es carta"])) == [
+        "Alcoba",
+        "Momia",
+    ]
+    assert nombres_cartas(0) == []
+    assert nombres_cartas(MASCARA_TIPO["E"]) == ["Bruja de Salem"]
+    assert sum(bin(m).count("1") for m in MASCARA_TIPO.values()) == len(CARTAS)
+
+
+@pony.db_session
+def test_iniciar_partida_no_crea_cartas(monkeypatch):
+    jugadores = [db.Jugador(apodo=f"j{i}") for i in range(6)]
+    pony.flush()
+    partida = db.Partida(nombre="Partida sin cartas nuevas", creador=jugadores[0])
+    for jugador in jugadores:
+        jugador.asociar_a_partida(partida)
+    pony.commit()
+    sentencias = []
+    ejecutar = db._exec_sql
+
+    def contar(sql, *args, **kwargs):
+        sentencias.append(sql)
+        return ejecutar(sql, *args, **kwargs)
+
+    monkeypatch.setattr(db, "_exec_sql", contar, raising=False)
+    iniciar_partida_service(partida)
+    pony.commit()
+    # un UPDATE de la partida y uno por jugador
+    assert len(sentencias) == 1 + len(jugadores)
+    assert not any(sql.startswith("INSERT") for sql in sentencias)
+    assert db.Carta.select().count() == len(CARTAS)
+
+
+def test_estado_inicial():
+    for cantidad in range(2, 7):
+        estado = estado_inicial(cantidad, PUERTAS, random.Random(cantidad))
+        jugadores = estado["jugadores"]
+        assert sorted(j["orden_turno"] for j in jugadores) == list(
+            range(1, cantidad + 1)
+        )
+        assert [j["estado_turno"] == "D" for j in jugadores].count(True) == 1
+        assert len({j["color"] for j in jugadores}) == cantidad
+        assert all(j["color"] in COLORES for j in jugadores)
+        assert all(j["posicion"] in PUERTAS for j in jugadores)
+        manos = [j["mano"] for j in jugadores]
+        # cada carta esta en un solo lugar y las manos difieren en a lo sumo una
+        todas = estado["sobre"]
+        for mano in manos:
+            assert not todas & mano
+            todas |= mano
+        assert todas == 2 ** len(CARTAS) - 1
+        tamanios = [bin(mano).count("1") for mano in manos]
+        assert max(tamanios) - min(tamanios) < 2
+    assert estado_inicial(4, PUERTAS, random.Random(7)) == estado_inicial(
+        4, PUERTAS, random.Random(7)
+    )
+
+
+def test_reparto_uniforme():
+    cantidad = 3
+    partidas = 6000
+    azar = random.Random(0)
+    en_sobre = {nombre: 0 for nombre, _ in CARTAS}
+    en_mano = {(orden, nombre): 0 for orden in range(1, 4) for nombre, _ in CARTAS}
+    for _ in range(partidas):
+        estado = estado_inicial(cantidad, PUERTAS, azar)
+        for nombre in nombres_cartas(estado["sobre"]):
+            en_sobre[nombre] += 1
+        for jugador in estado["jugadores"]:
+            for nombre in nombres_cartas(jugador["mano"]):
+                en_mano[jugador["orden_turno"], nombre] += 1
+
+    def cerca(veces, probabilidad):
+        # a menos de 5 desvios de lo esperado
+        desvio = (partidas * probabilidad * (1 - probabilidad)) ** 0.5
+        return abs(veces - partidas * probabilidad) <= 5 * desvio
+
+    for nombre, tipo in CARTAS:
+        cantidad_tipo = len([c for c in CARTAS if c[1] == tipo])
+        al_sobre = 1 / cantidad_tipo if tipo in TIPOS_SOBRE else 0
+        assert cerca(en_sobre[nombre], al_sobre)
+        for orden in range(1, cantidad + 1):
+            assert cerca(en_mano[orden, nombre], (1 - al_sobre) / cantidad)
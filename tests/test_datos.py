@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
+import pony.orm as pony
+import pytest
+
+from datos import (
+    PERFILES_DB,
+    Muestreo,
+    aplicar_pragmas,
+    ejecutar_db,
+    escribir_db,
+    leer_db,
+)
+from models import db
+
+
+def hilo_y_sesion():
+    return threading.current_thread().name, pony.core.local.db_session is not None
+
+
+def test_ejecutar_db_fuera_del_event_loop():
+    nombre_hilo, en_sesion = asyncio.run(ejecutar_db(hilo_y_sesion))
+    assert nombre_hilo.startswith("db")
+    assert nombre_hilo != threading.current_thread().name
+    assert en_sesion
+
+
+def test_ejecutar_db_no_bloquea_el_event_loop():
+    async def escenario():
+        latidos = 0
+
+        async def latir():
+            nonlocal latidos
+            while True:
+                await asyncio.sleep(0.01)
+                latidos += 1
+
+        latido = asyncio.ensure_future(latir())
+        await ejecutar_db(time.sleep, 0.3)
+        latido.cancel()
+        return latidos
+
+    assert asyncio.run(escenario()) >= 10
+
+
+def test_ejecutar_db_devuelve_datos_y_errores():
+    def crear_y_contar(apodo):
+        db.Jugador(apodo=apodo)
+        pony.flush()
+        return pony.count(j for j in db.Jugador if j.apodo == apodo)
+
+    def fallar():
+        raise ValueError("falla en la base de datos")
+
+    assert asyncio.run(ejecutar_db(crear_y_contar, "jugador del pool")) == 1
+    with pytest.raises(ValueError):
+        asyncio.run(ejecutar_db(fallar))
+
+
+def test_ejecutar_db_no_retiene_entidades():
+    def crear_jugador_suelto():
+        jugador = db.Jugador(apodo="suelto")
+        pony.flush()
+        return jugador
+
+    jugador = asyncio.run(ejecutar_db(crear_jugador_suelto))
+    with pytest.raises(pony.DatabaseSessionIsOver):
+        jugador.apodo
+
+
+def test_ejecutar_db_ve_escrituras_de_otras_conexiones():
+    with pony.db_session:
+        jugador = db.Jugador(apodo="antes")
+    id_jugador = jugador.id_jugador
+
+    def leer_apodo(id_jugador):
+        return db.Jugador[id_jugador].apodo
+
+    def renombrar(id_jugador, apodo):
+        db.Jugador[id_jugador].apodo = apodo
+
+    assert asyncio.run(ejecutar_db(leer_apodo, id_jugador)) == "antes"
+    with pony.db_session:
+        db.Jugador[id_jugador].apodo = "otra conexion"
+    assert asyncio.run(ejecutar_db(leer_apodo, id_jugador)) == "otra conexion"
+    asyncio.run(ejecutar_db(renombrar, id_jugador, "pool"))
+    with pony.db_session:
+        assert db.Jugador[id_jugador].apodo == "pool"
+
+
+def test_ejecutar_db_reintenta_conflictos():
+    intentos = []
+
+    def chocar_una_vez():
+        intentos.append(1)
+        if len(intentos) == 1:
+            raise pony.OptimisticCheckError("otro jugador modifico la partida")
+        return len(intentos)
+
+    assert asyncio.run(ejecutar_db(chocar_una_vez)) == 2
+
+
+def test_escribir_db_junta_escrituras_en_un_commit():
+    commits = []
+    original = db.provider.commit
+
+    def contar_commit(*args, **kwargs):
+        commits.append(threading.current_thread().name)
+        return original(*args, **kwargs)
+
+    def crear(apodo):
+        jugador = db.Jugador(apodo=apodo)
+        pony.flush()
+        return jugador.id_jugador
+
+    async def escenario():
+        return await asyncio.gather(
+            *(escribir_db(crear, f"agrupado {i}") for i in range(20))
+        )
+
+    db.provider.commit = contar_commit
+    try:
+        ids = asyncio.run(escenario())
+    finally:
+        db.provider.commit = original
+    assert len(set(ids)) == 20
+    assert len(commits) == 1
+    assert commits[0].startswith("escritor")
+    with pony.db_session:
+        # cuando el futuro se resuelve la escritura ya esta guardada
+        assert pony.count(j for j in db.Jugador if j.apodo.startswith("agrupado")) == 20
+
+
+def test_escribir_db_aisla_errores_del_lote():
+    def crear(apodo):
+        db.Jugador(apodo=apodo)
+        pony.flush()
+        return apodo
+
+    def fallar():
+        db.Jugador(apodo="no se guarda")
+        raise ValueError("falla una escritura")
+
+    async def escenario():
+        return await asyncio.gather(
+            escribir_db(crear, "lote 1"),
+            escribir_db(fallar),
+            escribir_db(crear, "lote 2"),
+            return_exceptions=True,
+        )
+
+    primero, error, segundo = asyncio.run(escenario())
+    assert (primero, segundo) == ("lote 1", "lote 2")
+    assert isinstance(error, ValueError)
+    with pony.db_session:
+        apodos = pony.select(j.apodo for j in db.Jugador)[:]
+        assert "lote 1" in apodos and "lote 2" in apodos
+        assert "no se guarda" not in apodos
+
+
+def test_sql_debug_apagado_por_defecto():
+    def debug_del_hilo():
+        return pony.core.local.debug
+
+    assert not asyncio.run(ejecutar_db(debug_del_hilo))
+    assert not asyncio.run(leer_db(debug_del_hilo))
+
+
+def test_muestreo_del_sql_debug():
+    registro = logging.LogRecord(
+        "pony.orm.sql", logging.INFO, "", 0, "SELECT", (), None
+    )
+    assert not any(Muestreo(0).filter(registro) for _ in range(100))
+    assert all(Muestreo(1).filter(registro) for _ in range(100))
+    pasan = sum(Muestreo(0.1).filter(registro) for _ in range(10000))
+    assert 500 < pasan < 1500
+
+
+def test_pragmas_del_perfil_produccion(tmp_path):
+    conexion = sqlite3.connect(tmp_path / "produccion.sqlite")
+    aplicar_pragmas(conexion, PERFILES_DB["produccion"]["pragmas"])
+    assert conexion.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conexion.execute("PRAGMA synchronous").fetchone()[0] == 1
+    assert conexion.execute("PRAGMA cache_size").fetchone()[0] == -64 * 1024
+    conexion.close()
+
+
+def test_leer_db_usa_conexiones_de_solo_lectura():
+    with pony.db_session:
+        jugador = db.Jugador(apodo="lector")
+    id_jugador = jugador.id_jugador
+
+    def leer(id_jugador):
+        return threading.current_thread().name, db.Jugador[id_jugador].apodo
+
+    def renombrar(id_jugador):
+        db.Jugador[id_jugador].apodo = "no se puede"
+
+    nombre_hilo, apodo = asyncio.run(leer_db(leer, id_jugador))
+    assert nombre_hilo.startswith("lector")
+    assert apodo == "lector"
+    with pytest.raises(pony.OperationalError):
+        asyncio.run(leer_db(renombrar, id_jugador))
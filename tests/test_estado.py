@@ -0,0 +1,83 @@
+import pony.orm as pony
+
+from models import db
+from services.estado import (
+    RegistroEstados,
+    diferencias,
+    modifica_estado,
+    pedir_estado,
+)
+from services.in_game import lista_estado_jugadores
+from services.start_game import iniciar_partida_service
+
+
+def respuesta_con(action):
+    return {"personal_message": {"action": action, "data": ""}}
+
+
+def test_modifica_estado():
+    assert modifica_estado("mover_jugador", respuesta_con("me_movi"))
+    assert modifica_estado("respuesta_sospecha", respuesta_con("no_carta"))
+    assert modifica_estado("terminar_turno", respuesta_con(""))
+    assert not modifica_estado("mover_jugador", respuesta_con("casilla_invalida"))
+    assert not modifica_estado("tirar_dado", respuesta_con("error_imp"))
+    assert not modifica_estado("escribe_chat", respuesta_con(""))
+    assert not modifica_estado("mostrar_cartas", respuesta_con("mostrar_cartas"))
+
+
+def test_diferencias():
+    anterior = {
+        1: {"id_jugador": 1, "posicion": 2, "estado_turno": "D", "en_turno": True},
+        2: {"id_jugador": 2, "posicion": 4, "estado_turno": "N", "en_turno": False},
+    }
+    actual = {
+        1: {"id_jugador": 1, "posicion": 8, "estado_turno": "SA", "en_turno": True},
+        2: {"id_jugador": 2, "posicion": 4, "estado_turno": "N", "en_turno": False},
+    }
+
+    assert diferencias(anterior, actual) == [
+        {"posicion": 8, "estado_turno": "SA", "id_jugador": 1}
+    ]
+    assert diferencias(actual, actual) == []
+
+
+def test_registro_estados_versiones():
+    registro = RegistroEstados()
+    lista = [
+        {"id_jugador": 1, "posicion": 2, "estado_turno": "D"},
+        {"id_jugador": 2, "posicion": 4, "estado_turno": "N"},
+    ]
+
+    assert registro.version(7) == 0
+    assert registro.actualizar(7, lista) == (1, None)
+    assert registro.actualizar(7, [dict(f) for f in lista]) == (1, [])
+    movido = [dict(lista[0], posicion=8), lista[1]]
+    assert registro.actualizar(7, movido) == (2, [{"posicion": 8, "id_jugador": 1}])
+    assert registro.actualizar(7, movido[:1]) == (3, None)
+    assert registro.snapshot(7) == {"lista_jugadores": movido[:1], "version": 3}
+    registro.olvidar(7)
+    assert registro.version(7) == 0
+
+
+@pony.db_session
+def test_pedir_estado():
+    j1 = db.Jugador(apodo="j1")
+    j2 = db.Jugador(apodo="j2")
+    pony.flush()
+    partida = db.Partida(nombre="Partida para pedir estado", creador=j1)
+    j1.asociar_a_partida(partida)
+    j2.asociar_a_partida(partida)
+    iniciar_partida_service(partida)
+    pony.commit()
+    registro = RegistroEstados()
+
+    lista = lista_estado_jugadores(partida)
+
+    respuesta = pedir_estado(registro, partida.id_partida, lista)
+    assert respuesta["personal_message"]["action"] == "estado_jugadores"
+    assert respuesta["personal_message"]["data"]["version"] == 1
+    assert len(respuesta["personal_message"]["data"]["lista_jugadores"]) == 2
+    respuesta_al_dia = pedir_estado(registro, partida.id_partida, lista, 1)
+    assert respuesta_al_dia["personal_message"]["data"] == ""
+    respuesta_atrasada = pedir_estado(registro, partida.id_partida, lista, 0)
+    assert respuesta_atrasada["personal_message"]["data"]["version"] == 1
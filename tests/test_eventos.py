@@ -0,0 +1,146 @@
+import asyncio
+import json
+
+import pony.orm as pony
+
+from models import db
+from board.board import nombres_cartas
+from services.acciones import conectar_jugador_en_memoria, procesar_entrada_en_memoria
+from services.eventos import INTERVALO_INSTANTANEA, pagina_eventos
+from services.memoria import (
+    MotorPartidas,
+    Persistidor,
+    cargar_partida,
+    guardar_volcados,
+)
+from services.repeticion import (
+    CONECTAR,
+    grabacion_de_partida,
+    partida_inicial,
+    reproducir,
+)
+from .test_memoria import crear_partida_iniciada, jugador_en_turno
+
+
+def jugar(partida, cantidad):
+    # tira y pasa el turno, registrando cada accion como lo hace main
+    for i in range(cantidad):
+        jugador = jugador_en_turno(partida)
+        accion = "terminar_turno" if i % 2 else "tirar_dado"
+        entrada = {"action": accion, "data": {}}
+        respuesta, _ = procesar_entrada_en_memoria(partida, jugador.id_jugador, entrada)
+        partida.bitacora.registrar(partida, jugador.id_jugador, entrada, respuesta)
+
+
+def test_bitacora_con_instantaneas():
+    id_partida = crear_partida_iniciada(3)
+    with pony.db_session:
+        partida = cargar_partida(id_partida)
+    assert partida.bitacora.historial() == {"instantanea": None, "eventos": []}
+
+    jugar(partida, INTERVALO_INSTANTANEA + 3)
+    partida.bitacora.registrar(
+        partida, 1, {"action": "pista", "data": {"turnos": 2}}, {}
+    )
+    historial = partida.bitacora.historial()
+    assert historial["instantanea"]["numero"] == INTERVALO_INSTANTANEA
+    assert [e[0] for e in historial["eventos"]] == [
+        INTERVALO_INSTANTANEA + i for i in (1, 2, 3)
+    ]
+    numero, id_jugador, accion, broadcast, sistema = historial["eventos"][0]
+    assert accion == "tirar_dado"
+    assert set(historial["instantanea"]) == {"numero", "lista_jugadores"}
+    assert broadcast is None or broadcast["action"]
+
+    registros = [(id_partida, *r) for r in partida.bitacora.tomar()]
+    assert len(registros) == INTERVALO_INSTANTANEA + 4
+    assert partida.bitacora.tomar() == []
+    with pony.db_session:
+        guardar_volcados([partida.volcar()], registros)
+    with pony.db_session:
+        recargada = cargar_partida(id_partida)
+        assert recargada.bitacora.numero == INTERVALO_INSTANTANEA + 3
+    assert recargada.bitacora.historial() == json.loads(json.dumps(historial))
+
+
+def test_persistidor_guarda_la_bitacora():
+    id_partida = crear_partida_iniciada(2)
+
+    async def escenario():
+        motor = MotorPartidas(Persistidor(intervalo=0.01))
+        partida = await motor.obtener(id_partida)
+        jugar(partida, 4)
+        motor.jugada(partida)
+        await motor.persistidor.sincronizar()
+
+    asyncio.run(escenario())
+    with pony.db_session:
+        pagina = pagina_eventos(id_partida, 1, 10)
+    assert [numero for numero, _ in pagina] == [2, 3, 4]
+    assert json.loads(pagina[0][1])[0] == 2
+    assert json.loads(pagina[0][1])[2] == "terminar_turno"
+
+
+def test_grabacion_de_la_bitacora():
+    id_partida = crear_partida_iniciada(3)
+    with pony.db_session:
+        partida = cargar_partida(id_partida)
+    jugar(partida, 20)
+    registros = [(id_partida, *r) for r in partida.bitacora.tomar()]
+    with pony.db_session:
+        guardar_volcados([partida.volcar()], registros)
+    with pony.db_session:
+        grabacion = grabacion_de_partida(id_partida)
+
+    repetida = partida_inicial(
+        id_partida,
+        grabacion["semilla"],
+        [tuple(j) for j in grabacion["jugadores"]],
+        grabacion["tablero"],
+    )
+    reproducir(repetida, grabacion["acciones"])
+    assert repetida.volcar() == partida.volcar()
+
+
+def test_la_carta_mostrada_no_sale_de_la_bitacora():
+    id_partida = crear_partida_iniciada(3)
+    with pony.db_session:
+        partida = cargar_partida(id_partida)
+    sospecha, responde, tercero = partida.jugadores
+    sospecha.estado_turno = "S"
+    responde.estado_turno = "MS"
+    partida.jugador_que_sospecha = sospecha
+    carta = nombres_cartas(responde.mano)[0]
+    entrada = {"action": "respuesta_sospecha", "data": carta}
+    respuesta, _ = procesar_entrada_en_memoria(partida, responde.id_jugador, entrada)
+    assert respuesta["message_to"]["action"] == "carta_seleccionada"
+    partida.bitacora.registrar(partida, responde.id_jugador, entrada, respuesta)
+
+    # lo que recibe el tercero al reconectarse y lo que manda el endpoint
+    assert carta not in json.dumps(partida.bitacora.historial())
+    registros = [(id_partida, *r) for r in partida.bitacora.tomar()]
+    with pony.db_session:
+        guardar_volcados([partida.volcar()], registros)
+    with pony.db_session:
+        assert carta not in json.dumps(cargar_partida(id_partida).bitacora.historial())
+        assert carta not in "".join(l for _, l in pagina_eventos(id_partida, 0, 10))
+        # la entrada completa sigue guardada para repetir la partida
+        assert grabacion_de_partida(id_partida)["acciones"] == [
+            [responde.id_jugador, entrada]
+        ]
+
+
+def test_historial_sin_la_propia_conexion():
+    id_partida = crear_partida_iniciada(3)
+    with pony.db_session:
+        partida = cargar_partida(id_partida)
+    jugar(partida, 2)
+    # como main: se pide el historial, se registra la conexion y despues se manda
+    id_jugador = partida.jugadores[2].id_jugador
+    historial = partida.bitacora.historial()
+    conexion = conectar_jugador_en_memoria(partida, id_jugador)
+    partida.bitacora.registrar(
+        partida, id_jugador, {"action": CONECTAR}, conexion["bruja_salem"]
+    )
+    assert [e[2] for e in historial["eventos"]] == ["tirar_dado", "terminar_turno"]
+    assert partida.bitacora.historial()["eventos"][-1][2] == CONECTAR
@@ -1,7 +1,13 @@
+import itertools
+from types import SimpleNamespace
+
 import pony.orm as pony
+
+from board.board import mascara_cartas
 from services.start_game import iniciar_partida_service
 from services.in_game import (
     estado_jugadores,
+    lista_estado_jugadores,
     numero_dado,
     pasar_turno,
     jugador_esta_en_turno,
@@ -11,7 +17,7 @@ from services.in_game import (
     responder_sospecha,
 )
 from services.board_functions import posiciones_posibles_a_mover
-from models import Partida, Jugador, db
+from models import Partida, Jugador, db, siguiente_de_ronda
 
 
 @pony.db_session
@@ -150,6 +156,26 @@ def test_tirar_dado_vale():
     assert respuesta["message_to"]["data"] == ""
     assert type(respuesta["message_to"]["id_jugador"]) == int
     assert j2.estado_turno == "M"
+    assert "rutas" not in respuesta["personal_message"]["data"]
+
+
+@pony.db_session
+def test_tirar_dado_con_rutas():
+    j1 = db.Jugador(apodo="j1")
+    pony.flush()
+    partida = db.Partida(nombre="partida con rutas", creador=j1.id_jugador)
+    j1.asociar_a_partida(partida)
+    j1.orden_turno = 1
+    j1.posicion = 2
+    j1.estado_turno = "D"
+    partida.jugador_en_turno = 1
+    respuesta = tirar_dado(j1, partida, con_rutas=True)
+
+    data = respuesta["personal_message"]["data"]
+    assert sorted(data["rutas"]) == list(data["casillas_a_mover"])
+    for destino, ruta in data["rutas"].items():
+        assert ruta[0] == 2 and ruta[-1] == destino
+        assert len(ruta) - 1 <= data["numero_dado"]
 
 
 @pony.db_session
@@ -215,7 +241,7 @@ def test_mover_jugador_no_turno():
     j2.orden_turno = 2
     j1.posicion = 1
     j2.posicion = 2
-    j1.ultima_tirada = numero_dado()
+    j1.ultima_tirada = numero_dado(mi_partida_de_2)
     mi_partida_de_2.jugador_en_turno = 2
     pony.commit()
     respuesta = mover_jugador(j1, 1)
@@ -316,7 +342,6 @@ def test_anunciar_sospecha_vale():
     j1 = db.Jugador(apodo="j1")
     j2 = db.Jugador(apodo="j2")
     j3 = db.Jugador(apodo="j3")
-    carta1 = db.Carta(nombre="carta_prueba_1", tipo="M")
     pony.flush()
     mi_partida_de_2 = db.Partida(nombre="mi_partida", creador=j1.id_jugador)
     j1.asociar_a_partida(mi_partida_de_2)
@@ -328,23 +353,40 @@ def test_anunciar_sospecha_vale():
     j1.posicion = 1
     j2.posicion = 2
     j2.posicion = 3
-    j3.cartas.add(carta1)
+    j3.mano = mascara_cartas(["Dracula"])
     mi_partida_de_2.jugador_en_turno = 1
     pony.commit()
     j1.estado_turno = "SA"
-    respuesta = anunciar_sospecha(j1, "carta_prueba_1", "carta_prueba_2")
+    respuesta = anunciar_sospecha(j1, "Dracula", "Conde")
     assert respuesta["message_to"]["action"] == "muestra"
     assert respuesta["message_to"]["id_jugador"] == j3.id_jugador
     assert j1.estado_turno == "EC"
     assert j3.estado_turno == "MS"
 
 
+@pony.db_session
+def test_anunciar_sospecha_muestra_el_mas_cercano():
+    jugadores = [db.Jugador(apodo=f"j{i}") for i in range(1, 5)]
+    pony.flush()
+    partida = db.Partida(nombre="mi_partida", creador=jugadores[0].id_jugador)
+    for i, jugador in enumerate(jugadores, start=1):
+        jugador.asociar_a_partida(partida)
+        jugador.orden_turno = i
+    # j4 sospecha: j1 tiene el monstruo y j3 la victima, despues de j4 sigue j1
+    jugadores[0].mano = mascara_cartas(["Dracula"])
+    jugadores[2].mano = mascara_cartas(["Conde"])
+    partida.jugador_en_turno = 4
+    jugadores[3].posicion = 1
+    jugadores[3].estado_turno = "SA"
+    respuesta = anunciar_sospecha(jugadores[3], "Dracula", "Conde")
+    assert respuesta["message_to"]["id_jugador"] == jugadores[0].id_jugador
+
+
 @pony.db_session
 def test_anunciar_sospecha_no_turno():
     j1 = db.Jugador(apodo="j1")
     j2 = db.Jugador(apodo="j2")
     j3 = db.Jugador(apodo="j3")
-    carta1 = db.Carta(nombre="carta_prueba_1", tipo="M")
     pony.flush()
     mi_partida_de_2 = db.Partida(nombre="mi_partida", creador=j1.id_jugador)
     j1.asociar_a_partida(mi_partida_de_2)
@@ -356,10 +398,10 @@ def test_anunciar_sospecha_no_turno():
     j1.posicion = 1
     j2.posicion = 2
     j2.posicion = 3
-    j3.cartas.add(carta1)
+    j3.mano = mascara_cartas(["Dracula"])
     mi_partida_de_2.jugador_en_turno = 1
     pony.commit()
-    respuesta = anunciar_sospecha(j2, "carta_prueba_1", "carta_prueba_2")
+    respuesta = anunciar_sospecha(j2, "Dracula", "Conde")
     assert respuesta["personal_message"]["action"] == "error_imp"
     assert respuesta["personal_message"]["data"]["message"] == "No es tu turno"
     assert j2.estado_turno == "N"
@@ -370,7 +412,6 @@ def test_anunciar_sospecha_fail():
     j1 = db.Jugador(apodo="j1")
     j2 = db.Jugador(apodo="j2")
     j3 = db.Jugador(apodo="j3")
-    carta1 = db.Carta(nombre="carta_prueba_1", tipo="M")
     pony.flush()
     mi_partida_de_2 = db.Partida(nombre="mi_partida", creador=j1.id_jugador)
     j1.asociar_a_partida(mi_partida_de_2)
@@ -382,11 +423,11 @@ def test_anunciar_sospecha_fail():
     j1.posicion = 1
     j2.posicion = 2
     j2.posicion = 3
-    j3.cartas.add(carta1)
+    j3.mano = mascara_cartas(["Dracula"])
     mi_partida_de_2.jugador_en_turno = 1
     pony.commit()
     j1.estado_turno = "SA"
-    respuesta = anunciar_sospecha(j1, "carta_prueba_3", "carta_prueba_2")
+    respuesta = anunciar_sospecha(j1, "Momia", "Conde")
     assert j1.estado_turno == "F"
 
 
@@ -395,7 +436,6 @@ def test_responder_sospecha_vale():
     j1 = db.Jugador(apodo="j1")
     j2 = db.Jugador(apodo="j2")
     j3 = db.Jugador(apodo="j3")
-    carta1 = db.Carta(nombre="carta_prueba_1", tipo="M")
     pony.flush()
     mi_partida_de_2 = db.Partida(nombre="mi_partida", creador=j1.id_jugador)
     j1.asociar_a_partida(mi_partida_de_2)
@@ -407,18 +447,15 @@ def test_responder_sospecha_vale():
     j1.posicion = 1
     j2.posicion = 2
     j2.posicion = 3
-    j3.cartas.add(carta1)
+    j3.mano = mascara_cartas(["Dracula"])
     mi_partida_de_2.jugador_en_turno = 1
     j1.estado_turno = "SA"
-    _ = anunciar_sospecha(j1, "carta_prueba_1", "carta_prueba_2")
+    _ = anunciar_sospecha(j1, "Dracula", "Conde")
     pony.commit()
-    respuesta = responder_sospecha(j3, "carta_prueba_1")
+    respuesta = responder_sospecha(j3, "Dracula")
     pony.commit()
     assert respuesta["message_to"]["action"] == "carta_seleccionada"
-    assert (
-        respuesta["message_to"]["data"]["message"]
-        == "El jugador j3 tiene carta_prueba_1"
-    )
+    assert respuesta["message_to"]["data"]["message"] == "El jugador j3 tiene Dracula"
     assert respuesta["message_to"]["id_jugador"] == j1.id_jugador
     assert j1.estado_turno == "F"
 
@@ -428,7 +465,6 @@ def test_responder_sospecha_no_vale():
     j1 = db.Jugador(apodo="j1")
     j2 = db.Jugador(apodo="j2")
     j3 = db.Jugador(apodo="j3")
-    carta1 = db.Carta(nombre="carta_prueba_1", tipo="M")
     pony.flush()
     mi_partida_de_2 = db.Partida(nombre="mi_partida", creador=j1.id_jugador)
     j1.asociar_a_partida(mi_partida_de_2)
@@ -440,13 +476,13 @@ def test_responder_sospecha_no_vale():
     j1.posicion = 1
     j2.posicion = 2
     j2.posicion = 3
-    j3.cartas.add(carta1)
+    j3.mano = mascara_cartas(["Dracula"])
     mi_partida_de_2.jugador_en_turno = 1
     j1.estado_turno = "SA"
-    _ = anunciar_sospecha(j1, "carta_prueba_1", "carta_prueba_2")
+    _ = anunciar_sospecha(j1, "Dracula", "Conde")
     pony.commit()
     assert j3.estado_turno == "MS"
-    respuesta = responder_sospecha(j3, "carta_prueba_2")
+    respuesta = responder_sospecha(j3, "Conde")
     pony.commit()
     assert respuesta["personal_message"]["action"] == "no_carta"
     assert (
@@ -481,3 +517,113 @@ def test_estado_jugadores():
         "estado_turno",
         "en_turno",
     ]
+
+
+def cantidad_consultas():
+    return sum(estadistica.db_count for estadistica in db.local_stats.values())
+
+
+def consultas_lista_estado_jugadores(cantidad_jugadores):
+    with pony.db_session:
+        jugadores = [db.Jugador(apodo=f"j{i}") for i in range(cantidad_jugadores)]
+        pony.flush()
+        partida = db.Partida(
+            nombre="Partida para contar consultas", creador=jugadores[0]
+        )
+        for jugador in jugadores:
+            jugador.asociar_a_partida(partida)
+        iniciar_partida_service(partida)
+        jugadores[0].ganador = True
+    with pony.db_session:
+        partida = db.Partida[partida.id_partida]
+        antes = cantidad_consultas()
+        lista = lista_estado_jugadores(partida)
+        consultas = cantidad_consultas() - antes
+    assert len(lista) == cantidad_jugadores
+    assert all(j["estado_turno"] == "T" for j in lista)
+    return consultas
+
+
+def test_lista_estado_jugadores_consultas_constantes():
+    consultas_de_2 = consultas_lista_estado_jugadores(2)
+    consultas_de_6 = consultas_lista_estado_jugadores(6)
+    assert consultas_de_2 == consultas_de_6
+    assert consultas_de_6 <= 2
+
+
+def siguiente_jugador_original(jugadores, jugador_en_turno, pasar_turno):
+    # el algoritmo anterior a la ronda, cortado en 2n vueltas: si no encontro
+    # a nadie hasta ahi no terminaba nunca
+    t = True
+    i = 0
+
+    def de_orden(orden):
+        return next(filter(lambda j: j.orden_turno == orden, jugadores))
+
+    if all([j.en_trampa for j in jugadores]):
+        if pasar_turno:
+            for j in jugadores:
+                j.en_trampa = False
+        while t:
+            if i > 2 * len(jugadores):
+                return None
+            siguiente = (jugador_en_turno + i) % len(jugadores) + 1
+            jugador_siguiente = de_orden(siguiente)
+            t = jugador_siguiente.acuso
+            i += 1
+        return jugador_siguiente
+    while t:
+        if i > 2 * len(jugadores):
+            return None
+        siguiente = (jugador_en_turno + i) % len(jugadores) + 1
+        jugador_siguiente = de_orden(siguiente)
+        t = jugador_siguiente.acuso or jugador_siguiente.en_trampa
+        if pasar_turno:
+            jugador_siguiente.en_trampa = False
+        i += 1
+    return jugador_siguiente
+
+
+def test_ronda_igual_al_algoritmo_original():
+    for cantidad in range(1, 7):
+        estados = itertools.product([False, True], repeat=2 * cantidad)
+        for estado, en_turno, pasar in itertools.product(
+            estados, range(1, cantidad + 1), [False, True]
+        ):
+            rondas = [
+                [
+                    SimpleNamespace(
+                        orden_turno=i + 1,
+                        acuso=estado[i],
+                        en_trampa=estado[cantidad + i],
+                    )
+                    for i in range(cantidad)
+                ]
+                for _ in range(2)
+            ]
+            esperado = siguiente_jugador_original(rondas[0], en_turno, pasar)
+            obtenido = siguiente_de_ronda(rondas[1], en_turno, pasar)
+            caso = (estado, en_turno, pasar)
+            if esperado is None:
+                assert obtenido is None, caso
+                continue
+            assert obtenido.orden_turno == esperado.orden_turno, caso
+            assert [j.en_trampa for j in rondas[1]] == [
+                j.en_trampa for j in rondas[0]
+            ], caso
+
+
+def test_entrada_valida():
+    from services.acciones import entrada_valida
+
+    assert entrada_valida({"action": "terminar_turno"})
+    assert entrada_valida({"action": "tirar_dado"})
+    assert entrada_valida({"action": "tirar_dado", "data": {"rutas": True}})
+    assert not entrada_valida({"action": "tirar_dado", "data": [1]})
+    assert entrada_valida({"action": "respuesta_sospecha", "data": "Dracula"})
+    assert not entrada_valida({"action": "respuesta_sospecha", "data": {}})
+    assert entrada_valida({"action": "mover_jugador", "data": {"nueva_posicion": 3}})
+    assert not entrada_valida({"action": "mover_jugador", "data": {}})
+    assert not entrada_valida({"action": "pista", "data": None})
+    assert not entrada_valida({"data": {}})
+    assert not entrada_valida("terminar_turno")
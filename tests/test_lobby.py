@@ -1,6 +1,11 @@
 import pony.orm as pony
 from services.start_game import iniciar_partida_service
-from services.lobby import iniciar_partida_lobby, jugador_conectado_lobby, escribir_chat
+from services.lobby import (
+    iniciar_partida_lobby,
+    jugador_conectado_lobby,
+    jugador_desconectado_lobby,
+    escribir_chat,
+)
 from services.board_functions import posiciones_posibles_a_mover
 from models import Partida, Jugador, db
 
@@ -138,3 +143,21 @@ def test_iniciar_partida_lobby_arrancada():
     assert respuesta["message_to"]["data"] == ""
     assert respuesta["system"]["action"] == ""
     assert respuesta["system"]["data"] == ""
+
+
+@pony.db_session
+def test_jugador_desconectado_lobby_con_otras_conexiones():
+    j1 = db.Jugador(apodo="se va")
+    j2 = db.Jugador(apodo="se queda")
+    pony.flush()
+    p1 = db.Partida(nombre="Desconexiones", iniciada=False, creador=j1)
+    j1.partida = p1
+    j2.partida = p1
+
+    # el jugador sigue conectado en otra pestaña: no hay mensaje del sistema
+    respuesta = jugador_desconectado_lobby(j2, p1, 1)
+    assert respuesta["system"]["action"] == ""
+    assert respuesta["to_broadcast"]["data"]["jugadores"] == ["se va"]
+
+    respuesta = jugador_desconectado_lobby(j1, p1, 0)
+    assert respuesta["system"]["action"] == "mensaje_sistema"
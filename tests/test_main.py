@@ -1,3 +1,4 @@
+import json
 import os
 
 if os.path.exists("database.sqlite"):
@@ -15,6 +16,13 @@ from .test_cards import *
 from .test_acusar import *
 from .test_in_game import *
 from .test_lobby import *
+from .test_sockets import *
+from .test_estado import *
+from .test_datos import *
+from .test_memoria import *
+from .test_pistas import *
+from .test_repeticion import *
+from .test_eventos import *
 
 client = TestClient(app)
 
@@ -148,7 +156,7 @@ def test_unirse_a_partida_llena():
 
 @pony.db_session
 def test_asignar_orden():
-    from services.start_game import asignar_orden_aleatorio
+    from services.start_game import iniciar_partida_service
 
     j1 = db.Jugador(apodo="juan")
     j2 = db.Jugador(apodo="maria")
@@ -158,9 +166,153 @@ def test_asignar_orden():
     j1.partida = p1
     j2.partida = p1
     j3.partida = p1
-    asignar_orden_aleatorio(p1)
+    iniciar_partida_service(p1)
     pony.commit()
 
     n = len(p1.jugadores)
     ordenes = [j.orden_turno for j in p1.jugadores]
     assert set(range(1, n + 1)) == set(ordenes)
+
+
+def test_tablero_endpoint_con_etag():
+    import base64
+
+    response = client.get("/tableros/clasico")
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "no-cache"
+    tablero = response.json()
+    assert etag == f'"{tablero["hash"]}"'
+    cantidad = tablero["cantidad_casillas"]
+    distancias = base64.b64decode(tablero["distancias"])
+    assert len(distancias) == cantidad * cantidad
+    # desde la 83 con un 1 se llega a la 81 y no a la 82
+    assert distancias[83 * cantidad + 81] <= 1 < distancias[83 * cantidad + 82]
+    assert tablero["trampas"] == [22, 29, 56, 63]
+
+    response = client.get("/tableros/clasico", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    response = client.get("/tableros/clasico", headers={"If-None-Match": '"otro"'})
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_tablero_endpoint_inmutable():
+    hash_tablero = client.get("/tableros/clasico").json()["hash"]
+    response = client.get(f"/tableros/clasico/{hash_tablero}")
+    assert response.status_code == status.HTTP_200_OK
+    assert "immutable" in response.headers["cache-control"]
+    assert client.get("/tableros/clasico/viejo").status_code == 404
+    assert client.get("/tableros/no_existe").status_code == 404
+
+
+def test_alcanzables_endpoint():
+    creada = client.post(
+        "/partidas/",
+        json={"nombre_partida": "espectada", "apodo": "observado"},
+    ).json()
+    with pony.db_session:
+        db.Jugador[creada["id_jugador"]].posicion = 2
+    response = client.get(f"/partidas/{creada['id_partida']}/alcanzables")
+    assert response.status_code == status.HTTP_200_OK
+    jugador = response.json()["jugadores"][0]
+    assert jugador["id_jugador"] == creada["id_jugador"]
+    assert jugador["alcanzables"]["1"] == [2, 6]
+    assert list(jugador["alcanzables"]) == ["1", "2", "3", "4", "5", "6"]
+    assert client.get("/partidas/0/alcanzables").status_code == 500
+
+
+def test_eventos_endpoint():
+    id_partida = crear_partida_iniciada(2)
+    registros = [
+        (id_partida, "evento", numero, json.dumps([1, {"action": "a"}, None, None]))
+        for numero in range(1, 6)
+    ]
+    with pony.db_session:
+        guardar_volcados([], registros)
+    response = client.get(f"/partidas/{id_partida}/eventos")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lineas = [json.loads(linea) for linea in response.text.splitlines()]
+    assert [linea[0] for linea in lineas] == [1, 2, 3, 4, 5]
+    assert lineas[0][1:] == [1, "a", None, None]
+    response = client.get(f"/partidas/{id_partida}/eventos?desde=2&limite=2")
+    assert [json.loads(l)[0] for l in response.text.splitlines()] == [3, 4]
+    assert client.get("/partidas/0/eventos").status_code == 500
+
+
+def test_desconectar_en_un_lote_que_falla():
+    from fastapi import HTTPException
+
+    from datos import escribir_db
+    from main import crear_partida_nueva, unir_jugador
+    from services.acciones import desconectar_jugador
+
+    llena = client.post(
+        "/partidas/", json={"nombre_partida": "llena", "apodo": "j0"}
+    ).json()
+    for i in range(1, 6):
+        client.put(
+            "/partidas/", json={"id_partida": llena["id_partida"], "apodo": f"j{i}"}
+        )
+    sale = client.post(
+        "/partidas/", json={"nombre_partida": "lobby", "apodo": "sale"}
+    ).json()
+
+    async def escenario():
+        # las tres entran en el mismo lote del escritor y la ultima falla
+        return await asyncio.gather(
+            escribir_db(crear_partida_nueva, "nueva en lote", "ana en lote"),
+            escribir_db(desconectar_jugador, sale["id_jugador"], 0),
+            escribir_db(unir_jugador, llena["id_partida"], "no entra"),
+            return_exceptions=True,
+        )
+
+    creada, desconexion, error = asyncio.run(escenario())
+    assert creada.apodo == "ana en lote"
+    assert desconexion["to_broadcast"]["action"] == "jugador_desconectado_lobby"
+    assert isinstance(error, HTTPException)
+    with pony.db_session:
+        assert pony.count(p for p in db.Partida if p.nombre == "nueva en lote") == 1
+        assert pony.count(j for j in db.Jugador if j.apodo == "ana en lote") == 1
+        assert db.Jugador[sale["id_jugador"]].partida is None
+
+
+def test_mensajes_mal_armados_no_cortan_el_socket():
+    from main import manager
+
+    creada = client.post(
+        "/partidas/", json={"nombre_partida": "mal armados", "apodo": "ruidoso"}
+    ).json()
+    with client.websocket_connect(f"/ws/{creada['id_jugador']}") as websocket:
+        assert websocket.receive_json()["action"] == "nuevo_jugador"
+        for mensaje in (
+            {"action": "escribe_chat"},
+            {"action": "respuesta_sospecha", "data": ["Dracula"]},
+            {"action": "sospechan", "data": {"carta_monstruo": ["Dracula"]}},
+            ["no", "es", "un", "dict"],
+        ):
+            websocket.send_json(mensaje)
+            assert websocket.receive_json()["action"] == "error_imp"
+        websocket.send_text("{no es json")
+        assert websocket.receive_json()["action"] == "error_imp"
+        websocket.send_json({"action": "escribe_chat", "data": {"message": "sigo"}})
+        assert websocket.receive_json()["action"] == "escribio_chat"
+    assert manager.websockets_de_partida(creada["id_partida"]) == []
+    with pony.db_session:
+        assert db.Jugador[creada["id_jugador"]].partida is None
+
+
+def test_estado_jugadores_con_data_que_no_es_dict():
+    creada = client.post(
+        "/partidas/", json={"nombre_partida": "data rara", "apodo": "curioso"}
+    ).json()
+    with client.websocket_connect(f"/ws/{creada['id_jugador']}") as websocket:
+        websocket.receive_json()
+        for data in (["version", 3], "3", 3):
+            websocket.send_json({"action": "estado_jugadores", "data": data})
+            respuesta = websocket.receive_json()
+            assert respuesta["action"] == "estado_jugadores"
+            assert respuesta["data"]["lista_jugadores"][0]["apodo"] == "curioso"
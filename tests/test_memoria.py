@@ -0,0 +1,224 @@
+import asyncio
+
+import pony.orm as pony
+
+from board.board import nombres_cartas
+from models import db
+from services.acciones import procesar_entrada_en_memoria
+from services.in_game import pasar_turno, tirar_dado, mover_jugador
+from services.memoria import (
+    MotorPartidas,
+    Persistidor,
+    cargar_partida,
+    guardar_volcados,
+)
+from services.start_game import iniciar_partida_service
+
+
+def crear_partida_iniciada(cantidad_jugadores):
+    with pony.db_session:
+        jugadores = [db.Jugador(apodo=f"j{i}") for i in range(cantidad_jugadores)]
+        pony.flush()
+        partida = db.Partida(nombre="Partida en memoria", creador=jugadores[0])
+        for jugador in jugadores:
+            jugador.asociar_a_partida(partida)
+        iniciar_partida_service(partida)
+    return partida.id_partida
+
+
+def jugador_en_turno(partida):
+    return next(
+        j for j in partida.jugadores if j.orden_turno == partida.jugador_en_turno
+    )
+
+
+def test_cargar_partida():
+    id_partida = crear_partida_iniciada(3)
+    with pony.db_session:
+        en_memoria = cargar_partida(id_partida)
+        partida = db.Partida[id_partida]
+
+        assert en_memoria.cantidad_jugadores() == 3
+        assert en_memoria.jugador_en_turno == partida.jugador_en_turno
+        assert en_memoria.mascara_sobre == partida.mascara_sobre
+        for jugador in en_memoria.jugadores:
+            original = db.Jugador[jugador.id_jugador]
+            assert jugador.partida is en_memoria
+            assert jugador.posicion == original.posicion
+            assert jugador.estado_turno == original.estado_turno
+            assert jugador.mano == original.mano
+            for nombre in nombres_cartas(jugador.mano):
+                assert en_memoria.duenios_cartas()[nombre] is jugador
+        assert [j.orden_turno for j in en_memoria.jugadores] == [1, 2, 3]
+
+
+def test_cargar_partida_sin_iniciar():
+    with pony.db_session:
+        jugador = db.Jugador(apodo="solo")
+        pony.flush()
+        partida = db.Partida(nombre="Partida en el lobby", creador=jugador)
+        jugador.asociar_a_partida(partida)
+    with pony.db_session:
+        assert cargar_partida(partida.id_partida) is None
+
+
+def test_reglas_sobre_la_memoria_y_volcado():
+    id_partida = crear_partida_iniciada(2)
+    with pony.db_session:
+        partida = cargar_partida(id_partida)
+    jugador = jugador_en_turno(partida)
+
+    respuesta = tirar_dado(jugador, partida)
+    assert respuesta["personal_message"]["action"] == "tire_dado"
+    destino = respuesta["personal_message"]["data"]["casillas_a_mover"][-1]
+    mover_jugador(jugador, destino)
+    jugador.estado_turno = "F"
+    pasar_turno(jugador, partida)
+    assert jugador.posicion == destino
+    assert partida.jugador_en_turno != jugador.orden_turno
+
+    with pony.db_session:
+        assert db.Jugador[jugador.id_jugador].estado_turno == "D"
+    with pony.db_session:
+        guardar_volcados([partida.volcar()])
+    with pony.db_session:
+        guardado = db.Jugador[jugador.id_jugador]
+        assert guardado.posicion == destino
+        assert guardado.estado_turno == "N"
+        assert db.Partida[id_partida].jugador_en_turno == partida.jugador_en_turno
+
+
+def test_motor_y_persistidor():
+    id_partida = crear_partida_iniciada(3)
+
+    async def escenario():
+        motor = MotorPartidas(Persistidor(intervalo=0.01))
+        partida = await motor.obtener(id_partida)
+        assert await motor.obtener(id_partida) is partida
+        jugador = jugador_en_turno(partida)
+        respuesta, lista = procesar_entrada_en_memoria(
+            partida, jugador.id_jugador, {"action": "tirar_dado", "data": {}}
+        )
+        motor.jugada(partida)
+        assert respuesta["personal_message"]["action"] == "tire_dado"
+        assert lista is not None
+        motor.descargar(id_partida)
+        recargada = await motor.obtener(id_partida)
+        return jugador, recargada
+
+    jugador, recargada = asyncio.run(escenario())
+    assert recargada.jugador(jugador.id_jugador).estado_turno == "M"
+    assert recargada.jugador(jugador.id_jugador).ultima_tirada == jugador.ultima_tirada
+    with pony.db_session:
+        assert db.Jugador[jugador.id_jugador].estado_turno == "M"
+
+
+def test_persistidor_junta_escrituras():
+    ids = [crear_partida_iniciada(2) for _ in range(3)]
+    lotes = []
+
+    async def escenario():
+        persistidor = Persistidor(intervalo=0.01)
+        original = persistidor._escribir_pendientes
+
+        async def contar_lote():
+            lotes.append(len(persistidor.pendientes))
+            await original()
+
+        persistidor._escribir_pendientes = contar_lote
+        motor = MotorPartidas(persistidor)
+        partidas = [await motor.obtener(id_partida) for id_partida in ids]
+        for partida in partidas:
+            for _ in range(5):
+                partida.jugador_en_turno = partida.jugador_en_turno % 2 + 1
+                motor.jugada(partida)
+        await persistidor.sincronizar()
+        return [motor.partidas[i].jugador_en_turno for i in ids]
+
+    en_turno = asyncio.run(escenario())
+    assert lotes == [3]
+    with pony.db_session:
+        assert [db.Partida[i].jugador_en_turno for i in ids] == en_turno
+
+
+def test_sincronizar_no_espera_a_las_otras_partidas():
+    jugando, otra = crear_partida_iniciada(2), crear_partida_iniciada(2)
+
+    async def escenario():
+        motor = MotorPartidas(Persistidor(intervalo=0.001))
+        partida = await motor.obtener(jugando)
+        seguir = True
+
+        async def jugar():
+            while seguir:
+                partida.jugador_en_turno = partida.jugador_en_turno % 2 + 1
+                motor.jugada(partida)
+                await asyncio.sleep(0.002)
+
+        tarea = asyncio.ensure_future(jugar())
+        await asyncio.sleep(0.05)
+        try:
+            return await asyncio.wait_for(motor.obtener(otra), 2)
+        finally:
+            seguir = False
+            await tarea
+            await motor.persistidor.sincronizar()
+
+    assert asyncio.run(escenario()).id_partida == otra
+
+
+def test_partida_en_el_lobby_no_se_vuelve_a_leer(monkeypatch):
+    import services.memoria as memoria
+
+    with pony.db_session:
+        jugador = db.Jugador(apodo="espera")
+        pony.flush()
+        partida = db.Partida(nombre="Lobby del motor", creador=jugador)
+        jugador.asociar_a_partida(partida)
+    id_partida = partida.id_partida
+    lecturas = []
+
+    def contar_carga(id_partida):
+        lecturas.append(id_partida)
+        return cargar_partida(id_partida)
+
+    monkeypatch.setattr(memoria, "cargar_partida", contar_carga)
+
+    async def escenario():
+        motor = MotorPartidas(Persistidor())
+        assert await motor.obtener(id_partida) is None
+        assert await motor.obtener(id_partida) is None
+        assert len(lecturas) == 1
+        with pony.db_session:
+            db.Jugador(apodo="llega").asociar_a_partida(db.Partida[id_partida])
+            iniciar_partida_service(db.Partida[id_partida])
+        motor.iniciada(id_partida)
+        return await motor.obtener(id_partida)
+
+    assert asyncio.run(escenario()).cantidad_jugadores() == 2
+    assert len(lecturas) == 2
+
+
+def test_pasar_turno_con_todos_acusados():
+    # la ronda no tiene a quien darle el turno: queda en el mismo jugador
+    id_partida = crear_partida_iniciada(3)
+    with pony.db_session:
+        partida = db.Partida[id_partida]
+        for jugador in partida.jugadores:
+            jugador.acuso = True
+        en_memoria = cargar_partida(id_partida)
+        en_turno = partida.jugador_en_turno
+        assert partida.siguiente_jugador(pasar_turno=True) is None
+        partida.pasar_turno()
+        assert partida.jugador_en_turno == en_turno
+        pony.rollback()
+
+    en_memoria.pasar_turno()
+    assert en_memoria.jugador_en_turno == en_turno
+    jugador = jugador_en_turno(en_memoria)
+    jugador.estado_turno = "F"
+    respuesta = pasar_turno(jugador, en_memoria)
+    assert respuesta["system"]["action"] == "mensaje_sistema"
+    assert respuesta["message_to"]["id_jugador"] == -1
+    assert jugador.estado_turno == "N"
+    assert en_memoria.jugador_en_turno == en_turno
@@ -0,0 +1,51 @@
+import numpy as np
+import pony.orm as pony
+
+from board.board import cargar_tablero
+from models import db
+from services.board_functions import casillas_posibles
+from services.pistas import MAX_TURNOS_PISTA, pista, probabilidades_de
+
+
+def test_probabilidades_un_turno():
+    tablero = cargar_tablero()
+    probabilidades = probabilidades_de(tablero.nombre, tablero.hash)
+    recintos = sorted(tablero.recintos)
+    for posicion in range(len(tablero.distancias)):
+        if posicion in tablero.trampas or posicion in tablero.recintos:
+            continue
+        for i, recinto in enumerate(recintos):
+            caras = [
+                dado
+                for dado in range(1, 7)
+                if recinto in casillas_posibles(posicion, dado)
+            ]
+            assert probabilidades[1, posicion, i] == len(caras) / 6
+
+
+def test_probabilidades_crecen_con_los_turnos():
+    tablero = cargar_tablero()
+    probabilidades = probabilidades_de(tablero.nombre, tablero.hash)
+    assert probabilidades.shape[0] == MAX_TURNOS_PISTA + 1
+    assert (probabilidades >= 0).all() and (probabilidades <= 1).all()
+    assert (np.diff(probabilidades, axis=0) >= 0).all()
+    for i, recinto in enumerate(sorted(tablero.recintos)):
+        assert (probabilidades[:, recinto, i] == 1).all()
+
+
+@pony.db_session
+def test_pista():
+    jugador = db.Jugador(apodo="pistero")
+    pony.flush()
+    partida = db.Partida(nombre="partida_pista", creador=jugador.id_jugador)
+    jugador.asociar_a_partida(partida)
+    jugador.posicion = 2
+
+    respuesta = pista(jugador, 1)["personal_message"]
+    assert respuesta["action"] == "pista"
+    assert respuesta["data"]["turnos"] == 1
+    assert respuesta["data"]["recintos"]["Cochera"] == round(4 / 6, 4)
+    assert set(respuesta["data"]["recintos"]) == set(cargar_tablero().recintos.values())
+
+    for turnos in (0, MAX_TURNOS_PISTA + 1, "3"):
+        assert pista(jugador, turnos)["personal_message"]["action"] == "error_imp"
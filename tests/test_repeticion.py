@@ -0,0 +1,85 @@
+import random
+
+import pony.orm as pony
+
+from board.board import nombres_cartas
+from models import db
+from services.acciones import procesar_entrada_en_memoria
+from services.board_functions import casillas_posibles
+from services.memoria import cargar_partida
+from services.repeticion import CONECTAR, partida_inicial, reproducir
+from services.start_game import iniciar_partida_service
+
+
+def siguiente_accion(partida, azar):
+    # un jugador que hace cualquier jugada valida, para generar partidas
+    jugador = next(
+        j for j in partida.jugadores if j.orden_turno == partida.jugador_en_turno
+    )
+    if jugador.estado_turno == "D":
+        return jugador.id_jugador, {"action": "tirar_dado", "data": {}}
+    if jugador.estado_turno == "M":
+        destinos = casillas_posibles(
+            jugador.posicion, jugador.ultima_tirada, partida.tablero
+        )
+        return jugador.id_jugador, {
+            "action": "mover_jugador",
+            "data": {"nueva_posicion": azar.choice(destinos)},
+        }
+    if jugador.estado_turno == "SA" and azar.random() < 0.5:
+        return jugador.id_jugador, {
+            "action": "sospechan",
+            "data": {"carta_monstruo": "Dracula", "carta_victima": "Conde"},
+        }
+    if jugador.estado_turno == "EC":
+        muestra = next(j for j in partida.jugadores if j.estado_turno == "MS")
+        cartas = nombres_cartas(muestra.mano)
+        return muestra.id_jugador, {
+            "action": "respuesta_sospecha",
+            "data": azar.choice(cartas),
+        }
+    return jugador.id_jugador, {"action": "terminar_turno", "data": {}}
+
+
+def test_repeticion_igual_a_la_partida():
+    with pony.db_session:
+        jugadores = [db.Jugador(apodo=f"j{i}") for i in range(4)]
+        pony.flush()
+        partida = db.Partida(nombre="Partida grabada", creador=jugadores[0])
+        for jugador in jugadores:
+            jugador.asociar_a_partida(partida)
+        iniciar_partida_service(partida, semilla=1234)
+        pony.flush()
+        id_partida = partida.id_partida
+        cabecera = [(j.id_jugador, j.apodo) for j in jugadores]
+    with pony.db_session:
+        en_juego = cargar_partida(id_partida)
+
+    # se juega y se graba lo que llega por el websocket
+    azar = random.Random(0)
+    acciones = [(id_jugador, {"action": CONECTAR}) for id_jugador, _ in cabecera]
+    respuestas = reproducir(en_juego, acciones)
+    for _ in range(300):
+        id_jugador, entrada = siguiente_accion(en_juego, azar)
+        respuestas.append(procesar_entrada_en_memoria(en_juego, id_jugador, entrada))
+        acciones.append((id_jugador, entrada))
+    assert any(j.posicion not in (None, 2) for j in en_juego.jugadores)
+
+    repetida = partida_inicial(id_partida, 1234, cabecera)
+    assert reproducir(repetida, acciones) == respuestas
+    assert repetida.volcar() == en_juego.volcar()
+    assert repetida.mascara_sobre == en_juego.mascara_sobre
+
+
+def test_misma_semilla_misma_partida():
+    cabecera = [(1, "a"), (2, "b"), (3, "c")]
+    primera, segunda, otra = (
+        partida_inicial(1, semilla, cabecera) for semilla in (5, 5, 6)
+    )
+    # jugadores queda ordenado por orden_turno, el primero tira el dado
+    acciones = [(primera.jugadores[0].id_jugador, {"action": "tirar_dado", "data": {}})]
+    respuestas = reproducir(primera, acciones)
+    assert respuestas[0][0]["personal_message"]["action"] == "tire_dado"
+    assert reproducir(segunda, acciones) == respuestas
+    assert primera.volcar() == segunda.volcar()
+    assert [j.mano for j in primera.jugadores] != [j.mano for j in otra.jugadores]
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import time
+
+import my_json
+from my_sockets import ConnectionManager
+
+
+class WebSocketFalso:
+    def __init__(self):
+        self.aceptado = False
+        self.cerrado = False
+        self.recibidos = []
+
+    async def accept(self):
+        self.aceptado = True
+
+    async def close(self):
+        self.cerrado = True
+
+    async def send_text(self, texto):
+        self.recibidos.append(json.loads(texto))
+
+
+class WebSocketLento(WebSocketFalso):
+    def __init__(self, demora):
+        super().__init__()
+        self.demora = demora
+
+    async def send_text(self, texto):
+        await asyncio.sleep(self.demora)
+        await super().send_text(texto)
+
+
+class WebSocketRoto(WebSocketFalso):
+    async def send_text(self, texto):
+        raise RuntimeError("conexion cerrada")
+
+
+class WebSocketQueDesconecta(WebSocketFalso):
+    def __init__(self, manager, a_desconectar):
+        super().__init__()
+        self.manager = manager
+        self.a_desconectar = a_desconectar
+
+    async def send_text(self, texto):
+        self.manager.disconnect(self.a_desconectar)
+        await super().send_text(texto)
+
+
+def test_conectar_y_desconectar():
+    manager = ConnectionManager()
+    ws1 = WebSocketFalso()
+    ws2 = WebSocketFalso()
+    asyncio.run(manager.connect(1, 10, ws1))
+    asyncio.run(manager.connect(2, 10, ws2))
+
+    assert ws1.aceptado and ws2.aceptado
+    assert manager.websockets_de_partida(10) == [ws1, ws2]
+    manager.disconnect(ws1)
+    manager.disconnect(ws1)
+    assert manager.websockets_de_partida(10) == [ws2]
+    assert manager.count_id_jugador_websockets(1) == 0
+    manager.disconnect(ws2)
+    assert manager.conexiones == {}
+    assert manager.conexiones_partida == {}
+    assert manager.conexiones_jugador == {}
+
+
+def test_varias_pestanias_mismo_jugador():
+    manager = ConnectionManager()
+    pestania1 = WebSocketFalso()
+    pestania2 = WebSocketFalso()
+    otro = WebSocketFalso()
+    asyncio.run(manager.connect(1, 10, pestania1))
+    asyncio.run(manager.connect(1, 10, pestania2))
+    asyncio.run(manager.connect(2, 10, otro))
+
+    assert manager.count_id_jugador_websockets(1) == 2
+    asyncio.run(manager.send_message_to("muestra", {}, 1))
+    assert pestania1.recibidos == [{"action": "muestra", "data": {}}]
+    assert pestania2.recibidos == [{"action": "muestra", "data": {}}]
+    assert otro.recibidos == []
+
+    manager.disconnect(pestania1)
+    assert manager.count_id_jugador_websockets(1) == 1
+    asyncio.run(manager.broadcast("escribio_chat", {"message": "hola"}, 10))
+    assert len(pestania1.recibidos) == 1
+    assert len(pestania2.recibidos) == 2
+    assert len(otro.recibidos) == 1
+
+
+def test_broadcast_solo_a_la_partida():
+    manager = ConnectionManager()
+    ws1 = WebSocketFalso()
+    ws2 = WebSocketFalso()
+    asyncio.run(manager.connect(1, 10, ws1))
+    asyncio.run(manager.connect(2, 20, ws2))
+
+    asyncio.run(manager.broadcast_system("mensaje_sistema", {"message": "m"}, 10))
+    asyncio.run(manager.broadcast("accion", "", 10))
+    assert ws1.recibidos == [{"action": "mensaje_sistema", "data": {"message": "m"}}]
+    assert ws2.recibidos == []
+
+
+def test_desconexion_durante_broadcast():
+    manager = ConnectionManager()
+    desconectado = WebSocketFalso()
+    primero = WebSocketQueDesconecta(manager, desconectado)
+    ultimo = WebSocketFalso()
+    asyncio.run(manager.connect(1, 10, primero))
+    asyncio.run(manager.connect(2, 10, desconectado))
+    asyncio.run(manager.connect(3, 10, ultimo))
+
+    asyncio.run(manager.broadcast("accion", {}, 10))
+    assert len(primero.recibidos) == 1
+    assert desconectado.recibidos == []
+    assert len(ultimo.recibidos) == 1
+    assert manager.websockets_de_partida(10) == [primero, ultimo]
+
+
+def test_broadcast_concurrente():
+    async def escenario():
+        manager = ConnectionManager()
+        lentos = [WebSocketLento(0.2) for _ in range(5)]
+        for i, ws in enumerate(lentos):
+            await manager.connect(i, 10, ws)
+        inicio = time.monotonic()
+        await manager.broadcast("accion", {}, 10)
+        return time.monotonic() - inicio, lentos
+
+    duracion, lentos = asyncio.run(escenario())
+    assert duracion < 0.6
+    assert all(len(ws.recibidos) == 1 for ws in lentos)
+
+
+def test_expulsa_clientes_lentos_y_rotos():
+    async def escenario():
+        manager = ConnectionManager(tiempo_maximo_envio=0.05)
+        sano = WebSocketFalso()
+        lento = WebSocketLento(10)
+        roto = WebSocketRoto()
+        await manager.connect(1, 10, sano)
+        await manager.connect(2, 10, lento)
+        await manager.connect(3, 10, roto)
+        inicio = time.monotonic()
+        await manager.broadcast("accion", {}, 10)
+        duracion = time.monotonic() - inicio
+        await asyncio.gather(*manager.cierres_pendientes)
+        return manager, duracion, sano, lento, roto
+
+    manager, duracion, sano, lento, roto = asyncio.run(escenario())
+    assert duracion < 1
+    assert sano.recibidos == [{"action": "accion", "data": {}}]
+    assert manager.websockets_de_partida(10) == [sano]
+    assert manager.count_id_jugador_websockets(2) == 0
+    assert manager.count_id_jugador_websockets(3) == 0
+    assert lento.cerrado and roto.cerrado
+
+
+def test_broadcast_codifica_una_sola_vez():
+    codificados = []
+
+    def codificador_contador(contenido):
+        codificados.append(contenido)
+        return my_json.dumps_json(contenido)
+
+    manager = ConnectionManager()
+    sockets = [WebSocketFalso() for _ in range(6)]
+    for i, ws in enumerate(sockets):
+        asyncio.run(manager.connect(i, 10, ws))
+
+    anterior = my_json.dumps
+    my_json.usar_codificador(codificador_contador)
+    try:
+        asyncio.run(manager.broadcast("estado_jugadores", {"lista": [1, 2]}, 10))
+    finally:
+        my_json.usar_codificador(anterior)
+
+    assert len(codificados) == 1
+    assert all(
+        ws.recibidos == [{"action": "estado_jugadores", "data": {"lista": [1, 2]}}]
+        for ws in sockets
+    )
+
+
+def test_mensaje_y_respuesta_http_usan_el_mismo_codificador():
+    mensaje = my_json.Mensaje("mensaje_sistema", {"message": "Drácula"})
+    respuesta = my_json.RespuestaJSON({"message": "Drácula"})
+
+    assert json.loads(mensaje.texto) == {
+        "action": "mensaje_sistema",
+        "data": {"message": "Drácula"},
+    }
+    assert json.loads(respuesta.body) == {"message": "Drácula"}